@@ -1,8 +1,14 @@
 from flask import Flask
 from flask_jwt_extended import JWTManager
 from neo4j import GraphDatabase
+from app.uploads import max_content_length
+from app.utils import start_extract_pool
 
 app = Flask(__name__)
+# Larger requests are refused with 413 before they are read
+app.config['MAX_CONTENT_LENGTH'] = max_content_length()
+# PDF extraction processes are forked before the app starts any threads
+start_extract_pool()
 
 # Neo4j connection
 # driver = GraphDatabase.driver("bolt://localhost:7687", auth=("neo4j", "password"))
@@ -0,0 +1,238 @@
+"""
+Cache for LLM analysis results, so re-analyzing the same document with the same blueprint doesn't call the model again.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+import app.utils as utils
+
+load_dotenv()
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 86400 # seconds
+DEFAULT_PARTIAL_TTL = 30 * 86400 # seconds, chunk partials are reused when a revised document is analyzed weeks later
+DEFAULT_DISK_MAX_BYTES = 512 * 1024 * 1024 # disk tier size, least recently used entries are removed over this
+DISK_SWEEP_INTERVAL = 60 # seconds between disk tier size checks
+
+
+class AnalysisCache():
+    """
+    Two tier cache for analysis results. Entries are keyed by key() of everything that affects the result.
+
+    Memory tier is an LRU with max size and TTL. Optional disk tier (one JSON file per entry) survives
+    restarts and is shared between processes using the same directory, least recently used entries are removed
+    when it grows over max bytes. Only strings are cached.
+    Partial analyses of chunks have a longer TTL, so they can be reused for later revisions of a document.
+    That needs the disk tier, the memory tier holds only the most recent entries and is lost on restart.
+    """
+    def __init__(self, max_entries: int = None, ttl: float = None, disk_dir: str = None, partial_ttl: float = None,
+                 disk_max_bytes: int = None):
+        """
+        Args:
+            max_entries (int, optional): Max entries in memory. Defaults to ANALYSIS_CACHE_SIZE env or DEFAULT_MAX_ENTRIES.
+                0 disables the memory tier.
+            ttl (float, optional): Seconds an entry is valid. Defaults to ANALYSIS_CACHE_TTL env or DEFAULT_TTL.
+            disk_dir (string, optional): Directory for the disk tier. Defaults to ANALYSIS_CACHE_DIR env, disabled if empty or not set.
+            partial_ttl (float, optional): Seconds a partial analysis is valid.
+                Defaults to ANALYSIS_CACHE_PARTIAL_TTL env or DEFAULT_PARTIAL_TTL.
+            disk_max_bytes (int, optional): Max total size of the disk tier, 0 for no limit.
+                Defaults to ANALYSIS_CACHE_MAX_BYTES env or DEFAULT_DISK_MAX_BYTES.
+        """
+        self.__max_entries = max_entries if max_entries != None else int(os.getenv('ANALYSIS_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+        self.__ttl = ttl if ttl != None else float(os.getenv('ANALYSIS_CACHE_TTL', DEFAULT_TTL))
+        self.__partial_ttl = partial_ttl if partial_ttl != None else float(os.getenv('ANALYSIS_CACHE_PARTIAL_TTL', DEFAULT_PARTIAL_TTL))
+        # empty string disables the disk tier
+        self.__disk_dir = (disk_dir if disk_dir != None else os.getenv('ANALYSIS_CACHE_DIR')) or None
+        self.__disk_max_bytes = disk_max_bytes if disk_max_bytes != None else int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', DEFAULT_DISK_MAX_BYTES))
+        self.__last_sweep = 0
+
+        self.__entries = OrderedDict() # key -> (value, expires)
+        self.__lock = threading.Lock()
+        self.__stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+
+        if self.__disk_dir != None:
+            os.makedirs(self.__disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, instructions: str, questions: list, text: str) -> str:
+        """
+        Content address for an analysis.
+
+        Args:
+            model (string): Model used for the analysis.
+            instructions (string): System instructions sent to the model.
+            questions (list[string]): Blueprint questions, None if no blueprint.
+            text (string): Analyzed text.
+
+        Returns:
+            string: sha256 hex digest.
+        """
+        payload = json.dumps([model, instructions, questions, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str:
+        """
+        Get a cached result. Disk hits are promoted to memory.
+
+        Args:
+            key (string): Key from key().
+
+        Returns:
+            string or None:
+                - string containing the cached result.
+                - None if not cached or expired.
+        """
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry != None:
+                value, expires = entry
+                if expires > now:
+                    self.__entries.move_to_end(key)
+                    self.__stats['hits'] += 1
+                    self.__stats['memory_hits'] += 1
+                    return value
+                del self.__entries[key]
+
+        value, expires = self.__disk_get(key, now)
+        with self.__lock:
+            if value == None:
+                self.__stats['misses'] += 1
+                return None
+            self.__stats['hits'] += 1
+            self.__stats['disk_hits'] += 1
+            self.__memory_put(key, value, expires)
+        return value
+
+    def put(self, key: str, value: str, partial: bool = False):
+        """
+        Cache a result. Non-string values (None, error dicts) are not cached.
+
+        Args:
+            key (string): Key from key().
+            value (string): Analysis result.
+            partial (bool, optional): The result is a partial analysis of a chunk, kept for partial_ttl. Defaults to False.
+        """
+        if not isinstance(value, str):
+            return
+
+        expires = time.time() + (self.__partial_ttl if partial else self.__ttl)
+        with self.__lock:
+            self.__memory_put(key, value, expires)
+        self.__disk_put(key, value, expires)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: hits, memory_hits, disk_hits, misses, evictions, disk_evictions, entries (in memory) and hit_rate.
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['entries'] = len(self.__entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        """
+        Remove all entries from both tiers and reset counters.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            for name in self.__stats:
+                self.__stats[name] = 0
+        if self.__disk_dir != None:
+            for root, dirs, files in os.walk(self.__disk_dir):
+                for filename in files:
+                    if filename.endswith('.json'):
+                        try:
+                            os.remove(os.path.join(root, filename))
+                        except OSError:
+                            pass
+
+    def __memory_put(self, key, value, expires):
+        """
+        Insert into memory tier and evict least recently used entries over max_entries. Lock must be held.
+        """
+        if self.__max_entries <= 0:
+            return
+        self.__entries[key] = (value, expires)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+            self.__stats['evictions'] += 1
+
+    def __disk_path(self, key):
+        return os.path.join(self.__disk_dir, key[:2], key + '.json')
+
+    def __disk_get(self, key, now):
+        """
+        Read from disk tier. Expired and unreadable entries are removed, hits are marked as recently used.
+
+        Returns:
+            tuple[string, float]: (value, expires), (None, None) if not found.
+        """
+        if self.__disk_dir == None:
+            return None, None
+        path = self.__disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            if entry['expires'] > now:
+                os.utime(path)
+                return entry['value'], entry['expires']
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError, KeyError):
+            pass
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None, None
+
+    def __disk_put(self, key, value, expires):
+        """
+        Write to disk tier. Written to a temporary file first, so readers never see a partial entry.
+        """
+        if self.__disk_dir == None:
+            return
+        path = self.__disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump({'value': value, 'expires': expires}, file, ensure_ascii=False)
+                os.replace(temp_path, path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError as e:
+            # disk tier is best effort, memory tier still has the entry
+            print(f"Analysis cache disk write failed: {e}")
+            return
+        self.__sweep_if_due()
+
+    def __sweep_if_due(self):
+        """
+        Remove least recently used disk entries over disk_max_bytes, at most every DISK_SWEEP_INTERVAL seconds.
+        """
+        if self.__disk_max_bytes <= 0:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            if self.__last_sweep and now - self.__last_sweep < DISK_SWEEP_INTERVAL:
+                return
+            self.__last_sweep = now
+        removed = utils.evict_lru(self.__disk_dir, self.__disk_max_bytes, recursive=True)
+        with self.__lock:
+            self.__stats['disk_evictions'] += removed
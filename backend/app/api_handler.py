@@ -1,195 +1,568 @@
-import json
 import os
 from dotenv import load_dotenv
-import openai
 from openai import OpenAI
 import app.utils as utils
-import requests
-import re
+import app.chunking as chunking
+import app.prompts as prompts
+from app.analysis_cache import AnalysisCache
+from app.ollama_client import OllamaClient
+from app.uploads import TextCache
+import app.rate_limiter as rate_limiter
+from app.rate_limiter import RateLimitScheduler
+from app.model_router import ModelRouter, ProviderError
+import itertools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 PRIMARY_MODEL = "gpt-4o"
 BACKUP_MODEL = "gpt-4o-mini" # This has higher token limit
 LOCAL_MODEL = "mistral"
+DEFAULT_CHUNK_CONCURRENCY = 4 # Chunks of one long document analyzed at the same time, CHUNK_CONCURRENCY env overrides
+DEFAULT_BATCH_CONCURRENCY = 4 # Files analyzed at the same time in analyze_file_batch(), BATCH_CONCURRENCY env overrides
+DEFAULT_PACK_MAX_DOCUMENTS = 8 # Short documents packed into one request in analyze_many(), PACK_MAX_DOCUMENTS env overrides
+
+# Routes used when MODEL_ROUTES_FILE doesn't replace them. Route names are what the frontend sends as the model.
+DEFAULT_ROUTES = {
+    "openai": [f"openai/{PRIMARY_MODEL}", f"openai/{BACKUP_MODEL}"],
+    PRIMARY_MODEL: [f"openai/{PRIMARY_MODEL}", f"openai/{BACKUP_MODEL}"],
+    BACKUP_MODEL: [f"openai/{BACKUP_MODEL}"],
+    "mistral": [f"ollama/{LOCAL_MODEL}"],
+}
 
 class ApiHandler():
     """
-    Handler class for interacting with LLMs. Currently only supports OpenAI's GPT-4o/GPT-4o-mini models.
+    Handler class for interacting with LLMs. Requests are routed to OpenAI, the local Ollama server
+    or other configured providers by `ModelRouter`.
     Should be initialized once and used through one instance.
     """
+    # OpenAI client, the router creates its own if None
+    __client = None
+    # Results cache, None disables caching (e.g. when __init__ is skipped)
+    __cache = None
+    # Local LLM client, created on first use
+    __ollama = None
+    # OpenAI request pacing, created on first use
+    __scheduler = None
+    # Model routes, created on first use
+    __router = None
+    # Extracted text of uploads, None extracts every time
+    __texts = None
+
     def __init__(self):
         """
-        Constructor for the ApiHandler class. Initializes the OpenAI client with the OPENAI_KEY from the .env file.
+        Constructor for the ApiHandler class. Initializes the OpenAI client with the OPENAI_KEY from the .env file
+        and the analysis results cache.
         """
         load_dotenv()
         OPENAI_KEY = os.getenv("OPENAI_KEY")
-        self.__client = OpenAI(api_key=OPENAI_KEY)
+        # Retries are done by the scheduler, which knows about the other requests waiting
+        self.__client = OpenAI(api_key=OPENAI_KEY, max_retries=0)
+        self.__cache = AnalysisCache()
+        self.__texts = TextCache()
+        self.__ollama = OllamaClient()
+        self.__scheduler = RateLimitScheduler()
+        self.__router = ModelRouter.from_file(
+            routes=DEFAULT_ROUTES,
+            openai_client=self.__client,
+            scheduler=self.__scheduler,
+            ollama_client=self.__ollama,
+        )
+
+    def __ollama_client(self) -> OllamaClient:
+        """
+        Shared client for the local Ollama server, see `OllamaClient`.
+        """
+        if self.__ollama is None:
+            self.__ollama = OllamaClient()
+        return self.__ollama
+
+    def __rate_limiter(self) -> RateLimitScheduler:
+        """
+        Shared scheduler for OpenAI requests, see `RateLimitScheduler`.
+        """
+        if self.__scheduler is None:
+            self.__scheduler = RateLimitScheduler()
+        return self.__scheduler
+
+    def __model_router(self) -> ModelRouter:
+        """
+        Shared model router, see `ModelRouter`. Uses the handler's clients for the built-in providers.
+        """
+        if self.__router is None:
+            self.__router = ModelRouter.from_file(
+                routes=DEFAULT_ROUTES,
+                openai_client=self.__client,
+                scheduler=self.__rate_limiter(),
+                ollama_client=self.__ollama_client(),
+            )
+        return self.__router
+
+    def router_stats(self) -> dict:
+        """
+        Request count, error rate and latency of each configured provider/model.
+
+        Returns:
+            dict: Router statistics, see `ModelRouter.stats()`.
+        """
+        return self.__model_router().stats()
+
+    def rate_limit_stats(self) -> dict:
+        """
+        Retry count and current limits of each OpenAI model.
+
+        Returns:
+            dict: Scheduler statistics, see `RateLimitScheduler.stats()`.
+        """
+        return self.__rate_limiter().stats()
+
+    def cache_stats(self) -> dict:
+        """
+        Hit/miss counters of the analysis results cache.
+
+        Returns:
+            dict: Cache statistics, see `AnalysisCache.stats()`. Empty if caching is disabled.
+        """
+        if self.__cache is None:
+            return {}
+        return self.__cache.stats()
+
+    def __cached(self, model: str, instructions: str, blueprint: dict, text: str):
+        """
+        Look up a cached analysis result.
+
+        Returns:
+            tuple[string, string]: (cache key, cached result or None). Key is None if caching is disabled.
+        """
+        if self.__cache is None:
+            return None, None
+        questions = blueprint.get("questions") if blueprint is not None else None
+        key = AnalysisCache.key(model, instructions, questions, text)
+        return key, self.__cache.get(key)
+
+    def __cache_result(self, key: str, result: str, partial: bool = False):
+        """
+        Store an analysis result in the cache. Failed analyses (None/error dicts) are not cached.
+        Partial analyses of chunks are kept longer, see `AnalysisCache`.
+        """
+        if key is not None:
+            self.__cache.put(key, result, partial)
 
     def openai_analyze(self, text: str, blueprint: dict, model: str = PRIMARY_MODEL) -> str:
         """
         Analyzes the given text using the specified model and blueprint. Model is set to GPT-4o by default.
-        If the rate limit is reached and the backup model is not yet used, tries to generate result with the backup model.
-        (Currently GPT-4o-mini). If the backup model also fails, returns None.
+        Requests are paced to the model's rate limits and retried with backoff when rate limited. If the retries run out
+        and the backup model is not yet used, tries to generate result with the backup model (Currently GPT-4o-mini).
+        If the backup model also fails, returns None.
 
         Args:
             text (string): Text to be analyzed. If analyzing files (PDF/txt), use `analyze_file()` instead.
             blueprint (dict): Blueprint dict containing questions for the LLM.
                 Can be null if analyzing with 'default/automatic blueprint'.
             model (string, optional): GPT Model to be used for analysis. Defaults to PRIMARY_MODEL (GPT-4o).
+                Models without a route of their own are used without a backup model if they are configured targets
+                (see `ModelRouter`), other models use the default route.
         
         Returns:
             string: Analysis result text generated by the LLM.
                 Can be None if the rate limit even for the backup model (GPT-4o-mini) is reached.
         """
-        # TODO: Create separate file for instructions in both Finnish and English
-        instructions = (
-            "You are an expert in text analysis. Please read the provided text carefully "
-            "and then produce a structured analysis with the following components:\n\n"
+        instructions = prompts.analysis_prompt(blueprint)
+        route = model if self.__model_router().has_route(model) else f"openai/{model}"
+        return self.__complete(route, instructions, text, blueprint)
 
-            "1. **Main Themes**: Identify and summarize the core themes or central ideas present in the text.\n"
-            "2. **Key Points**: Highlight the most important details, arguments, or statements that stand out.\n"
-            "3. **Notable Quotes or Passages**: Include any direct quotes or paraphrased sections that are especially significant or illustrative.\n"
-            "4. **Overall Sentiment**: Describe the general tone or emotional quality of the text (e.g., optimistic, critical, neutral, etc.).\n\n"
+    def __complete(self, route: str, instructions: str, text: str, blueprint: dict, schema: dict = None, partial: bool = False):
+        """
+        Sends instructions and text to the targets of the route until one answers. Results are cached per model.
+        OpenAI requests are paced to the rate limits and retried with backoff before the next target is tried.
+        With a schema, responses that are not a valid structured analysis count as failures.
 
-            "If there are specific questions provided, answer each of them thoroughly after completing your summary. "
-            "Make sure your answers are clear, concise, and directly address the questions.\n"
-        )
+        Returns:
+            string: Response text. If every target failed, the failure result of the last one
+                (None for OpenAI, dict with an "error" key for Ollama).
+        """
+        validate = (lambda result: prompts.parse_structured(result.strip(), blueprint)) if schema is not None else None
+        error, failed = None, None
+        for target in self.__model_router().plan(route):
+            # Same document, blueprint and model analyzed before
+            cache_key, cached = self.__cached(target.model, instructions, blueprint, text)
+            if cached is not None:
+                return cached
 
-        if blueprint is not None and "questions" in blueprint:
-            instructions += (
-                "\nAdditionally, please answer the following questions:\n" +
-                "\n".join(f"- {question}" for question in blueprint["questions"])
-            )
-        # Try to get the response from the chat completions API
-        try:
-            response = self.__client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": instructions
-                    },
-                    {
-                        "role": "user",
-                        "content": text
-                    }
-                ]
-            )
+            try:
+                result = target.generate(instructions, text, schema=schema, validate=validate).strip()
+            except ProviderError as e:
+                print(f"{target.key} failed: {e}")
+                error, failed = e, target
+                continue
 
-            result = response.choices[0].message.content.strip()
+            self.__cache_result(cache_key, result, partial)
             return result
-        
-        # If the rate limit is reached, try the backup model, if the backup model also fails, return None
-        except openai.RateLimitError:
-            if (model != BACKUP_MODEL):
-                return self.openai_analyze(text, blueprint, BACKUP_MODEL)
-            else:
-                return None
-            
-    def analyze_file(self, filepath: str, blueprint: dict, model: str = PRIMARY_MODEL) -> str:
+
+        return failed.provider.failure_result(error) if failed is not None else None
+
+    def analyze_file(self, filepath: str, blueprint: dict, model: str = PRIMARY_MODEL, structured: bool = False, upload_id: str = None) -> str:
         """
         Extracts the text from the given file and analyzes it using the model specified, or by default `openai_analyze()`.
+        Pages are chunked while they are extracted, so for long documents the first chunks are already being analyzed
+        while later pages are still parsed. Text of uploads is extracted once and cached by upload id, see `TextCache`.
 
         Args:
-            filepath (string): Absolute path to the file to be analyzed. Supports PDF and txt files.
+            filepath (string): Absolute path to the file to be analyzed. Supports the file types of `utils.iter_text_from_file()`.
             blueprint (dict): Blueprint dict containing questions for the LLM.
                 Can be null if analyzing with 'default/automatic blueprint'.
             model (string, optional): GPT Model to be used for analysis. Defaults to PRIMARY_MODEL (GPT-4o).
+            structured (bool, optional): Return a structured analysis, see `analyze()`. Defaults to False.
+            upload_id (string, optional): Id of the file in `UploadStore`, used as the extracted text cache key.
 
         Returns:
             string: Analysis result text generated by the LLM.
                 Can be None if the rate limit even for the backup model (GPT-4o-mini) is reached.
         """
-        text = utils.extract_text_from_file(filepath)
-        if text is None:
-            return None
-        return self.analyze(text, blueprint, model)
+        pages = self.__iter_pages(filepath, upload_id)
+        return self.__analyze_chunks(chunking.iter_chunks(pages), blueprint, model, structured)
 
-    def mistral_analyze(self, text: str, blueprint: dict) -> str:
+    def extract_text(self, filepath: str, upload_id: str = None) -> str:
         """
-        Analyzes the given prompt using the Mistral model via an API call.
+        Text of a file like `utils.extract_text_from_file()`, from the extracted text cache when possible.
 
         Args:
-            prompt (string): The input prompt to be analyzed by the Mistral model.
+            filepath (string): Path to the file. Supports the file types of `utils.iter_text_from_file()`.
+            upload_id (string, optional): Id of the file in `UploadStore`, used as the cache key.
 
         Returns:
-            string: The combined JSON response from the API call as a string. If an error occurs, 
-                a dictionary with an "error" key and the error message is returned.
+            string: Extracted text, None if the file is not found or has no text.
+        """
+        return utils.join_pages(self.__iter_pages(filepath, upload_id))
 
-        Raises:
-            requests.exceptions.RequestException: If the API request fails.
-            json.JSONDecodeError: If the response contains invalid JSON.
+    def __iter_pages(self, filepath: str, upload_id: str):
         """
-        instructions = (
-            "You are an expert in text analysis. Please read the provided text carefully "
-            "and then produce a structured analysis with the following components:\n\n"
+        Pages of the file, see `TextCache.iter_pages()`.
+        """
+        if self.__texts is None:
+            return utils.iter_text_from_file(filepath)
+        return self.__texts.iter_pages(filepath, upload_id)
 
-            "1. **Main Themes**: Identify and summarize the core themes or central ideas present in the text.\n"
-            "2. **Key Points**: Highlight the most important details, arguments, or statements that stand out.\n"
-            "3. **Notable Quotes or Passages**: Include any direct quotes or paraphrased sections that are especially significant or illustrative.\n"
-            "4. **Overall Sentiment**: Describe the general tone or emotional quality of the text (e.g., optimistic, critical, neutral, etc.).\n\n"
+    def analyze_file_batch(self, filepaths: list[str], blueprint: dict, model: str = PRIMARY_MODEL, max_concurrency: int = None, upload_ids: dict = None):
+        """
+        Analyzes multiple files concurrently with `analyze_file()`. Results are yielded as each file finishes,
+        so the whole batch takes about as long as the slowest file instead of the sum of all of them.
+        Requests of the batch have batch priority, interactive analyses go ahead of them when rate limited.
 
-            "If there are specific questions provided, answer each of them thoroughly after completing your summary. "
-            "Make sure your answers are clear, concise, and directly address the questions.\n"
-        )
+        Args:
+            filepaths (list[string]): Paths to the files to be analyzed. Supports the file types of `utils.iter_text_from_file()`.
+            blueprint (dict): Blueprint dict containing questions for the LLM.
+                Can be null if analyzing with 'default/automatic blueprint'.
+            model (string, optional): GPT Model to be used for analysis. Defaults to PRIMARY_MODEL (GPT-4o).
+            max_concurrency (int, optional): Max files analyzed at the same time.
+                Defaults to BATCH_CONCURRENCY env or DEFAULT_BATCH_CONCURRENCY.
+            upload_ids (dict[string, string], optional): Upload id of each filepath, see `analyze_file()`.
 
-        if blueprint is not None and "questions" in blueprint:
-            instructions += (
-                "\nAdditionally, please answer the following questions:\n" +
-                "\n".join(f"- {question}" for question in blueprint["questions"])
-            )
+        Yields:
+            tuple[string, string, string]: (filepath, analysis result, error) in completion order.
+                Result is None if the file couldn't be analyzed, error is None unless analysis raised an exception.
+        """
+        if not filepaths:
+            return
 
-        instructions += "\n\n" + text
+        max_concurrency = max_concurrency or int(os.getenv("BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY))
+        upload_ids = upload_ids or {}
 
-        data = {
-            "model": LOCAL_MODEL,
-            "prompt": instructions,
-            "stream": False,
-        }
-        try:
-            response = requests.post("http://ollama:11434/api/generate", json=data)
-            response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(filepaths))) as executor:
+            futures = {
+                executor.submit(self.__analyze_file_batched, filepath, blueprint, model, upload_ids.get(filepath)): filepath
+                for filepath in filepaths
+            }
+            try:
+                for future in as_completed(futures):
+                    filepath = futures[future]
+                    try:
+                        result, error = future.result(), None
+                    except Exception as e:
+                        result, error = None, str(e)
+                    yield filepath, result, error
+            finally:
+                # consumer stopped early (e.g. client disconnected), don't start the remaining files
+                for future in futures:
+                    future.cancel()
 
-            # Directly parse the JSON response
-            json_response = response.json()
+    def __analyze_file_batched(self, filepath: str, blueprint: dict, model: str, upload_id: str) -> str:
+        """
+        `analyze_file()` with batch priority.
+        """
+        with rate_limiter.priority(rate_limiter.BATCH):
+            return self.analyze_file(filepath, blueprint, model, upload_id=upload_id)
 
-            # Extract text fields from the JSON response
-            combined_text = ""
-            for key, value in json_response.items():
-                if isinstance(value, str):
-                    combined_text += value + "\n"
+    def mistral_analyze(self, text: str, blueprint: dict) -> str:
+        """
+        Analyzes the given text using the "mistral" route, by default the Mistral model on the local Ollama server.
 
-            # Remove unwanted strings at the beginning and end
-            combined_text = re.sub(r'^mistral\n\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z\n', '', combined_text)
-            combined_text = re.sub(r'\nstop$', '', combined_text).strip()
+        Args:
+            text (string): Text to be analyzed.
+            blueprint (dict): Blueprint dict containing questions for the LLM.
+                Can be null if analyzing with 'default/automatic blueprint'.
 
-            return combined_text.strip()
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            return {"error": str(e)}
-        except json.JSONDecodeError as e:
-            print(f"Failed to decode JSON response: {response.text}")
-            return {"error": "Invalid JSON response"}
+        Returns:
+            string: The response text. If an error occurs (request failed or response contains invalid JSON),
+                a dictionary with an "error" key and the error message is returned.
+        """
+        instructions = prompts.analysis_prompt(blueprint)
+        return self.__complete("mistral", instructions, text, blueprint)
 
-    def analyze(self, text: str, blueprint: dict, model: str) -> str:
+    def analyze(self, text: str, blueprint: dict, model: str, structured: bool = False) -> str:
         """
-        Analyzes the given text using the specified model and blueprint. Model is set to GPT-4o by default.
-        If the rate limit is reached and the backup model is not yet used, tries to generate result with the backup model.
-        (Currently GPT-4o-mini). If the backup model also fails, returns None.
+        Analyzes the given text using the route of the specified model and blueprint. Route names are case insensitive,
+        e.g. "OpenAI" (GPT-4o with GPT-4o-mini as backup), "Mistral" (local model), a model name or "provider/model" of a configured target.
+        Unknown names use the default route (OpenAI). If every target of the route fails, returns None
+        (or error dict if the local model was the last one tried).
+        Text over the chunk token budget (CHUNK_TOKEN_BUDGET env) is split on page/paragraph boundaries,
+        the chunks are analyzed in parallel and the partial analyses are merged into one result.
+        In structured mode the model answers with JSON following `prompts.analysis_schema()`, which is validated
+        before it is returned. Invalid answers count as failures, so the next target of the route is tried.
 
         Args:
             text (string): Text to be analyzed. If analyzing files (PDF/txt), use `analyze_file()` instead.
             blueprint (dict): Blueprint dict containing questions for the LLM.
                 Can be null if analyzing with 'default/automatic blueprint'.
-            model (string, optional): GPT Model to be used for analysis. Defaults to PRIMARY_MODEL (GPT-4o).
+            model (string): Model route to be used for analysis, see `ModelRouter`.
+            structured (bool, optional): Return a structured analysis instead of markdown. Defaults to False.
         
         Returns:
             string: Analysis result text generated by the LLM.
                 Can be None if the rate limit even for the backup model (GPT-4o-mini) is reached.
+                In structured mode a dict, see `prompts.structured_result()`.
         """
-        if model.strip().lower() == "mistral":
-            return self.mistral_analyze(text, blueprint)
+        # Too long for one request, analyze in chunks and merge
+        if chunking.estimate_tokens(text) > chunking.token_budget():
+            return self.__analyze_chunks(chunking.iter_chunks([(1, text)]), blueprint, model, structured)
+
+        return self.__analyze_single(text, blueprint, model, structured)
+
+    def analyze_many(self, texts: list[str], blueprint: dict, model: str = PRIMARY_MODEL, max_concurrency: int = None) -> list:
+        """
+        Analyzes several texts with the same blueprint. Short texts are packed into one request
+        (up to PACK_MAX_DOCUMENTS texts and the chunk token budget), so the instructions are sent and the
+        round trip is paid once per pack instead of once per text. The response is split back into one analysis per text,
+        texts missing from it are analyzed with single requests. Texts over half of the budget are analyzed with `analyze()`.
+        Packs are analyzed concurrently.
+
+        Args:
+            texts (list[string]): Texts to be analyzed.
+            blueprint (dict): Blueprint dict containing questions for the LLM.
+                Can be null if analyzing with 'default/automatic blueprint'.
+            model (string, optional): Model route to be used for analysis, see `analyze()`. Defaults to PRIMARY_MODEL (GPT-4o).
+            max_concurrency (int, optional): Max requests at the same time.
+                Defaults to BATCH_CONCURRENCY env or DEFAULT_BATCH_CONCURRENCY.
+
+        Returns:
+            list: Analysis result of each text in the same order, see `analyze()`.
+        """
+        if not texts:
+            return []
+
+        max_concurrency = max_concurrency or int(os.getenv("BATCH_CONCURRENCY", DEFAULT_BATCH_CONCURRENCY))
+        packs = self.__pack(texts)
+
+        results = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(packs))) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, self.__analyze_pack, [texts[index] for index in pack], blueprint, model): pack
+                for pack in packs
+            }
+            for future in as_completed(futures):
+                for index, result in zip(futures[future], future.result()):
+                    results[index] = result
+        return results
+
+    def __pack(self, texts: list[str]) -> list[list[int]]:
+        """
+        Groups consecutive short texts into packs that fit one request.
+
+        Returns:
+            list[list[int]]: Indexes of the texts in each pack.
+        """
+        budget = chunking.token_budget()
+        max_documents = int(os.getenv("PACK_MAX_DOCUMENTS", DEFAULT_PACK_MAX_DOCUMENTS))
+
+        packs = []
+        current, current_tokens = [], 0
+        for index, text in enumerate(texts):
+            tokens = chunking.estimate_tokens(text)
+            if tokens > budget // 2 or not prompts.can_batch(text):
+                packs.append([index])
+                continue
+            if current and (current_tokens + tokens > budget or len(current) >= max_documents):
+                packs.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            packs.append(current)
+        return packs
+
+    def __analyze_pack(self, texts: list[str], blueprint: dict, model: str) -> list:
+        """
+        Analyzes a pack of texts with one request. A single text is analyzed with `analyze()`.
+
+        Returns:
+            list: Analysis result of each text. If the request failed, its failure result for every text.
+        """
+        if len(texts) == 1:
+            return [self.analyze(texts[0], blueprint, model)]
+
+        response = self.__complete(model, prompts.batch_prompt(blueprint), prompts.batch_text(texts), blueprint)
+        if not isinstance(response, str):
+            return [response] * len(texts)
+
+        # texts the model left out or mixed up are analyzed alone
+        analyses = prompts.split_batch(response, len(texts))
+        return [
+            analyses[index] if index in analyses else self.__analyze_single(text, blueprint, model)
+            for index, text in enumerate(texts)
+        ]
+
+    def __analyze_single(self, text: str, blueprint: dict, model: str, structured: bool = False, partial: bool = False) -> str:
+        """
+        Analyzes text with one request to the route of the selected model.
+        Partial analyses (chunks of a longer document) are cached longer, see `AnalysisCache`.
+        """
+        if structured:
+            response = self.__complete(model, prompts.structured_prompt(blueprint), text, blueprint, prompts.analysis_schema(blueprint))
+            return self.__structured(response, blueprint)
+        instructions = prompts.analysis_prompt(blueprint)
+        return self.__complete(model, instructions, text, blueprint, partial=partial)
+
+    def __structured(self, response, blueprint: dict):
+        """
+        Structured result of a validated response, failure results as they are.
+        """
+        if not isinstance(response, str):
+            return response
+        return prompts.structured_result(response, blueprint)
+
+    def __analyze_chunks(self, chunks, blueprint: dict, model: str, structured: bool = False) -> str:
+        """
+        Map-reduce analysis. Chunks are analyzed in parallel against the blueprint as they come from the iterator,
+        then the partial analyses are merged with one more request. A single chunk is analyzed as is.
+        In structured mode only the merge (or the single chunk) is structured, partial analyses stay as text.
+
+        Args:
+            chunks (Iterator[string]): Chunks from `chunking.iter_chunks()`.
+
+        Returns:
+            string: Merged analysis result. None if there was no text.
+                None (or error dict from Mistral) if any of the requests failed.
+        """
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            return None
+        second = next(chunks, None)
+        if second is None:
+            return self.__analyze_single(first, blueprint, model, structured)
+
+        partials = self.__map_chunks(itertools.chain([first, second], chunks), blueprint, model)
+
+        # Any failed part fails the whole analysis, same as a failed single request
+        for partial in partials:
+            if not isinstance(partial, str):
+                return partial
+
+        return self.__reduce(partials, blueprint, model, structured)
+
+    def __map_chunks(self, chunks, blueprint: dict, model: str) -> list:
+        """
+        Analyzes chunks in parallel (CHUNK_CONCURRENCY at a time) as they come from the iterator.
+
+        Returns:
+            list: Analysis result of each chunk in order.
+        """
+        max_concurrency = int(os.getenv("CHUNK_CONCURRENCY", DEFAULT_CHUNK_CONCURRENCY))
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            # submitting pulls the next chunk, so extraction continues while earlier chunks are analyzed.
+            # Each chunk runs in a copy of the caller's context to keep its rate limit priority.
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.__analyze_single, chunk, blueprint, model, False, True)
+                for chunk in chunks
+            ]
+            return [future.result() for future in futures]
+
+    def __reduce(self, partials: list[str], blueprint: dict, model: str, structured: bool = False) -> str:
+        """
+        Merges partial analyses of consecutive parts of one document into one structured analysis.
+        """
+        if structured:
+            response = self.__complete(
+                model, prompts.structured_reduce_prompt(blueprint), prompts.reduce_text(partials), blueprint, prompts.analysis_schema(blueprint),
+            )
+            return self.__structured(response, blueprint)
+        return self.__complete(model, prompts.reduce_prompt(blueprint), prompts.reduce_text(partials), blueprint)
+
+    def stream_analyze(self, text: str, blueprint: dict, model: str):
+        """
+        Same as `analyze()`, but yields the result in pieces as the model generates it.
+        For text over the chunk token budget the chunks are analyzed first and only the final merge is streamed.
+
+        Args:
+            text (string): Text to be analyzed.
+            blueprint (dict): Blueprint dict containing questions for the LLM.
+                Can be null if analyzing with 'default/automatic blueprint'.
+            model (string): Model route to be used for analysis, see `analyze()`.
+
+        Yields:
+            string: Next piece of the analysis result.
+
+        Raises:
+            RuntimeError: If the analysis failed (every target of the route failed, e.g. rate limit reached even for the backup model).
+        """
+        if chunking.estimate_tokens(text) <= chunking.token_budget():
+            instructions = prompts.analysis_prompt(blueprint)
         else:
-            return self.openai_analyze(text, blueprint)         
+            partials = self.__map_chunks(chunking.iter_chunks([(1, text)]), blueprint, model)
+            for partial in partials:
+                if not isinstance(partial, str):
+                    raise RuntimeError(str(partial["error"]) if isinstance(partial, dict) else "Rate limit reached")
+            if len(partials) == 1:
+                yield partials[0]
+                return
+            instructions, text = prompts.reduce_prompt(blueprint), prompts.reduce_text(partials)
+
+        yield from self.__complete_stream(model, instructions, text, blueprint)
+
+    def __complete_stream(self, route: str, instructions: str, text: str, blueprint: dict):
+        """
+        Streaming version of `__complete()`. Cached results are yielded at once, new results are cached when complete.
+        The next target is tried only if the previous one failed before yielding anything.
+
+        Yields:
+            string: Response pieces.
+
+        Raises:
+            ProviderError: If every target failed, or a target failed in the middle of its answer.
+        """
+        error = None
+        for target in self.__model_router().plan(route):
+            cache_key, cached = self.__cached(target.model, instructions, blueprint, text)
+            if cached is not None:
+                yield cached
+                return
+
+            pieces = []
+            try:
+                for piece in target.generate_stream(instructions, text):
+                    pieces.append(piece)
+                    yield piece
+            except ProviderError as e:
+                # part of the answer is already sent, can't continue with another model
+                if pieces:
+                    raise
+                print(f"{target.key} failed: {e}")
+                error = e
+                continue
+
+            self.__cache_result(cache_key, "".join(pieces).strip())
+            return
+
+        raise error if error is not None else ProviderError(f"No targets for route '{route}'")
 
 def main():
     #apiHandler = ApiHandler()
@@ -1,13 +1,17 @@
-from flask import jsonify, Blueprint, request
+from flask import jsonify, Blueprint, request, Response, stream_with_context
 from flask_cors import CORS
 from app.api_handler import ApiHandler
+import app.rate_limiter as rate_limiter
+from app.uploads import UploadStore, UploadTooLargeError
 from app.database import Database, NodeProperties, NodeLabels
 from dotenv import load_dotenv
 import os
+import json
+from urllib.parse import unquote
 from app.models.blueprint import Blueprint as BP
 from app.models.project import Project
 from app.models.result import Result
-from neo4j.time import DateTime
+from app.jobs import create_job_queue, report_progress, JobStatus, QueueFullError
 
 """
 This file contains the backend API for the application. It handles the file management, analysis, and database handling.
@@ -16,6 +20,8 @@ This file contains the backend API for the application. It handles the file mana
 main = Blueprint('main', __name__)
 apiHandler = ApiHandler()
 database = Database()
+jobs = create_job_queue()
+uploads = UploadStore()
 
 frontend_port = os.getenv('VITE_PORT', '5173')
 CORS(main, resources={r"/*": {"origins": "http://localhost:{frontend_port}"}})  # Allows connections between domains
@@ -24,52 +30,83 @@ CORS(main, resources={r"/*": {"origins": "http://localhost:{frontend_port}"}})
 @main.route('/upload_file', methods=['POST'])
 def upload_file():
     """
-    Uploads a file to the server and returns the filename.
-    Should be used before analyzing the file.
+    Uploads a file to the server and returns its upload id. Should be used before analyzing the file.
+    The file is streamed to the upload spool in chunks, so large files don't use more memory.
+    Max size is MAX_CONTENT_LENGTH (env) bytes.
 
     Parameters:
         Method: POST
-        file: File to be uploaded, under the name 'file'. Use FormData to upload.
+        Either the file as the request body (streamed as it arrives):
+            X-Filename header: URL encoded filename, the extension decides how text is extracted.
+        Or multipart form:
+            file: File to be uploaded, under the name 'file'. Use FormData to upload.
 
     Returns:
-        string: Filename of the uploaded file.
+        dict: {"id": upload id for the analysis endpoints, "filename": original filename, "size": bytes, "sha256": hex digest,
+            "reused": true if the same content was already uploaded}.
+            Status 400 if there was no file and 413 if the file is too large.
     """
     file = request.files.get('file')
-    filename = file.filename
-    file.save(filename)
+    if file is not None:
+        stream, filename = file.stream, file.filename
+    elif 'X-Filename' in request.headers:
+        stream, filename = request.stream, unquote(request.headers['X-Filename'])
+    else:
+        return jsonify({"error": "No file"}), 400
 
-    return filename
+    try:
+        upload = uploads.save(stream, filename)
+    except UploadTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+
+    return jsonify(upload)
+
+@main.route('/uploads/<sha256>', methods=['GET'])
+def find_upload(sha256):
+    """
+    Checks if a file with the same content is already uploaded, so uploading it again can be skipped.
+
+    Parameters:
+        Method: GET
+        sha256: SHA-256 hex digest of the file content.
+        filename: Filename of the file, as a query parameter. The extension must match the stored one.
+
+    Returns:
+        dict: Same as '/upload_file'. Status 404 if the content is not uploaded.
+    """
+    upload = uploads.find(sha256, request.args.get('filename'))
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(upload)
 
 # For analyzing files using OpenAI
 @main.route('/analyze_file', methods=['POST'])
 def analyze_file():
     """
     Analyzes the already uploaded file using the specified blueprint.
-    Deletes the file after analysis, as it is no longer needed.
-    Upload file before analyzing.
+    Upload file before analyzing. The upload and its extracted text are kept for analyzing it again,
+    least recently used uploads are removed when the store is full.
 
     Parameters:
         Method: POST
-        filename: Filename of the uploaded file. Can be gotten from '/upload_file' endpoint.
+        filename: Upload id of the file, from '/upload_file' endpoint.
         blueprint: Blueprint dict, needed for questions for the LLM.
             Can be null if analyzing with 'default/automatic blueprint'.
+        structured (optional): True to get a structured result, see '/analyze_text'.
     
     Returns:
         string: Analysis results generated by the LLM. Can be null if backend runs into issues
-            such as rate limits.
+            such as rate limits. Status 404 if the upload was not found.
     """
-    filename = request.json['filename']
+    upload_id = request.json['filename']
     blueprint = request.json['blueprint']
     model = request.json['model']
-    results = apiHandler.analyze_file(filename, blueprint, model)
+    structured = bool(request.json.get('structured', False))
 
-    # TODO: Actually handle errors. Currently not stability-threatening, but should be implemented.
-    try:
-        os.remove(filename)
-    except FileNotFoundError:
-        pass
-    except PermissionError:
-        pass
+    with uploads.using(upload_id) as filepath:
+        if filepath is None:
+            return jsonify({"error": "Upload not found"}), 404
+        results = apiHandler.analyze_file(filepath, blueprint, model, structured, upload_id)
     
     return jsonify(results)
 
@@ -83,51 +120,353 @@ def analyze_text():
         text: Text to be analyzed.
         blueprint: Blueprint dict, needed for questions for the LLM.
             Can be null if analyzing with 'default/automatic blueprint'.
+        structured (optional): True to get the result as validated JSON with each answer separately.
 
     Returns:
         string: Analysis results generated by the LLM. Can be null if backend runs into issues
             such as rate limits.
+            Structured: dict with main_themes, key_points, notable_quotes, overall_sentiment,
+            answers ([{question, answer}]) and result (markdown text to show and save).
     """
     text = request.json['text']
     blueprint = request.json['blueprint']
     model = request.json['model']
-    results = apiHandler.analyze(text, blueprint, model)
+    structured = bool(request.json.get('structured', False))
+    results = apiHandler.analyze(text, blueprint, model, structured)
 
     return jsonify(results)
 
-# Database handling
-# Blueprints
+@main.route('/analyze_texts', methods=['POST'])
+def analyze_texts():
+    """
+    Analyzes multiple texts with one blueprint. Short texts are packed into shared LLM requests,
+    which is much faster than calling '/analyze_text' for each of them.
 
-def __get_whole_blueprint(id: str) -> dict:
+    Parameters:
+        Method: POST
+        texts: List of texts to be analyzed.
+        blueprint: Blueprint dict, needed for questions for the LLM.
+            Can be null if analyzing with 'default/automatic blueprint'.
+        model: Model to be used for analysis.
+
+    Returns:
+        list: Analysis result of each text in the same order. Items can be null if backend runs into issues
+            such as rate limits.
+    """
+    texts = request.json['texts']
+    blueprint = request.json['blueprint']
+    model = request.json['model']
+    results = apiHandler.analyze_many(texts, blueprint, model)
+
+    return jsonify(results)
+
+@main.route('/analyze_batch', methods=['POST'])
+def analyze_batch():
     """
-    Gets the whole blueprint with all properties for given ID.
+    Analyzes multiple files with one blueprint. Files are analyzed concurrently (BATCH_CONCURRENCY at a time)
+    and each result is streamed back as soon as that file is finished, so results arrive in completion order.
+    Files are kept in the upload store like with '/analyze_file'.
+
+    Parameters:
+        Method: POST
+        Either multipart form (use FormData):
+            files: Files to be analyzed, each under the name 'files'.
+            blueprint: Blueprint dict as JSON string, needed for questions for the LLM.
+                Can be null if analyzing with 'default/automatic blueprint'.
+            model: Model to be used for analysis.
+        Or JSON for already uploaded files:
+            filenames: List of upload ids from '/upload_file' endpoint.
+            blueprint: Blueprint dict.
+            model: Model to be used for analysis.
+
+    Returns:
+        application/x-ndjson: One JSON object per line and file: {"filename", "result", "error"}.
+            Files with the same content are analyzed once, with a line for each of them.
+            Result is null if the file couldn't be analyzed. Status 413 if a file is too large.
+    """
+    # filepath -> (upload id, filenames reported back), uploads are in use until the batch is done.
+    # Files with the same content are one upload, analyzed once and reported under each of their names.
+    files = {}
+    missing = []
+
+    def add(upload_id, filename):
+        filepath = uploads.acquire(upload_id)
+        if filepath is None:
+            missing.append(filename)
+        elif filepath in files:
+            # already acquired once for the batch
+            uploads.release(upload_id)
+            files[filepath][1].append(filename)
+        else:
+            files[filepath] = (upload_id, [filename])
+
+    def release():
+        for upload_id, filenames in files.values():
+            uploads.release(upload_id)
+
+    if request.files:
+        blueprint = json.loads(request.form.get('blueprint') or 'null')
+        model = request.form.get('model')
+
+        try:
+            for file in request.files.getlist('files'):
+                upload = uploads.save(file.stream, file.filename)
+                add(upload["id"], file.filename)
+        except UploadTooLargeError as e:
+            release()
+            return jsonify({"error": str(e)}), 413
+    else:
+        blueprint = request.json['blueprint']
+        model = request.json['model']
+        for upload_id in request.json['filenames']:
+            add(upload_id, upload_id)
+
+    def generate():
+        for filename in missing:
+            yield json.dumps({"filename": filename, "result": None, "error": "Upload not found"}) + "\n"
+        upload_ids = {filepath: upload_id for filepath, (upload_id, filenames) in files.items()}
+        for filepath, results, error in apiHandler.analyze_file_batch(list(files), blueprint, model, upload_ids=upload_ids):
+            for filename in files[filepath][1]:
+                yield json.dumps({"filename": filename, "result": results, "error": error}) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # on close and not at the end of generate(), the response may be closed without ever being read
+    response.call_on_close(release)
+    return response
+
+def _sse_response(pieces, cleanup = None):
+    """
+    Stream analysis pieces as server-sent events.
+    Each piece is sent as 'data: {"token": piece}', then 'event: done' when finished,
+    or 'event: error' with 'data: {"error": message}' if the analysis failed.
 
     Args:
-        id (string): UUID-type ID of the blueprint node in the database.
+        pieces (Iterator[string]): Analysis result pieces, e.g. from `ApiHandler.stream_analyze()`.
+        cleanup (callable, optional): Called when the response is closed, also if the stream was never read.
+    """
+    def generate():
+        try:
+            for piece in pieces:
+                yield "data: " + json.dumps({"token": piece}) + "\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except RuntimeError as e:
+            yield "event: error\ndata: " + json.dumps({"error": str(e)}) + "\n\n"
+
+    # no buffering in between, so every piece reaches the client right away
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+    if cleanup is not None:
+        response.call_on_close(cleanup)
+    return response
+
+@main.route('/analyze_text_stream', methods=['POST'])
+def analyze_text_stream():
+    """
+    Same as '/analyze_text', but the analysis is streamed back as it is generated (server-sent events).
+
+    Parameters:
+        Method: POST
+        text: Text to be analyzed.
+        blueprint: Blueprint dict, needed for questions for the LLM.
+            Can be null if analyzing with 'default/automatic blueprint'.
+        model: Model to be used for analysis.
 
     Returns:
-        dict: Blueprint with all properties.
+        text/event-stream: 'data: {"token": string}' events with the analysis in pieces, then 'event: done'.
+            'event: error' with 'data: {"error": string}' if the analysis failed.
     """
-    name = database.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME)
-    description = database.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.DESCRIPTION)
-    questions = database.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.QUESTIONS)
-    return {"id": id, "name": name, "description": description, "questions": questions}
+    text = request.json['text']
+    blueprint = request.json['blueprint']
+    model = request.json['model']
 
-def __get_whole_used_blueprint(id: str) -> dict:
+    return _sse_response(apiHandler.stream_analyze(text, blueprint, model))
+
+@main.route('/analyze_file_stream', methods=['POST'])
+def analyze_file_stream():
     """
-    Gets the whole used blueprint with all properties for given ID.
+    Same as '/analyze_file', but the analysis is streamed back as it is generated (server-sent events).
 
-    Args:
-        id (string): UUID-type ID of the used blueprint node in the database.
+    Parameters:
+        Method: POST
+        filename: Upload id of the file, from '/upload_file' endpoint.
+        blueprint: Blueprint dict, needed for questions for the LLM.
+            Can be null if analyzing with 'default/automatic blueprint'.
+        model: Model to be used for analysis.
+
+    Returns:
+        text/event-stream: 'data: {"token": string}' events with the analysis in pieces, then 'event: done'.
+            'event: error' with 'data: {"error": string}' if no text could be extracted or the analysis failed.
+            Status 404 if the upload was not found.
+    """
+    upload_id = request.json['filename']
+    blueprint = request.json['blueprint']
+    model = request.json['model']
+
+    filepath = uploads.acquire(upload_id)
+    if filepath is None:
+        return jsonify({"error": "Upload not found"}), 404
+
+    def pieces():
+        text = apiHandler.extract_text(filepath, upload_id)
+        if text is None:
+            raise RuntimeError("No text found in file")
+        yield from apiHandler.stream_analyze(text, blueprint, model)
+
+    def cleanup():
+        uploads.release(upload_id)
+
+    return _sse_response(pieces(), cleanup)
+
+@main.route('/analysis_cache/stats', methods=['GET'])
+def analysis_cache_stats():
+    """
+    Gets hit/miss counters of the analysis results cache.
+
+    Parameters:
+        Method: GET
+
+    Returns:
+        dict: hits, memory_hits, disk_hits, misses, evictions, entries and hit_rate.
+    """
+    return jsonify(apiHandler.cache_stats())
+
+@main.route('/rate_limits/stats', methods=['GET'])
+def rate_limit_stats():
+    """
+    Gets the OpenAI rate limit state used for pacing requests.
+
+    Parameters:
+        Method: GET
+
+    Returns:
+        dict: retries, and for each model: waiting requests, available requests/tokens, per minute limits and time spent waiting.
+    """
+    return jsonify(apiHandler.rate_limit_stats())
+
+@main.route('/model_routes/stats', methods=['GET'])
+def model_route_stats():
+    """
+    Gets request counts, error rates and latencies of the LLM providers.
+
+    Parameters:
+        Method: GET
 
     Returns:
-        dict: used Blueprint with all properties.
+        dict: For each "provider/model": requests, failures, error_rate, latency (seconds) and in_flight.
     """
-    name = database.lookup_node_property(id, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.NAME)
-    description = database.lookup_node_property(id, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.DESCRIPTION)
-    questions = database.lookup_node_property(id, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.QUESTIONS)
-    return {"id": id, "name": name, "description": description, "questions": questions}
+    return jsonify(apiHandler.router_stats())
 
+# Background analysis jobs
+def _analyze_file_job(upload_id, blueprint, model):
+    """
+    Job for '/jobs/analyze_file'. Same as '/analyze_file'.
+    """
+    with uploads.using(upload_id) as filepath:
+        if filepath is None:
+            raise RuntimeError("Upload not found")
+
+        report_progress(0.1, "analyzing")
+        with rate_limiter.priority(rate_limiter.BATCH):
+            return apiHandler.analyze_file(filepath, blueprint, model, upload_id=upload_id)
+
+def _analyze_text_job(text, blueprint, model):
+    """
+    Job for '/jobs/analyze_text'. Same as '/analyze_text'.
+    """
+    report_progress(0.1, "analyzing")
+    with rate_limiter.priority(rate_limiter.BATCH):
+        return apiHandler.analyze(text, blueprint, model)
+
+def _submit_job(function, *args):
+    """
+    Submit a job and answer with its id, or 503 if the queue is full.
+    """
+    try:
+        job_id = jobs.submit(function, *args)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"id": job_id}), 202
+
+@main.route('/jobs/analyze_file', methods=['POST'])
+def submit_analyze_file():
+    """
+    Queues analysis of the already uploaded file and returns right away.
+    Same parameters as '/analyze_file'. Poll '/jobs/<id>' for status and get the analysis from '/jobs/<id>/result'.
+
+    Parameters:
+        Method: POST
+        filename: Upload id of the file, from '/upload_file' endpoint.
+        blueprint: Blueprint dict, needed for questions for the LLM.
+            Can be null if analyzing with 'default/automatic blueprint'.
+        model: Model to be used for analysis.
+
+    Returns:
+        dict: {"id": job id}, status 202. Status 503 if the job queue is full.
+    """
+    return _submit_job(_analyze_file_job, request.json['filename'], request.json['blueprint'], request.json['model'])
+
+@main.route('/jobs/analyze_text', methods=['POST'])
+def submit_analyze_text():
+    """
+    Queues analysis of the given text and returns right away.
+    Same parameters as '/analyze_text'. Poll '/jobs/<id>' for status and get the analysis from '/jobs/<id>/result'.
+
+    Parameters:
+        Method: POST
+        text: Text to be analyzed.
+        blueprint: Blueprint dict, needed for questions for the LLM.
+            Can be null if analyzing with 'default/automatic blueprint'.
+        model: Model to be used for analysis.
+
+    Returns:
+        dict: {"id": job id}, status 202. Status 503 if the job queue is full.
+    """
+    return _submit_job(_analyze_text_job, request.json['text'], request.json['blueprint'], request.json['model'])
+
+@main.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Gets the status of an analysis job.
+
+    Parameters:
+        Method: GET
+        job_id: Job id from '/jobs/analyze_file' or '/jobs/analyze_text'.
+
+    Returns:
+        dict: {id, status ("queued", "running", "done" or "failed"), progress (0.0-1.0), stage, error}.
+            Status 404 if job was not found.
+    """
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+@main.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """
+    Gets the result of an analysis job.
+
+    Parameters:
+        Method: GET
+        job_id: Job id from '/jobs/analyze_file' or '/jobs/analyze_text'.
+
+    Returns:
+        string: Analysis results generated by the LLM, same as '/analyze_file' and '/analyze_text'.
+            Status 202 with job status if the job is not finished yet, 500 if it failed and 404 if it was not found.
+    """
+    found = jobs.result(job_id)
+    if found is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    status, results = found
+    if status == JobStatus.DONE:
+        return jsonify(results)
+    if status == JobStatus.FAILED:
+        return jsonify(jobs.status(job_id)), 500
+    return jsonify(jobs.status(job_id)), 202
+
+# Database handling
+# Blueprints
 
 @main.route('/get_blueprints', methods=['GET'])
 def get_blueprints():
@@ -140,12 +479,12 @@ def get_blueprints():
     Returns:
         list[dict]: List of blueprints with all properties.
     """
-    blueprints = database.lookup_nodes(NodeLabels.BLUEPRINT) # [[ID, NAME]]
-    blueprints_with_all_properties = []
-    for bp in blueprints:
-        id = bp[0]
-        blueprint = __get_whole_blueprint(id)
-        blueprints_with_all_properties.append(blueprint)
+    # [{id, name, description, questions}] in one query
+    blueprints_with_all_properties = database.lookup_nodes_with_properties(NodeLabels.BLUEPRINT, [
+        NodeProperties.Blueprint.NAME,
+        NodeProperties.Blueprint.DESCRIPTION,
+        NodeProperties.Blueprint.QUESTIONS,
+        ])
     return jsonify(blueprints_with_all_properties)
 
 
@@ -239,13 +578,8 @@ def get_projects():
     Returns:
         list[dict]: List of projects with all properties, results and their blueprints.
     """
-    projects = database.lookup_nodes(NodeLabels.PROJECT) # [[ID, NAME, DATETIME]]
-    projects_with_all_properties = []
-    for proj in projects:
-        id = proj[0]
-        name = proj[1]
-        results = __get_results_for_project(id)
-        projects_with_all_properties.append({"id": id, "open": False, "name": name, "results": results})
+    # Whole Project -> ResultBlueprint -> UsedBlueprint tree in one query
+    projects_with_all_properties = database.lookup_project_tree()
     return jsonify(projects_with_all_properties)
 
 @main.route('/delete_project', methods=['POST'])
@@ -268,34 +602,6 @@ def delete_project():
 
 # Results
 
-def __get_results_for_project(projectId):
-    """
-    Gets all results for a project with all properties. Also gets the blueprint for each result using `__get_whole_blueprint()`
-
-    Args:
-        projectId (string): UUID-type ID of the project node in the database.
-
-    Returns:
-        list[dict]: List of results with all properties (and blueprints).
-    """
-    results = database.lookup_nodes(NodeLabels.RESULT_BLUEPRINT, NodeLabels.PROJECT, projectId)
-    results_with_all_properties = []
-    for res in results:
-        id = res[0]
-        name = database.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME)
-        filename = database.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.FILENAME)
-        result = database.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.RESULT)
-
-        # TODO: Workaround for Automatic-blueprint problem (isn't saved in database)
-        temp = database.lookup_nodes(NodeLabels.USED_BLUEPRINT, NodeLabels.RESULT_BLUEPRINT, id)
-        used_blueprint_id = None
-        if temp != []:
-            used_blueprint_id = temp[0][0]
-
-        used_blueprint_info = __get_whole_used_blueprint(used_blueprint_id)
-        results_with_all_properties.append({"id": id, "name": name, "filename": filename, "result": result, "blueprint": used_blueprint_info})
-    return results_with_all_properties
-
 @main.route('/save_result', methods=['POST'])
 def save_result():
     """
@@ -308,9 +614,11 @@ def save_result():
         blueprint: Blueprint dict used to create the result.
         result: The analysis result text generated by the LLM.
         projectId: UUID-type ID of the project under which the result was created.
+        answers (optional): Answers of a structured result [{question, answer}], saved as separate nodes.
 
     Returns:
         string: UUID-type ID of the newly created result node in the database.
+            If the project was not found, nothing is saved and {"success": false} is returned with status 404.
     """
     data = request.json
     name = data['name']
@@ -321,12 +629,30 @@ def save_result():
     
     result = data['result']
     projectId = data['projectId']
+    answers = data.get('answers')
 
-    #refresh datetime
-    database.set_node_property(projectId, NodeLabels.PROJECT, NodeProperties.Project.DATETIME, DateTime.now())
+    # Also refreshes project datetime
+    res = Result(name, filename, blueprint_id, result, projectId, answers)
+    resultId = res.save_result()
+    if resultId is None:
+        return jsonify({"success": False}), 404
+    return resultId
 
-    res = Result(name, filename, blueprint_id, result, projectId)
-    return res.save_result()
+@main.route('/get_answers', methods=['GET'])
+def get_answers():
+    """
+    Gets saved answers of structured results, newest results first.
+
+    Parameters:
+        Method: GET
+        question (optional): Only answers to this question.
+        projectId (optional): Only answers of results under this project.
+
+    Returns:
+        list[dict]: Answers with projectId, resultId, resultName, filename, question and answer.
+    """
+    answers = database.lookup_answers(request.args.get('question'), request.args.get('projectId'))
+    return jsonify(answers)
 
 @main.route('/delete_result', methods=['POST'])
 def delete_result():
@@ -0,0 +1,164 @@
+"""
+Token aware splitting of long documents into chunks that fit one LLM request.
+Chunks end at content defined boundaries, so a revised document gives the same chunks as the earlier revision
+except around the edited parts, and the analyses of unchanged chunks are found in the analysis cache.
+"""
+import functools
+import math
+import os
+import app.utils as utils
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_CHUNK_TOKEN_BUDGET = 6000 # tokens of document text per LLM request, CHUNK_TOKEN_BUDGET env overrides
+DEFAULT_CHUNK_MIN_FILL = 0.5 # share of the budget a chunk has before it can end at a content defined boundary, CHUNK_MIN_FILL env overrides
+BOUNDARY_DIVISOR = 4 # about one in this many pages or paragraphs past the min fill ends a chunk
+CHARS_PER_TOKEN = 4 # estimate used when tiktoken is not installed
+
+# Split on the largest boundary first: page (form feed), paragraph, line, sentence, word
+SEPARATORS = ("\f", "\n\n", "\n", ". ", " ")
+
+
+def token_budget() -> int:
+    """
+    Returns:
+        int: Chunk token budget from CHUNK_TOKEN_BUDGET env or DEFAULT_CHUNK_TOKEN_BUDGET.
+    """
+    return int(os.getenv('CHUNK_TOKEN_BUDGET', DEFAULT_CHUNK_TOKEN_BUDGET))
+
+
+def min_fill() -> float:
+    """
+    Returns:
+        float: Chunk min fill from CHUNK_MIN_FILL env or DEFAULT_CHUNK_MIN_FILL. 1 packs chunks as full as possible.
+    """
+    return float(os.getenv('CHUNK_MIN_FILL', DEFAULT_CHUNK_MIN_FILL))
+
+
+def _is_boundary(unit: str) -> bool:
+    """
+    Check if a chunk can end after the unit. Decided from the content hash of the unit alone, not its position,
+    so after an edit the chunks end at the same pages and paragraphs as before and line up with the old chunks again.
+
+    Returns:
+        bool:
+            - True when the unit has text and its hash selects it (about 1 / BOUNDARY_DIVISOR of units).
+            - False otherwise.
+    """
+    content = unit.strip()
+    return content != "" and int(utils.content_hash(content)[:8], 16) % BOUNDARY_DIVISOR == 0
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """
+    tiktoken encoding used by GPT-4o models, imported only when needed.
+
+    Returns:
+        Encoding or None: None if tiktoken is not installed.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate number of tokens in text. Exact count with tiktoken if it's installed, otherwise characters / CHARS_PER_TOKEN.
+
+    Args:
+        text (string): Text to estimate.
+
+    Returns:
+        int: Estimated token count.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _split_units(text: str, budget: int, separators: tuple) -> list[str]:
+    """
+    Split text recursively on the largest separator until every unit is within budget.
+    Separators are kept at the end of each unit, so joining the units gives the original text.
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return [text]
+
+    # nothing left to split on, cut by characters
+    if not separators:
+        size = max(1, len(text) * budget // tokens)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    separator, rest = separators[0], separators[1:]
+    parts = text.split(separator)
+    if len(parts) == 1:
+        return _split_units(text, budget, rest)
+
+    units = []
+    for part in [part + separator for part in parts[:-1]] + [parts[-1]]:
+        units.extend(_split_units(part, budget, rest))
+    return units
+
+
+def iter_chunks(pages, budget: int = None):
+    """
+    Split pages into chunks of at most budget tokens, lazily. Chunks end on page, paragraph or line boundaries when possible,
+    and consecutive small units (also from different pages) are packed into the same chunk.
+    Once a chunk has min_fill() of the budget, it ends at the next content defined boundary (`_is_boundary()`),
+    so editing a page changes only the chunks around it.
+    A chunk is yielded as soon as it is full, so analysis can start before later pages are extracted.
+
+    Args:
+        pages (Iterable[tuple[int, string]]): (page number, text) pairs, e.g. from `utils.iter_text_from_file()`.
+            Consecutive pairs with the same page number are parts of the same page.
+        budget (int, optional): Max tokens per chunk. Defaults to token_budget().
+
+    Yields:
+        string: Chunks in document order. Whitespace-only chunks are dropped.
+    """
+    budget = budget or token_budget()
+    min_tokens = budget * min_fill()
+
+    current = ""
+    current_tokens = 0
+    previous_page = None
+    for page_number, page_text in pages:
+        if previous_page is not None and page_number != previous_page:
+            page_text = "\f" + page_text
+        previous_page = page_number
+
+        for unit in _split_units(page_text, budget, SEPARATORS):
+            unit_tokens = estimate_tokens(unit)
+            if current_tokens + unit_tokens > budget and current.strip():
+                yield current.strip()
+                current = ""
+                current_tokens = 0
+            current += unit
+            current_tokens += unit_tokens
+            if current_tokens >= min_tokens and _is_boundary(unit):
+                yield current.strip()
+                current = ""
+                current_tokens = 0
+
+    if current.strip():
+        yield current.strip()
+
+
+def split_text(text: str, budget: int = None) -> list[str]:
+    """
+    Split text into chunks of at most budget tokens, see iter_chunks().
+
+    Args:
+        text (string): Text to split. Pages can be separated with form feeds ("\\f").
+        budget (int, optional): Max tokens per chunk. Defaults to token_budget().
+
+    Returns:
+        list[string]: Chunks in document order. Whitespace-only chunks are dropped.
+    """
+    return list(iter_chunks([(1, text)], budget))
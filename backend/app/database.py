@@ -3,6 +3,9 @@ from neo4j import GraphDatabase
 from dotenv import load_dotenv
 from enum import Enum
 from neo4j.time import DateTime
+from contextlib import contextmanager
+import functools
+import threading
 import time
 import os
 from uuid import UUID
@@ -18,6 +21,7 @@ class NodeLabels(Enum):
     PROJECT = ("Project", 'id')
     RESULT_BLUEPRINT = ("ResultBlueprint", 'id')
     USED_BLUEPRINT = ("UsedBlueprint", 'id')
+    ANSWER = ("Answer", 'id')
 
     def __init__(self, label, id):
         self.label = label
@@ -32,6 +36,7 @@ class _NodeRelationships(Enum):
     """
     RESULT_BLUEPRINT_TO_PROJECT = (NodeLabels.RESULT_BLUEPRINT, NodeLabels.PROJECT, "BELONGS_TO")
     USED_BLUEPRINT_TO_RESULT_BLUEPRINT = (NodeLabels.USED_BLUEPRINT, NodeLabels.RESULT_BLUEPRINT, "USED_IN_ANALYSIS")
+    ANSWER_TO_RESULT_BLUEPRINT = (NodeLabels.ANSWER, NodeLabels.RESULT_BLUEPRINT, "ANSWERS")
     PROJECT_TO_USER_SETTINGS = (NodeLabels.PROJECT, NodeLabels.USER_SETTINGS, "OWNED_BY")
     BLUEPRINT_TO_USER_SETTINGS = (NodeLabels.BLUEPRINT, NodeLabels.USER_SETTINGS, "OWNED_BY")
 
@@ -128,6 +133,303 @@ class NodeProperties:
         TEST_PASS = "test_pass"
         TEST_FAIL = "test_fail"
 
+
+    class Answer(Enum):
+        # Answer to one blueprint question in a structured result
+        # example FOO = "foo"
+        QUESTION = "question"
+        ANSWER = "answer"
+        POSITION = "position"
+
+        TEST_PASS = "test_pass"
+        TEST_FAIL = "test_fail"
+
+def _build_lookup_nodes_query(type, id_type, property_list, parent_type = None, parent_id_type = None, sort_property = None, sort_direction = 'DESC'):
+    """
+    Build __lookup_nodes() query. Parent id is given as $parent_id parameter.
+
+    Args:
+        type (string): Node label
+        id_type (string): Node id(property)
+        property_list (tuple[string]): properties to return after the id
+        parent_type (string, optional): Parent node label
+        parent_id_type (string, optional): Parent node id(property)
+        sort_property (string, optional): sorting property
+        sort_direction (string, optional): sorting direction ('DESC' or 'ASC')
+
+    Returns:
+        string: Cypher query
+    """
+    query_string = f"MATCH (n:{type}) "
+    if parent_type != None:
+        query_string += f"- [] -> (:{parent_type} {{{parent_id_type}: $parent_id}}) "
+    if sort_property:
+        query_string += f"WITH n ORDER BY n.{sort_property} {sort_direction} "
+    property_list_string = ''.join(", n." + item for item in property_list)
+    query_string += f"RETURN COLLECT ([n.{id_type}{property_list_string}]) AS list "
+    return query_string
+
+
+def _build_lookup_project_tree_query():
+    """
+    Build lookup_project_tree() query. One row per project, results collected with a subquery
+    and used blueprint with pattern comprehension. Answers of structured results are collected in question order.
+
+    Returns:
+        string: Cypher query
+    """
+    project_label = NodeLabels.PROJECT
+    result_label = NodeLabels.RESULT_BLUEPRINT
+    used_label = NodeLabels.USED_BLUEPRINT
+    belongs_to = _NodeRelationships.RESULT_BLUEPRINT_TO_PROJECT.relationship
+    used_in = _NodeRelationships.USED_BLUEPRINT_TO_RESULT_BLUEPRINT.relationship
+    answer_label = NodeLabels.ANSWER
+    answers = _NodeRelationships.ANSWER_TO_RESULT_BLUEPRINT.relationship
+
+    project_props = NodeProperties.Project
+    result_props = NodeProperties.ResultBlueprint
+    blueprint_props = NodeProperties.Blueprint
+    answer_props = NodeProperties.Answer
+
+    return (
+        f"MATCH (p:{project_label.label}) "
+        f"RETURN {{"
+            f"id: p.{project_label.id}, "
+            f"open: false, "
+            f"name: p.{project_props.NAME.value}, "
+            f"results: COLLECT {{ "
+                f"MATCH (r:{result_label.label}) - [:{belongs_to}] -> (p) "
+                f"WITH r, head([(u:{used_label.label}) - [:{used_in}] -> (r) | u]) AS u "
+                f"RETURN {{"
+                    f"id: r.{result_label.id}, "
+                    f"name: r.{result_props.NAME.value}, "
+                    f"filename: r.{result_props.FILENAME.value}, "
+                    f"result: r.{result_props.RESULT.value}, "
+                    f"blueprint: {{"
+                        f"id: u.{used_label.id}, "
+                        f"name: u.{blueprint_props.NAME.value}, "
+                        f"description: u.{blueprint_props.DESCRIPTION.value}, "
+                        f"questions: u.{blueprint_props.QUESTIONS.value}"
+                    f"}}, "
+                    f"answers: COLLECT {{ "
+                        f"MATCH (a:{answer_label.label}) - [:{answers}] -> (r) "
+                        f"RETURN {{"
+                            f"question: a.{answer_props.QUESTION.value}, "
+                            f"answer: a.{answer_props.ANSWER.value}"
+                        f"}} AS answer "
+                        f"ORDER BY a.{answer_props.POSITION.value} "
+                    f"}}"
+                f"}} AS result "
+                f"ORDER BY r.{result_props.DATETIME.value} DESC "
+            f"}}"
+        f"}} AS project "
+        f"ORDER BY p.{project_props.DATETIME.value} DESC"
+    )
+
+
+def _build_create_result_query():
+    """
+    Build create_result() query. FOREACH is used as conditional CREATE for the used blueprint,
+    and to create an answer node for each item of $answers.
+
+    Returns:
+        string: Cypher query
+    """
+    project_label = NodeLabels.PROJECT
+    result_label = NodeLabels.RESULT_BLUEPRINT
+    blueprint_label = NodeLabels.BLUEPRINT
+    used_label = NodeLabels.USED_BLUEPRINT
+    belongs_to = _NodeRelationships.RESULT_BLUEPRINT_TO_PROJECT.relationship
+    used_in = _NodeRelationships.USED_BLUEPRINT_TO_RESULT_BLUEPRINT.relationship
+    answer_label = NodeLabels.ANSWER
+    answers = _NodeRelationships.ANSWER_TO_RESULT_BLUEPRINT.relationship
+
+    return (
+        f"MATCH (p:{project_label.label} {{{project_label.id}: $project_id}}) "
+        f"SET p.{NodeProperties.Project.DATETIME.value} = $datetime "
+        f"CREATE (r:{result_label.label} {{{result_label.id}: randomUUID()}}) "
+        f"SET r += $properties "
+        f"CREATE (r) - [:{belongs_to}] -> (p) "
+        f"FOREACH (answer IN $answers | "
+            f"CREATE (a:{answer_label.label} {{{answer_label.id}: randomUUID()}}) "
+            f"SET a += answer "
+            f"CREATE (a) - [:{answers}] -> (r) "
+        f") "
+        f"WITH r "
+        f"OPTIONAL MATCH (b:{blueprint_label.label} {{{blueprint_label.id}: $blueprint_id}}) "
+        f"FOREACH (_ IN CASE WHEN b IS NULL THEN [] ELSE [1] END | "
+            f"CREATE (u:{used_label.label}) "
+            f"SET u = properties(b), u.{used_label.id} = randomUUID() "
+            f"CREATE (u) - [:{used_in}] -> (r) "
+        f") "
+        f"RETURN r.{result_label.id} AS id"
+    )
+
+
+def _build_lookup_answers_query():
+    """
+    Build lookup_answers() query. $question and $project_id filters are skipped when null.
+
+    Returns:
+        string: Cypher query
+    """
+    project_label = NodeLabels.PROJECT
+    result_label = NodeLabels.RESULT_BLUEPRINT
+    answer_label = NodeLabels.ANSWER
+    belongs_to = _NodeRelationships.RESULT_BLUEPRINT_TO_PROJECT.relationship
+    answers = _NodeRelationships.ANSWER_TO_RESULT_BLUEPRINT.relationship
+
+    result_props = NodeProperties.ResultBlueprint
+    answer_props = NodeProperties.Answer
+
+    return (
+        f"MATCH (a:{answer_label.label}) - [:{answers}] -> (r:{result_label.label}) - [:{belongs_to}] -> (p:{project_label.label}) "
+        f"WHERE ($question IS NULL OR a.{answer_props.QUESTION.value} = $question) "
+        f"AND ($project_id IS NULL OR p.{project_label.id} = $project_id) "
+        f"RETURN {{"
+            f"projectId: p.{project_label.id}, "
+            f"resultId: r.{result_label.id}, "
+            f"resultName: r.{result_props.NAME.value}, "
+            f"filename: r.{result_props.FILENAME.value}, "
+            f"question: a.{answer_props.QUESTION.value}, "
+            f"answer: a.{answer_props.ANSWER.value}"
+        f"}} AS answer "
+        f"ORDER BY r.{result_props.DATETIME.value} DESC, a.{answer_props.POSITION.value}"
+    )
+
+
+def _build_copy_node_query(type, id_type, type_new, id_type_new, suffix_property = None):
+    """
+    Build __copy_node() query. $properties are set on top of the copied ones.
+    With suffix_property, $suffix is appended to that property ($suffix_default used when it's empty).
+
+    Args:
+        type (string): Node label
+        id_type (string): Node id(property)
+        type_new (string): Node label for new one
+        id_type_new (string): Node id(property) for new one
+        suffix_property (string, optional): property to append $suffix to
+
+    Returns:
+        string: Cypher query
+    """
+    query_string = (
+        f"MATCH (n:{type} {{{id_type}: $id_value}}) "
+        f"CREATE (m:{type_new}) "
+        f"SET m = properties(n) "
+        f"SET m.{id_type_new} = coalesce($id_value_new, randomUUID()) "
+        f"SET m += $properties "
+    )
+    if suffix_property != None:
+        query_string += (
+            f"SET m.{suffix_property} = "
+            f"CASE WHEN coalesce(n.{suffix_property}, '') = '' THEN $suffix_default ELSE n.{suffix_property} END + $suffix "
+        )
+    query_string += f"RETURN m.{id_type_new} AS {id_type_new}"
+    return query_string
+
+
+# All queries used by Database. Only labels, property names and relationship types are formatted
+# into the query text, values are always passed as $parameters.
+# Either a str.format() template or a builder function taking the same keyword arguments.
+_QUERY_TEMPLATES = {
+    'create_unique_constraint': (
+        "CREATE CONSTRAINT {type}_{property_name}_unique IF NOT EXISTS "
+        "FOR (n:{type}) "
+        "REQUIRE n.{property_name} IS UNIQUE"
+    ),
+    'create_index': (
+        "CREATE INDEX {type}_{property_name}_index IF NOT EXISTS "
+        "FOR (n:{type}) "
+        "ON (n.{property_name})"
+    ),
+    'add_node': (
+        "CREATE (n:{type} {{{id_type}: randomUUID()}}) "
+        "SET n += $properties "
+        "RETURN n.{id_type} AS {id_type}"
+    ),
+    'add_node_with_id': (
+        "MERGE (n:{type} {{{id_type}: $id_value}}) "
+        "ON CREATE SET n += $properties "
+        "RETURN n.{id_type} AS {id_type}"
+    ),
+    # only creates when no node with the label exists yet, aggregation keeps one row to continue from
+    'add_singleton_node': (
+        "OPTIONAL MATCH (e:{type}) "
+        "WITH count(e) AS existing "
+        "WHERE existing = 0 "
+        "CREATE (n:{type} {{{id_type}: randomUUID()}}) "
+        "SET n += $properties "
+        "RETURN n.{id_type} AS {id_type}"
+    ),
+    'set_node_properties': (
+        "MATCH (n:{type} {{{id_type}: $id_value}}) "
+        "SET n += $properties "
+        "RETURN n.{id_type} AS {id_type}"
+    ),
+    'lookup_node_property': (
+        "MATCH (n:{type} {{{id_type}: $id_value}}) "
+        "RETURN n.{property_name} AS {property_name}"
+    ),
+    'lookup_nodes': _build_lookup_nodes_query,
+    'delete_node_with_connections': (
+        "MATCH (n:{type} {{{id_type}: $id_value}}) <- [*0..] - (d) "
+        "DETACH DELETE n "
+        "WITH DISTINCT d "
+        "DETACH DELETE d"
+    ),
+    'delete_node_with_connections_excluding': (
+        "MATCH (n:{type} {{{id_type}: $id_value}}) <- [r*0..] - (d) "
+        "WHERE NONE ( rel IN r WHERE type(rel) IN $exclude_relationships ) "
+        "DETACH DELETE n "
+        "WITH DISTINCT d "
+        "DETACH DELETE d"
+    ),
+    'delete_node': (
+        "MATCH (n:{type} {{{id_type}: $id_value}}) "
+        "DETACH DELETE n"
+    ),
+    'remove_property': (
+        "MATCH (n:{type} {{{id_type}: $id_value}}) "
+        "WHERE n.{property_name} IS NOT NULL "
+        "REMOVE n.{property_name} "
+        "RETURN n.{id_type} AS {id_type}"
+    ),
+    'connect_with_relationship': (
+        "MATCH (a:{type_a} {{{id_type_a}: $id_value_a}}) "
+        "MATCH (b:{type_b} {{{id_type_b}: $id_value_b}}) "
+        "MERGE (a)-[r:{relationship_type}]->(b) "
+        "RETURN type(r) AS relationship"
+    ),
+    'copy_node': _build_copy_node_query,
+    'lookup_project_tree': _build_lookup_project_tree_query,
+    'create_result': _build_create_result_query,
+    'lookup_answers': _build_lookup_answers_query,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _render_query(operation, **identifiers):
+    """
+    Render query from _QUERY_TEMPLATES. Memoized, so every (operation, identifiers) combination is rendered only once
+    and the same query text is sent every time, which lets Neo4j reuse its cached query plan.
+
+    Args:
+        operation (string): Key in _QUERY_TEMPLATES
+        **identifiers (string or tuple): Labels, property names and relationship types for the template. Must be hashable.
+
+    Raises:
+        KeyError: If operation or identifier is not found.
+
+    Returns:
+        string: Cypher query
+    """
+    template = _QUERY_TEMPLATES[operation]
+    if callable(template):
+        return template(**identifiers)
+    return template.format(**identifiers)
+
+
 class DatabaseMeta(type):
     """
     A metaclass for creating singleton classes.
@@ -153,15 +455,27 @@ class Database(metaclass=DatabaseMeta):
         Start up database driver and setup constraints.
         """
 
-        self.__driver = GraphDatabase.driver(os.getenv('DB_URL'), auth=(os.getenv('DB_USERNAME'), os.getenv('DB_PASSWORD')))
+        # Connection pool is shared by all sessions/transactions, tune it from env when needed
+        self.__driver = GraphDatabase.driver(
+            os.getenv('DB_URL'),
+            auth=(os.getenv('DB_USERNAME'), os.getenv('DB_PASSWORD')),
+            max_connection_pool_size=int(os.getenv('DB_MAX_CONNECTION_POOL_SIZE', 100)),
+            connection_acquisition_timeout=float(os.getenv('DB_CONNECTION_ACQUISITION_TIMEOUT', 60)),
+            max_connection_lifetime=float(os.getenv('DB_MAX_CONNECTION_LIFETIME', 3600)),
+        )
         self.__name = os.getenv('DB_NAME')
 
+        # Active transaction for each thread, see transaction()
+        self.__local = threading.local()
+
         ### setup constraints
         # special, user_name must be unique
         self.__create_unique_constraints(NodeLabels.USER_SETTINGS, NodeProperties.UserSettings.USER_NAME.value)
         # node identifier should always be unique (adds index by default)
         for node_label in NodeLabels:
             self.__create_unique_constraints(node_label, node_label.id)
+        # answers are filtered by question
+        self.__create_index(NodeLabels.ANSWER, NodeProperties.Answer.QUESTION.value)
 
 
 
@@ -197,6 +511,60 @@ class Database(metaclass=DatabaseMeta):
 
         return "Whole database printed out in console"
     
+    @contextmanager
+    def transaction(self):
+        """
+        Unit of work. Every Database call inside the block (in the same thread) is run in one explicit
+        transaction on one pooled connection. Commits when the block exits, rolls back if it raises.
+        Nested blocks join the outermost transaction.
+
+        Usage:
+            with database.transaction() as tx:
+                id = tx.add_node(NodeLabels.PROJECT)
+                tx.set_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo')
+
+        Yields:
+            Database: This same database instance, bound to the transaction.
+        """
+        # already inside a transaction, join it
+        if getattr(self.__local, 'tx', None) != None:
+            yield self
+            return
+
+        with self.__driver.session(database=self.__name) as session:
+            with session.begin_transaction() as tx:
+                self.__local.tx = tx
+                try:
+                    yield self
+                    tx.commit()
+                finally:
+                    # transaction is rolled back on close if it wasn't committed
+                    self.__local.tx = None
+
+
+    def __run(self, query_string, **parameters):
+        """
+        Run a query. Uses the active transaction if inside transaction(), otherwise an auto-commit session.
+
+        Args:
+            query_string (string): Cypher query
+            **parameters (Any): Query parameters
+
+        Returns:
+            tuple[list[Record], ResultSummary]: All returned records and the query summary.
+        """
+        tx = getattr(self.__local, 'tx', None)
+        if tx != None:
+            result = tx.run(query_string, parameters)
+            records = list(result)
+            return records, result.consume()
+
+        with self.__driver.session(database=self.__name) as session:
+            result = session.run(query_string, parameters)
+            records = list(result)
+            return records, result.consume()
+
+
     def __create_unique_constraints(self, node_label:NodeLabels, property_name:str):
         """
         Create unique constraint for specific node property.
@@ -213,33 +581,52 @@ class Database(metaclass=DatabaseMeta):
         Returns:
             None: This function does not return any value.
         """
+        query_string = _render_query('create_unique_constraint', type=node_label.label, property_name=property_name)
 
-        query_string = f"""
-        CREATE CONSTRAINT {node_label.label}_{property_name}_unique IF NOT EXISTS
-        FOR (n:{node_label.label})
-        REQUIRE n.{property_name} IS UNIQUE
+        try:
+            self.__run(query_string)
+
+        except Exception as e:
+            error_string = str(e)
+            raise RuntimeError( "Neo4j create_unique_constraints() error: " + error_string )
+
+
+    def __create_index(self, node_label:NodeLabels, property_name:str):
         """
+        Create index for specific node property.
+
+        Warning: Will not check property_name validity.
+
+        Args:
+            label (NodeLabels): Node label
+            property_name (string): Node property
+
+        Raises:
+            RuntimeError: If database query error.
+
+        Returns:
+            None: This function does not return any value.
+        """
+        query_string = _render_query('create_index', type=node_label.label, property_name=property_name)
 
         try:
-            with self.__driver.session() as session:
-                session.run(
-                    query_string,
-                    database=self.__name,
-                )
+            self.__run(query_string)
 
         except Exception as e:
             error_string = str(e)
-            raise RuntimeError( "Neo4j create_unique_constraints() error: " + error_string )
+            raise RuntimeError( "Neo4j create_index() error: " + error_string )
     
 
-    def __add_node(self, type, id_type, id_value = None):
+    def __add_node(self, type, id_type, id_value = None, properties = None, singleton = False):
         """
-        Create a node.
+        Create a node. Initial properties are set in the same query.
 
         Args:
             type (string): Node label
             id_type (string): Node property for id usage
             id_value (string, optional): Value for the id
+            properties (dict[string, Any], optional): property names and values for the new node
+            singleton (bool, optional): Only create if no node with this label exists. Ignored with id_value.
 
         Raises:
             RuntimeError: If database query error.
@@ -249,36 +636,24 @@ class Database(metaclass=DatabaseMeta):
                 - string containing ID value for the created node.
                 - None if node already exists.
         """
-        # check if node already exists
-        if id_value != None and self.__does_node_exist(type, id_type, id_value):
-            return None
-        
         # Try again if randomUUID() fails to give an unique value
         attempts = 0
         while attempts < 3:
 
-            if id_value == None:
-                query_string = (
-                    "CREATE (n:" + type + " {" + id_type + ": randomUUID()}) "
-                    "RETURN n." + id_type + " AS " + id_type
-                )
-            else:
+            if id_value != None:
                 id_value = str(id_value)
-                query_string = (
-                    "MERGE (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-                    "RETURN n." + id_type + " AS " + id_type
-                )
+                query_string = _render_query('add_node_with_id', type=type, id_type=id_type)
+            elif singleton:
+                query_string = _render_query('add_singleton_node', type=type, id_type=id_type)
+            else:
+                query_string = _render_query('add_node', type=type, id_type=id_type)
 
             try:
-                records = []
+                records, summary = self.__run(query_string, id_value=id_value, properties=properties or {})
 
-                with self.__driver.session() as session:
-                    result = session.run(
-                        query_string,
-                        database=self.__name,
-                    )
-                    for record in result:
-                        records.append(record)
+                # MERGE matched an existing node, or singleton already exists
+                if not records or summary.counters.nodes_created == 0:
+                    return None
 
                 return next(iter(records)).data()[id_type]
             
@@ -295,16 +670,15 @@ class Database(metaclass=DatabaseMeta):
                     raise RuntimeError( "Neo4j add_node() query failed: " + error_string )
             
 
-    def __set_node_property(self, type, id_type, id_value, property_name, new_data):
+    def __set_node_properties(self, type, id_type, id_value, properties):
         """
-        Create/modify specific node property with new data.
+        Create/modify multiple node properties at once with a single SET.
 
         Args:
             type (string): Node label
             id_type (string): Node id(property)
             id_value (string): Value for the id
-            property_name (string): property name to create/modify
-            new_data (Any): value for the property
+            properties (dict[string, Any]): property names and values to create/modify
 
         Raises:
             RuntimeError: If database query error.
@@ -314,27 +688,16 @@ class Database(metaclass=DatabaseMeta):
                 - True when query succeeded.
                 - False if node was not found.
         """
-        # check if node exists
-        if not self.__does_node_exist(type, id_type, id_value):
-            return False
-        
-        id_value = str(id_value)
-        query_string = (
-            "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-            "SET n." + property_name + " = $old_data" 
-        )
+        query_string = _render_query('set_node_properties', type=type, id_type=id_type)
         try:
-            with self.__driver.session() as session:
-                session.run(
-                    query_string,
-                    old_data=new_data,
-                    database=self.__name,
-                )
-            return True
-        
+            records, summary = self.__run(query_string, id_value=str(id_value), properties=properties)
+
+            # nothing returned if node wasn't matched
+            return len(records) > 0
+
         except Exception as e:
             error_string = str(e)
-            raise RuntimeError( "Neo4j set_property_value() query failed: " + error_string )
+            raise RuntimeError( "Neo4j set_node_properties() query failed: " + error_string )
     
 
     def __lookup_node_property(self, type, id_type, id_value, property_name):
@@ -355,22 +718,10 @@ class Database(metaclass=DatabaseMeta):
                 - Any if found, single node property data.
                 - None if nothing was found.
         """
-        id_value = str(id_value)
-        query_string = (
-            "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-            "RETURN n." + property_name + " AS " + property_name
-        )
+        query_string = _render_query('lookup_node_property', type=type, id_type=id_type, property_name=property_name)
 
         try:
-            records = []
-
-            with self.__driver.session() as session:
-                result = session.run(
-                    query_string,
-                    database=self.__name,
-                )
-                for record in result:
-                    records.append(record)
+            records, summary = self.__run(query_string, id_value=str(id_value))
 
             try:
                 return next(iter(records)).data()[property_name]
@@ -409,39 +760,30 @@ class Database(metaclass=DatabaseMeta):
                 - [ID, property_name value] A list of found nodes with ID and wanted property combination.
                 - [] if nothing was found.
         """
-        # sorting string
-        sorting_string = '' # this will be used if no sorting property detected
         if (sort_direction != 'DESC' and sort_direction != 'ASC'):
             raise RuntimeError( "__lookup_nodes() sort_direction invalid value: " + sort_direction )
-        if sort_property:
-            sorting_string = f"WITH n ORDER BY n.{sort_property} {sort_direction} "
-
-        # make string from property list
-        property_list_string = ''
-        for item in property_list:
-            property_list_string = property_list_string + ", n." + item
-
-        query_string =''
-        if parent_info == None:
-            query_string += f"MATCH (n:{type}) "
-            query_string += sorting_string
-            query_string += f"RETURN COLLECT ([n.{id_type}{property_list_string}]) AS list "
 
-        else:
-            query_string += f"MATCH (n:{type}) - [] -> (:{parent_info['node_type']} {{{parent_info['id_type']}: '{parent_info['id_value']}'}}) "
-            query_string += sorting_string
-            query_string += f"RETURN COLLECT ([n.{id_type}{property_list_string}]) AS list "
+        parent_type = None
+        parent_id_type = None
+        parent_id = None
+        if parent_info != None:
+            parent_type = parent_info['node_type']
+            parent_id_type = parent_info['id_type']
+            parent_id = str(parent_info['id_value'])
+
+        query_string = _render_query(
+            'lookup_nodes',
+            type=type,
+            id_type=id_type,
+            property_list=tuple(property_list),
+            parent_type=parent_type,
+            parent_id_type=parent_id_type,
+            sort_property=sort_property,
+            sort_direction=sort_direction,
+        )
 
         try:
-            records = []
-
-            with self.__driver.session() as session:
-                result = session.run(
-                    query_string,
-                    database=self.__name,
-                )
-                for record in result:
-                    records.append(record)
+            records, summary = self.__run(query_string, parent_id=parent_id)
       
             try:
                 # gives out [[ ]]
@@ -475,49 +817,22 @@ class Database(metaclass=DatabaseMeta):
                 - True when query succeeded.
                 - False if node doesn't exists.
         """
-        # check if node exists
-        if not self.__does_node_exist(label, id_type, id_value):
-            return False
-
-        id_value = str(id_value)
-
-        # Supporting: None, string list, single string
-        # TODO: something wrong here if trying to use exclusion
+        # Supporting: None, string list, single string. Excluded relationships are given as a list parameter.
         if exclude_relationships == None:
-            query_string = (
-                "MATCH (n:" + label + " {" + id_type + ": '" + id_value + "'}) <- [*0..] - (d) "
-                "DETACH DELETE n "
-                "WITH DISTINCT d "
-                "DETACH DELETE d"
-            )
-        elif isinstance(exclude_relationships,list) and all(isinstance(item,str) for item in list):
-            exclude_relationships = "','".join(exclude_relationships)
-            query_string = (
-                "MATCH (n:" + label + " {" + id_type + ": '" + id_value + "'}) <- [r*0..] - (d) "
-                "WHERE NONE ( rel IN r WHERE type(rel) IN ['"+ exclude_relationships + "']) "
-                "DETACH DELETE n "
-                "WITH DISTINCT d "
-                "DETACH DELETE d"
-            )
+            query_string = _render_query('delete_node_with_connections', type=label, id_type=id_type)
+        elif isinstance(exclude_relationships,list) and all(isinstance(item,str) for item in exclude_relationships):
+            query_string = _render_query('delete_node_with_connections_excluding', type=label, id_type=id_type)
         elif isinstance(exclude_relationships,str):
-            query_string = (
-                "MATCH (n:" + label + " {" + id_type + ": '" + id_value + "'}) <- [r*0..] - (d) "
-                "WHERE NONE ( rel IN r WHERE type(rel) = '"+ exclude_relationships + "') "
-                "DETACH DELETE n "
-                "WITH DISTINCT d "
-                "DETACH DELETE d"
-            )
+            exclude_relationships = [exclude_relationships]
+            query_string = _render_query('delete_node_with_connections_excluding', type=label, id_type=id_type)
         else:
-            return TypeError( "Invalid exclude_relationships type: " + type(exclude_relationships) )
+            raise TypeError( "Invalid exclude_relationships type: " + str(type(exclude_relationships)) )
         
         try:
-            with self.__driver.session() as session:
-                session.run(
-                    query_string,
-                    database=self.__name,
-                )
+            records, summary = self.__run(query_string, id_value=str(id_value), exclude_relationships=exclude_relationships)
 
-            return True
+            # nothing deleted if node wasn't matched
+            return summary.counters.nodes_deleted > 0
 
         except Exception as e:
             error_string = str(e)
@@ -541,24 +856,13 @@ class Database(metaclass=DatabaseMeta):
                 - True when query succeeded.
                 - False when node doesn't exist.
         """
-        # check if node exists
-        if not self.__does_node_exist(type, id_type, id_value):
-            return False
-
-        id_value = str(id_value)
-        query_string = (
-            "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-            "DETACH DELETE n"
-        )
+        query_string = _render_query('delete_node', type=type, id_type=id_type)
         
         try:
-            with self.__driver.session() as session:
-                session.run(
-                    query_string,
-                    database=self.__name,
-                )
+            records, summary = self.__run(query_string, id_value=str(id_value))
 
-            return True
+            # nothing deleted if node wasn't matched
+            return summary.counters.nodes_deleted > 0
 
         except Exception as e:
             error_string = str(e)
@@ -583,24 +887,13 @@ class Database(metaclass=DatabaseMeta):
                 - True when query succeeded.
                 - False when property doesn't exist.
         """
-        # check if property exists
-        if not self.__does_property_exist(type, id_type, id_value, property_name):
-            return False
-
-        id_value = str(id_value)
-        query_string = (
-            "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-            "REMOVE n." + property_name
-        )
+        query_string = _render_query('remove_property', type=type, id_type=id_type, property_name=property_name)
         
         try:
-            with self.__driver.session() as session:
-                session.run(
-                    query_string,
-                    database=self.__name,
-                )
+            records, summary = self.__run(query_string, id_value=str(id_value))
 
-            return True
+            # nothing returned if node or property wasn't matched
+            return len(records) > 0
 
         except Exception as e:
             error_string = str(e)
@@ -630,37 +923,27 @@ class Database(metaclass=DatabaseMeta):
                 - True when query succeeded.
                 - False when either of the nodes doesn't exist.
         """
-        # check if node a exists
-        if not self.__does_node_exist(type_a, id_type_a, id_value_a):
-            return False
-        
-        # check if node b exists
-        if not self.__does_node_exist(type_b, id_type_b, id_value_b):
-            return False
-
-        id_value_a = str(id_value_a)
-        id_value_b = str(id_value_b)
-        query_string = (
-            "MATCH (a:" + type_a + " {" + id_type_a + ": '" + id_value_a + "'}) "
-            "MATCH (b:" + type_b + " {" + id_type_b + ": '" + id_value_b + "'}) "
-            "MERGE (a)-[r:" + relationship_type + "]->(b)"
+        query_string = _render_query(
+            'connect_with_relationship',
+            type_a=type_a,
+            id_type_a=id_type_a,
+            type_b=type_b,
+            id_type_b=id_type_b,
+            relationship_type=relationship_type,
         )
 
         try:
-            with self.__driver.session() as session:
-                session.run(
-                    query_string,
-                    database=self.__name,
-                )
+            records, summary = self.__run(query_string, id_value_a=str(id_value_a), id_value_b=str(id_value_b))
 
-            return True
+            # nothing returned if either of the nodes wasn't matched
+            return len(records) > 0
 
         except Exception as e:
             error_string = str(e)
             raise RuntimeError( "Neo4j connect_with_relationship() query failed: " + error_string )
 
    
-    def __copy_node(self, type, id_type, id_value, node_type_new, id_type_new, id_value_new = None):
+    def __copy_node(self, type, id_type, id_value, node_type_new, id_type_new, id_value_new = None, properties = None, suffix_property = None, suffix = '', suffix_default = ''):
         """return id of new node when copy succeeded, None if failed
         new id value is optional
         Copy node into a new node label.
@@ -674,6 +957,11 @@ class Database(metaclass=DatabaseMeta):
             id_type_new (string): Node id(property) for new one
             id_value_new (string, optional): Value for the id
 
+            properties (dict[string, Any], optional): property names and values to override on the copy
+            suffix_property (string, optional): property to append suffix to on the copy
+            suffix (string, optional): appended to suffix_property
+            suffix_default (string, optional): used instead of an empty/missing suffix_property value
+
         Raises:
             RuntimeError: If database query error.
 
@@ -685,37 +973,27 @@ class Database(metaclass=DatabaseMeta):
         attempts = 0
         while attempts < 3:
 
-            id_value = str(id_value)
-            if id_value_new == None:
-                query_string = (
-                    "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-                    "CREATE (m:" + node_type_new + ") "
-                    "SET m = properties(n) "
-                    "SET m." + id_type_new + " = randomUUID() "
-                    "RETURN m." + id_type + " AS " + id_type
+            # new id is randomUUID() when id_value_new is None
+            query_string = _render_query(
+                'copy_node',
+                type=type,
+                id_type=id_type,
+                type_new=node_type_new,
+                id_type_new=id_type_new,
+                suffix_property=suffix_property,
             )
-            else:
-                id_value_new = str(id_value_new)
-                query_string = (
-                    "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
-                    "CREATE (m:" + node_type_new + " ) "
-                    "SET m = properties(n) "
-                    "SET m." + id_type_new + " = '" + id_value_new + "' "
-                    "RETURN m." + id_type_new + " AS " + id_type_new
-                )
 
             try:
-                records = []
-
-                with self.__driver.session() as session:
-                    result = session.run(
-                        query_string,
-                        database=self.__name,
-                    )
-                    for record in result:
-                        records.append(record)
+                records, summary = self.__run(
+                    query_string,
+                    id_value=str(id_value),
+                    id_value_new=str(id_value_new) if id_value_new != None else None,
+                    properties=properties or {},
+                    suffix=suffix,
+                    suffix_default=suffix_default,
+                )
 
-                return next(iter(records)).data()[id_type]
+                return next(iter(records)).data()[id_type_new]
             
             except Exception as e:
                 error_string = str(e)
@@ -728,98 +1006,34 @@ class Database(metaclass=DatabaseMeta):
                     raise RuntimeError(f"Neo4j copy_node() failed to create node after 3 attempts: "  + error_string )
                 else:
                     raise RuntimeError( "Neo4j copy_node() query failed: " + error_string )
-                
 
 
-   
-    def __does_property_exist(self, type, id_type, id_value, property_name):
+    def __helper_get_property_enum_class(self, node_label:NodeLabels):
         """
-        Check if node with specific node label and property value exists
+        Helper function to dynamically get the property enum class for a node_label.
 
-        Args:
-            type (string): Node label
-            id_type (string): Node id(property)
-            id_value (string): Value for the id
-            property_name (string): property name to check
-
-        Raises:
-            RuntimeError: If database query error.
-
-        Returns:
-            bool:
-                - True if property was found.
-                - False if not found.
-        """
-        id_value = str(id_value)
-        query_string = (
-            "MATCH (a:" + type + " {" + id_type + ": '" + id_value + "'}) "
-            "WHERE a." + property_name + " IS NOT NULL "
-            "RETURN a"
-        )
-
-        try:
-            records = []
-
-            with self.__driver.session() as session:
-                result = session.run(
-                    query_string,
-                    database=self.__name,
-                )
-                for record in result:
-                    records.append(record)
-
-            if not records:
-                return False
-            else:
-                return True
-            
-        except Exception as e:
-            error_string = str(e)
-            raise RuntimeError( "Neo4j does_property_exist() query failed: " + error_string )
-        
-    def __does_node_exist(self, type, id_type, id_value):
-        """
-        Check if node exists with specific node label and id value
-
-        Args:
-            type (string): Node label
-            id_type (string): Node id(property)
-            id_value (string): Value for the id
+        Parameters:
+            node_label (NodeLabels): The node label to get the corresponding property enum class for.
 
         Raises:
-            RuntimeError: If database query error.
+            ValueError: If the property enum class doesn't exist.
 
         Returns:
-            bool:
-                - True if node was found.
-                - False if not found.
+            properties_enum_class (Enum): The corresponding property enum class for the node_label.
         """
-        id_value = str(id_value)
-        query_string = (
-            "MATCH (a:" + type + " {" + id_type + ": '" + id_value + "'}) "
-            "RETURN a"
-        )
-
-        try:
-            records = []
+        # Used variants should have access to normal variant enums
+        alias_mapping = {
+            NodeLabels.USED_BLUEPRINT: NodeLabels.BLUEPRINT
+        }
+        resolved_node_label = alias_mapping.get(node_label, node_label)
 
-            with self.__driver.session() as session:
-                result = session.run(
-                    query_string,
-                    database=self.__name,
-                )
-                for record in result:
-                    records.append(record)
+        # Dynamically get the corresponding property enum class
+        properties_enum_class = getattr(NodeProperties, resolved_node_label.label, None)
 
-            if not records:
-                return False
-            else:
-                return True
-            
-        except Exception as e:
-            error_string = str(e)
-            raise RuntimeError( "Neo4j does_node_exist() query failed: " + error_string )
+        if not properties_enum_class:
+            raise ValueError(f"No properties defined for node label {node_label.label}")
 
+        return properties_enum_class
 
     def __helper_get_property_enum_and_validate(self, node_label:NodeLabels, property_name:Enum):
         """
@@ -835,17 +1049,7 @@ class Database(metaclass=DatabaseMeta):
         Returns:
             properties_enum_class (Enum): The corresponding property enum class for the node_label.
         """
-        # Used variants should have access to normal variant enums
-        alias_mapping = {
-            NodeLabels.USED_BLUEPRINT: NodeLabels.BLUEPRINT
-        }
-        resolved_node_label = alias_mapping.get(node_label, node_label)
-
-        # Dynamically get the corresponding property enum class
-        properties_enum_class = getattr(NodeProperties, resolved_node_label.label, None)
-
-        if not properties_enum_class:
-            raise ValueError(f"No properties defined for node label {node_label.label}")
+        properties_enum_class = self.__helper_get_property_enum_class(node_label)
         
         # If property_name is passed as a string, we will dynamically retrieve the property
         if isinstance(property_name, str):
@@ -888,12 +1092,7 @@ class Database(metaclass=DatabaseMeta):
                 - string containing ID value for the created node.
                 - None if node already exists.
         """
-        # this node should only have one instance
-        if node_label == NodeLabels.GLOBAL_SETTINGS:
-            if self.__lookup_nodes(node_label.label, node_label.id, []) != []:
-                return None
-
-        id = self.__add_node(node_label.label, node_label.id)
+        properties = {}
 
         # only add DATETIME on following
         if node_label in [
@@ -903,11 +1102,12 @@ class Database(metaclass=DatabaseMeta):
         ]:
             # Make sure DATETIME is found for node_label
             datetime_property = self.__helper_get_property_enum_and_validate(node_label, 'DATETIME')
-           
-            self.set_node_property(id, node_label, datetime_property, DateTime.now())
+            properties[datetime_property.value] = DateTime.now()
 
+        # this node should only have one instance
+        singleton = node_label == NodeLabels.GLOBAL_SETTINGS
 
-        return id
+        return self.__add_node(node_label.label, node_label.id, properties=properties, singleton=singleton)
 
     def set_node_property(self, id:UUID, node_label:NodeLabels, property_name: Enum, new_data: Any):
         """
@@ -928,25 +1128,55 @@ class Database(metaclass=DatabaseMeta):
                 - True when query succeeded.
                 - False if node was not found or cannot be modified.
         """ 
+        # DATETIME (modified) is updated in the same query
+        return self.set_node_properties(id, node_label, {property_name: new_data})
+
+    def set_node_properties(self, id:UUID, node_label:NodeLabels, properties:dict[Enum, Any]):
+        """
+        Create/modify multiple node properties with a single query. DATETIME is refreshed once, similar to set_node_property().
+
+        Args:
+            id (UUID): Node identifier
+            node_label (NodeLabels): Node label
+            properties (dict[Enum, Any]): property names and values to create/modify, names can also be given as strings (e.g. 'NAME')
+
+        Raises:
+            RuntimeError: If database query error.
+            ValueError: If any of the property names is invalid for the given node_label
+
+        Returns:
+            bool:
+                - True when query succeeded.
+                - False if node was not found or cannot be modified.
+        """
         # not allowed to be modified
         if node_label in [
             NodeLabels.USED_BLUEPRINT,
         ]:
             return False
 
-        # Check that node_label has property_name
-        self.__helper_get_property_enum_and_validate(node_label, property_name)
+        # Check that node_label has every property, names given as strings are converted to the enum
+        validated_properties = {}
+        for property_name, new_data in properties.items():
+            property_enum = self.__helper_get_property_enum_and_validate(node_label, property_name)
+            if isinstance(property_name, str):
+                property_name = property_enum
+            validated_properties[property_name.value] = new_data
 
-        # Update datetime (modified), similar to add_node()
+        new_properties = {}
+
+        # Update datetime (modified), given DATETIME overrides it
         if node_label in [
             NodeLabels.BLUEPRINT,
             NodeLabels.PROJECT,
             NodeLabels.RESULT_BLUEPRINT,
         ]:
             datetime_property = self.__helper_get_property_enum_and_validate(node_label, 'DATETIME')
-            self.__set_node_property(node_label.label, node_label.id, id, datetime_property.value, DateTime.now())
+            new_properties[datetime_property.value] = DateTime.now()
+
+        new_properties.update(validated_properties)
 
-        return self.__set_node_property(node_label.label, node_label.id, id, property_name.value, new_data)
+        return self.__set_node_properties(node_label.label, node_label.id, id, new_properties)
 
     def remove_node_property(self, id:UUID, node_label:NodeLabels, property_name:Enum):
         """
@@ -1014,6 +1244,7 @@ class Database(metaclass=DatabaseMeta):
         # Deletion not allowed
         if node_label in [
             NodeLabels.USED_BLUEPRINT, # deleted when result is deleted
+            NodeLabels.ANSWER, # deleted when result is deleted
         ]:
             return False
         
@@ -1021,7 +1252,7 @@ class Database(metaclass=DatabaseMeta):
         if node_label in [
             NodeLabels.USER_SETTINGS, # everything related to this user is deleted and anything beyond
             NodeLabels.PROJECT, # results also deleted and anything beyond
-            NodeLabels.RESULT_BLUEPRINT, # used_blueprints also deleted
+            NodeLabels.RESULT_BLUEPRINT, # used_blueprints and answers also deleted
         ]:
             return self.__delete_node_with_connections(node_label.label, node_label.id, id)
         else:
@@ -1094,6 +1325,167 @@ class Database(metaclass=DatabaseMeta):
         return self.__lookup_nodes(node_label.label, node_label.id, property_list, parent_info, sort_property, sort_direction)
     
 
+    def lookup_nodes_with_properties(self, node_label:NodeLabels, properties:list[Enum], parent_label:NodeLabels = None, parent_id:UUID = None):
+        """
+        Lookup nodes with all requested properties in a single query. Sorting the result by DATETIME DESC when present.
+
+        Args:
+            node_label (NodeLabels): Node label
+            properties (list[Enum]): property names to return for each node
+            parent_label (NodeLabels, optional): Parent label for searching under specific node
+            parent_id (UUID, optional): Id value of parent node
+
+        Raises:
+            RuntimeError: If database query error.
+            ValueError: If any of the properties is invalid for the given node_label.
+
+        Returns:
+            list[dict] or []:
+                - list[dict] A list of found nodes [{'id': ID, property.value: value, ...}].
+                - [] if nothing was found.
+        """
+        # Check that node_label has every property
+        for property_name in properties:
+            self.__helper_get_property_enum_and_validate(node_label, property_name)
+        property_list = [property_name.value for property_name in properties]
+
+        parent_info = None
+        if parent_label != None:
+            parent_info = { "node_type" : parent_label.label, "id_type" : parent_label.id, "id_value" : parent_id }
+
+        sort_property = None
+        datetime_property = getattr(self.__helper_get_property_enum_class(node_label), 'DATETIME', None)
+        if datetime_property != None:
+            sort_property = datetime_property.value
+
+        nodes = self.__lookup_nodes(node_label.label, node_label.id, property_list, parent_info, sort_property)
+
+        # [[ID, property_list]] -> [{'id': ID, property: value}]
+        keys = [node_label.id] + property_list
+        return [dict(zip(keys, node)) for node in nodes]
+
+    def lookup_project_tree(self):
+        """
+        Lookup all projects with their results and used blueprints in a single query.
+        Projects and results are sorted by DATETIME DESC.
+
+        Shaped exactly like '/get_projects' response, so it can be passed to jsonify() as is.
+        If result doesn't have a used blueprint, its blueprint values are None.
+
+        Raises:
+            RuntimeError: If database query error.
+
+        Returns:
+            list[dict] or []:
+                - list[dict] A list of projects [{id, open, name, results: [{id, name, filename, result, blueprint: {id, name, description, questions}, answers: [{question, answer}]}]}].
+                - [] if nothing was found.
+        """
+        query_string = _render_query('lookup_project_tree')
+
+        try:
+            records, summary = self.__run(query_string)
+
+            return [record.data()['project'] for record in records]
+
+        except Exception as e:
+            error_string = str(e)
+            raise RuntimeError( "Neo4j lookup_project_tree() query failed: " + error_string )
+
+
+    def create_result(self, name:str, filename:str, result:str, project_id:UUID, blueprint_id:UUID = None, answers:list[dict] = None):
+        """
+        Create a result under a project in a single query. Sets the result properties and DATETIME,
+        connects it to the project, copies the blueprint as its used blueprint, creates an answer node
+        for each answer of a structured result and refreshes project DATETIME.
+        Nothing is created if the project doesn't exist.
+
+        Args:
+            name (string): User-given name of the result.
+            filename (string): Name of the analyzed file. Can be None.
+            result (string): The analysis result text.
+            project_id (UUID): Id of the project to save the result under.
+            blueprint_id (UUID, optional): Id of the blueprint used in the analysis.
+                Used blueprint is not created if None or not found (automatic blueprint).
+            answers (list[dict], optional): Answers of a structured result [{"question": ..., "answer": ...}] in question order.
+
+        Raises:
+            RuntimeError: If database query error.
+
+        Returns:
+            string or None:
+                - string containing ID value for the created result node.
+                - None if project was not found.
+        """
+        now = DateTime.now()
+        properties = {
+            NodeProperties.ResultBlueprint.NAME.value: name,
+            NodeProperties.ResultBlueprint.FILENAME.value: filename,
+            NodeProperties.ResultBlueprint.RESULT.value: result,
+            NodeProperties.ResultBlueprint.DATETIME.value: now,
+        }
+        answer_properties = [
+            {
+                NodeProperties.Answer.QUESTION.value: answer['question'],
+                NodeProperties.Answer.ANSWER.value: answer['answer'],
+                NodeProperties.Answer.POSITION.value: position,
+            }
+            for position, answer in enumerate(answers or [])
+        ]
+
+        query_string = _render_query('create_result')
+
+        try:
+            records, summary = self.__run(
+                query_string,
+                project_id=str(project_id),
+                blueprint_id=str(blueprint_id) if blueprint_id != None else None,
+                datetime=now,
+                properties=properties,
+                answers=answer_properties,
+            )
+
+            if not records:
+                return None
+            return records[0].data()['id']
+
+        except Exception as e:
+            error_string = str(e)
+            raise RuntimeError( "Neo4j create_result() query failed: " + error_string )
+
+
+    def lookup_answers(self, question:str = None, project_id:UUID = None):
+        """
+        Lookup answers of structured results in a single query, optionally only answers to one question
+        and/or under one project. Sorted by result DATETIME DESC, then in question order.
+
+        Args:
+            question (string, optional): Only answers to this question.
+            project_id (UUID, optional): Only answers of results under this project.
+
+        Raises:
+            RuntimeError: If database query error.
+
+        Returns:
+            list[dict] or []:
+                - list[dict] A list of answers [{projectId, resultId, resultName, filename, question, answer}].
+                - [] if nothing was found.
+        """
+        query_string = _render_query('lookup_answers')
+
+        try:
+            records, summary = self.__run(
+                query_string,
+                question=question,
+                project_id=str(project_id) if project_id != None else None,
+            )
+
+            return [record.data()['answer'] for record in records]
+
+        except Exception as e:
+            error_string = str(e)
+            raise RuntimeError( "Neo4j lookup_answers() query failed: " + error_string )
+
+
     def copy_node_to_node(self, from_id:UUID, from_label:NodeLabels, to_label:NodeLabels):
         """
         Copies node into another node. Only supports copies between Blueprint <-> Used_Blueprint.
@@ -1116,15 +1508,17 @@ class Database(metaclass=DatabaseMeta):
         else:
             raise RuntimeError( "Unsupported copy attempt: " + from_label.label + " to " + to_label.label)
         
-        result = self.__copy_node(from_label.label, from_label.id, from_id, to_label.label, to_label.id)
-
-        # give "_used" tag and fresh DATETIME when copying back to blueprint
+        # give "_used" tag and fresh DATETIME when copying back to blueprint, in the same query
         if from_label == NodeLabels.USED_BLUEPRINT and to_label == NodeLabels.BLUEPRINT:
-            name = self.lookup_node_property(result, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME)
-            self.set_node_property(result, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, (name or "blueprint") + "_used")
-            self.set_node_property(result, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.DATETIME, DateTime.now())
+            return self.__copy_node(
+                from_label.label, from_label.id, from_id, to_label.label, to_label.id,
+                properties={NodeProperties.Blueprint.DATETIME.value: DateTime.now()},
+                suffix_property=NodeProperties.Blueprint.NAME.value,
+                suffix="_used",
+                suffix_default="blueprint",
+            )
 
-        return result
+        return self.__copy_node(from_label.label, from_label.id, from_id, to_label.label, to_label.id)
         
 
     def connect_node_to_node(self, from_id:UUID, from_label:NodeLabels, to_id:UUID, to_label:NodeLabels):
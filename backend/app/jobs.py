@@ -0,0 +1,357 @@
+"""
+Background jobs for long running work such as LLM analysis.
+
+Jobs are run by an in-process worker pool with a bounded queue by default. Set JOB_BACKEND=celery to
+send them to Celery workers instead (broker from CELERY_BROKER_URL, e.g. redis://redis:6379/0), start
+the workers with: celery -A app.jobs:celery_app worker
+"""
+import importlib
+import os
+import queue
+import threading
+import time
+import uuid
+from enum import Enum
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_RESULT_TTL = 3600 # seconds a finished job is kept for status/result lookups
+
+
+class JobStatus(Enum):
+    """
+    States of a job. Value is what the API reports.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when a job is submitted while the queue is full.
+    """
+    pass
+
+
+# job being run by the current worker thread, see report_progress()
+_current = threading.local()
+
+
+def report_progress(progress: float, stage: str = None):
+    """
+    Report progress of the job run by the calling thread. Does nothing when called outside of a job,
+    so job functions can also be called directly.
+
+    Args:
+        progress (float): Progress between 0.0 and 1.0.
+        stage (string, optional): Short description of the current step, e.g. "extracting".
+    """
+    reporter = getattr(_current, 'reporter', None)
+    if reporter != None:
+        reporter(progress, stage)
+
+
+def _function_path(function):
+    """
+    Importable "module:name" path of a module level function.
+    """
+    return f"{function.__module__}:{function.__qualname__}"
+
+
+def _resolve_function(path):
+    """
+    Import a function from a _function_path() string.
+    """
+    module_name, function_name = path.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class JobQueue():
+    """
+    In-process job queue. A fixed number of daemon worker threads take jobs from a bounded queue,
+    so the web worker returns right after submit() and the number of concurrent analyses is capped
+    by the pool size instead of the number of web workers.
+    Should be initialized once and used through one instance.
+    """
+    def __init__(self, workers: int = None, queue_size: int = None, result_ttl: float = None):
+        """
+        Start the worker threads.
+
+        Args:
+            workers (int, optional): Number of worker threads. Defaults to JOB_WORKERS env or DEFAULT_WORKERS.
+            queue_size (int, optional): Max queued (not yet running) jobs. Defaults to JOB_QUEUE_SIZE env or DEFAULT_QUEUE_SIZE.
+            result_ttl (float, optional): Seconds finished jobs are kept. Defaults to JOB_RESULT_TTL env or DEFAULT_RESULT_TTL.
+        """
+        self.__workers = workers or int(os.getenv('JOB_WORKERS', DEFAULT_WORKERS))
+        self.__queue = queue.Queue(maxsize=queue_size or int(os.getenv('JOB_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+        self.__result_ttl = result_ttl if result_ttl != None else float(os.getenv('JOB_RESULT_TTL', DEFAULT_RESULT_TTL))
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+
+        for i in range(self.__workers):
+            thread = threading.Thread(target=self.__worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+
+    def submit(self, function, *args, **kwargs) -> str:
+        """
+        Queue function(*args, **kwargs) to be run by a worker.
+
+        Args:
+            function (callable): Function to run. Can call report_progress() while running.
+            *args, **kwargs: Arguments for the function.
+
+        Raises:
+            QueueFullError: If the queue is full.
+
+        Returns:
+            string: Job id for status() and result().
+        """
+        self.__purge_expired()
+
+        job_id = str(uuid.uuid4())
+        job = {
+            'id': job_id,
+            'status': JobStatus.QUEUED,
+            'progress': 0.0,
+            'stage': None,
+            'result': None,
+            'error': None,
+            'finished': None,
+        }
+        with self.__lock:
+            self.__jobs[job_id] = job
+
+        try:
+            self.__queue.put_nowait((job, function, args, kwargs))
+        except queue.Full:
+            with self.__lock:
+                del self.__jobs[job_id]
+            raise QueueFullError("Job queue is full")
+
+        return job_id
+
+    def status(self, job_id: str) -> dict:
+        """
+        Get job status.
+
+        Args:
+            job_id (string): Job id from submit().
+
+        Returns:
+            dict or None:
+                - {id, status, progress, stage, error} of the job.
+                - None if job was not found.
+        """
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job == None:
+                return None
+            return {
+                'id': job['id'],
+                'status': job['status'].value,
+                'progress': job['progress'],
+                'stage': job['stage'],
+                'error': job['error'],
+            }
+
+    def result(self, job_id: str):
+        """
+        Get job result.
+
+        Args:
+            job_id (string): Job id from submit().
+
+        Returns:
+            tuple[JobStatus, Any] or None:
+                - (status, return value of the job function). Return value is None until status is DONE.
+                - None if job was not found.
+        """
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job == None:
+                return None
+            return job['status'], job['result']
+
+    def pending(self) -> int:
+        """
+        Returns:
+            int: Number of queued jobs waiting for a worker.
+        """
+        return self.__queue.qsize()
+
+    def __worker(self):
+        """
+        Worker thread loop.
+        """
+        while True:
+            job, function, args, kwargs = self.__queue.get()
+
+            def reporter(progress, stage):
+                with self.__lock:
+                    job['progress'] = progress
+                    job['stage'] = stage
+
+            with self.__lock:
+                job['status'] = JobStatus.RUNNING
+            _current.reporter = reporter
+
+            try:
+                result = function(*args, **kwargs)
+                with self.__lock:
+                    job['result'] = result
+                    job['progress'] = 1.0
+                    job['status'] = JobStatus.DONE
+                    job['finished'] = time.monotonic()
+            except Exception as e:
+                with self.__lock:
+                    job['error'] = str(e)
+                    job['status'] = JobStatus.FAILED
+                    job['finished'] = time.monotonic()
+            finally:
+                _current.reporter = None
+                self.__queue.task_done()
+
+    def __purge_expired(self):
+        """
+        Forget finished jobs older than result_ttl.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            expired = [
+                job_id for job_id, job in self.__jobs.items()
+                if job['finished'] != None and now - job['finished'] > self.__result_ttl
+            ]
+            for job_id in expired:
+                del self.__jobs[job_id]
+
+
+class CeleryJobQueue():
+    """
+    Same interface as JobQueue, but jobs are sent to Celery workers through the broker.
+    Job functions must be module level functions, they are imported by name in the worker.
+    """
+    # Celery states mapped to JobStatus
+    _STATES = {
+        'PENDING': JobStatus.QUEUED,
+        'RECEIVED': JobStatus.QUEUED,
+        'RETRY': JobStatus.QUEUED,
+        'STARTED': JobStatus.RUNNING,
+        'PROGRESS': JobStatus.RUNNING,
+        'SUCCESS': JobStatus.DONE,
+        'FAILURE': JobStatus.FAILED,
+        'REVOKED': JobStatus.FAILED,
+    }
+
+    def __init__(self, celery):
+        """
+        Args:
+            celery (Celery): Celery app from create_celery_app().
+        """
+        self.__celery = celery
+
+    def submit(self, function, *args, **kwargs) -> str:
+        """
+        Send function(*args, **kwargs) to a Celery worker. Arguments must be JSON serializable.
+
+        Raises:
+            QueueFullError: If the broker can't be reached.
+
+        Returns:
+            string: Job id for status() and result().
+        """
+        try:
+            async_result = self.__celery.send_task('ced.run_job', args=[_function_path(function), args, kwargs])
+        except Exception as e:
+            raise QueueFullError("Job broker unavailable: " + str(e))
+        return async_result.id
+
+    def status(self, job_id: str) -> dict:
+        """
+        Get job status. Celery doesn't know about unknown ids, they are reported as queued.
+
+        Returns:
+            dict: {id, status, progress, stage, error} of the job.
+        """
+        async_result = self.__celery.AsyncResult(job_id)
+        status = self._STATES.get(async_result.state, JobStatus.QUEUED)
+        info = async_result.info if isinstance(async_result.info, dict) else {}
+        return {
+            'id': job_id,
+            'status': status.value,
+            'progress': 1.0 if status == JobStatus.DONE else info.get('progress', 0.0),
+            'stage': info.get('stage'),
+            'error': str(async_result.info) if status == JobStatus.FAILED else None,
+        }
+
+    def result(self, job_id: str):
+        """
+        Get job result.
+
+        Returns:
+            tuple[JobStatus, Any]: (status, return value of the job function). Return value is None until status is DONE.
+        """
+        async_result = self.__celery.AsyncResult(job_id)
+        status = self._STATES.get(async_result.state, JobStatus.QUEUED)
+        return status, async_result.result if status == JobStatus.DONE else None
+
+    def pending(self) -> int:
+        """
+        Returns:
+            int: Always 0, queue length is not tracked on the web side.
+        """
+        return 0
+
+
+def create_celery_app():
+    """
+    Create the Celery app and register the generic job task. Celery is imported only here,
+    so it's not needed unless JOB_BACKEND=celery.
+
+    Returns:
+        Celery: Celery app.
+    """
+    from celery import Celery
+
+    broker_url = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    celery = Celery('ced', broker=broker_url, backend=os.getenv('CELERY_RESULT_BACKEND', broker_url))
+    celery.conf.task_track_started = True
+    celery.conf.result_expires = int(os.getenv('JOB_RESULT_TTL', DEFAULT_RESULT_TTL))
+
+    @celery.task(name='ced.run_job', bind=True)
+    def run_job(task, function_path, args, kwargs):
+        def reporter(progress, stage):
+            task.update_state(state='PROGRESS', meta={'progress': progress, 'stage': stage})
+
+        _current.reporter = reporter
+        try:
+            return _resolve_function(function_path)(*args, **kwargs)
+        finally:
+            _current.reporter = None
+
+    return celery
+
+
+def create_job_queue():
+    """
+    Create the job queue selected with JOB_BACKEND env ('thread' by default, or 'celery').
+
+    Returns:
+        JobQueue or CeleryJobQueue: Job queue.
+    """
+    if os.getenv('JOB_BACKEND', 'thread').strip().lower() == 'celery':
+        return CeleryJobQueue(create_celery_app())
+    return JobQueue()
+
+
+# Celery worker entry point (celery -A app.jobs:celery_app worker)
+def __getattr__(name):
+    if name == 'celery_app':
+        global celery_app
+        celery_app = create_celery_app()
+        return celery_app
+    raise AttributeError(name)
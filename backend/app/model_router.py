@@ -0,0 +1,512 @@
+"""
+Routing of analysis requests to LLM providers. A route is the model name the client asks for (e.g. "OpenAI" or "Mistral")
+and maps to a fallback chain of provider/model targets. Providers and routes can be configured from a JSON file (MODEL_ROUTES_FILE).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import openai
+from openai import OpenAI
+import requests
+import app.chunking as chunking
+import app.prompts as prompts
+from app.ollama_client import OllamaClient, OllamaError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_ROUTE = "openai"
+DEFAULT_MAX_ERROR_RATE = 0.5 # targets failing more often than this are tried last
+DEFAULT_COOLDOWN = 30 # seconds before a failing target is tried first again
+COMPLETION_TOKEN_ESTIMATE = 1000 # Expected answer length, counted against the tokens per minute limit before sending
+EWMA_ALPHA = 0.3 # weight of the newest sample in latency and error rate averages
+
+
+class ProviderError(RuntimeError):
+    """
+    Raised when a provider fails to answer.
+    """
+    pass
+
+
+class Provider():
+    """
+    Base class for LLM backends. Subclasses implement generate() and generate_stream() and raise ProviderError on failures.
+    """
+    def __init__(self, name: str, timeout: float = None, max_concurrency: int = None, slow_after: float = None):
+        """
+        Args:
+            name (string): Provider name used in routes.
+            timeout (float, optional): Seconds to wait for a response. None uses the client default.
+            max_concurrency (int, optional): Max requests in flight, further requests wait. None is unlimited.
+            slow_after (float, optional): Average latency in seconds over which the provider is tried after the others.
+        """
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.slow_after = slow_after
+        self.__semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.__lock = threading.Lock()
+        self.in_flight = 0
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the provider's concurrency slots, waiting for a free one if needed.
+        """
+        if self.__semaphore is not None:
+            self.__semaphore.acquire()
+        with self.__lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.in_flight -= 1
+            if self.__semaphore is not None:
+                self.__semaphore.release()
+
+    def saturated(self) -> bool:
+        """
+        Returns:
+            bool:
+                - True when all concurrency slots are in use.
+                - False otherwise.
+        """
+        return self.max_concurrency is not None and self.in_flight >= self.max_concurrency
+
+    def generate(self, model: str, instructions: str, text: str, schema: dict = None) -> str:
+        """
+        Args:
+            schema (dict, optional): JSON schema the response must follow. None for free-form text.
+        """
+        raise NotImplementedError
+
+    def generate_stream(self, model: str, instructions: str, text: str):
+        raise NotImplementedError
+
+    def failure_result(self, error: ProviderError):
+        """
+        Result returned by the analysis when this provider was the last one to fail.
+        """
+        return None
+
+
+class OpenAIProvider(Provider):
+    """
+    OpenAI chat completions API, or any server implementing it (vLLM, llama.cpp, LM Studio...).
+    """
+    def __init__(self, name: str, client: OpenAI, scheduler = None, prompt_cache: bool = False, **limits):
+        """
+        Args:
+            name (string): Provider name used in routes.
+            client (OpenAI): Client for the API.
+            scheduler (RateLimitScheduler, optional): Paces requests to the rate limits. None sends requests directly.
+            prompt_cache (bool, optional): Send prompt_cache_key, only OpenAI's own API supports it. Defaults to False.
+            **limits: timeout, max_concurrency and slow_after, see `Provider`.
+        """
+        super().__init__(name, **limits)
+        self.__client = client
+        self.__scheduler = scheduler
+        self.__prompt_cache = prompt_cache
+
+    def __request(self, model, instructions, text, stream, schema=None):
+        """
+        Sends a chat completions request, through the scheduler if there is one.
+
+        Returns:
+            ChatCompletion or Stream: Parsed response.
+        """
+        options = {"timeout": self.timeout} if self.timeout is not None else {}
+        if self.__prompt_cache:
+            # extra_body works also with SDK versions that don't know the parameter
+            options["extra_body"] = {"prompt_cache_key": prompts.prefix_key(instructions)}
+        if schema is not None:
+            options["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "analysis", "strict": True, "schema": schema},
+            }
+
+        # raw response gives the x-ratelimit-* headers the scheduler follows
+        def request():
+            return self.__client.chat.completions.with_raw_response.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": instructions
+                    },
+                    {
+                        "role": "user",
+                        "content": text
+                    }
+                ],
+                stream=stream,
+                **options,
+            )
+
+        try:
+            if self.__scheduler is None:
+                return request().parse()
+            tokens = chunking.estimate_tokens(instructions) + chunking.estimate_tokens(text) + COMPLETION_TOKEN_ESTIMATE
+            return self.__scheduler.call(model, tokens, request)
+        except openai.RateLimitError:
+            raise ProviderError("Rate limit reached")
+        except openai.APIError as e:
+            raise ProviderError(str(e))
+
+    def generate(self, model: str, instructions: str, text: str, schema: dict = None) -> str:
+        response = self.__request(model, instructions, text, stream=False, schema=schema)
+        return response.choices[0].message.content
+
+    def generate_stream(self, model: str, instructions: str, text: str):
+        stream = self.__request(model, instructions, text, stream=True)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                piece = chunk.choices[0].delta.content
+                if piece:
+                    yield piece
+        except openai.APIError as e:
+            raise ProviderError(str(e))
+
+
+class OllamaProvider(Provider):
+    """
+    Local Ollama server.
+    """
+    def __init__(self, name: str, client: OllamaClient, **limits):
+        """
+        Args:
+            name (string): Provider name used in routes.
+            client (OllamaClient): Client for the server.
+            **limits: timeout, max_concurrency and slow_after, see `Provider`. Timeout is set on the client.
+        """
+        super().__init__(name, **limits)
+        self.__client = client
+
+    def generate(self, model: str, instructions: str, text: str, schema: dict = None) -> str:
+        try:
+            # instructions as the system prompt keep the start of the prompt the same between documents,
+            # so Ollama reuses its processed context for them
+            return self.__client.generate(model, text, system=instructions, format=schema)
+        # invalid JSON first, requests' JSONDecodeError is also a RequestException
+        except ValueError:
+            raise ProviderError("Invalid JSON response")
+        except (requests.exceptions.RequestException, OllamaError) as e:
+            raise ProviderError(str(e))
+
+    def generate_stream(self, model: str, instructions: str, text: str):
+        try:
+            yield from self.__client.generate_stream(model, text, system=instructions)
+        except ValueError:
+            raise ProviderError("Invalid JSON response")
+        except (requests.exceptions.RequestException, OllamaError) as e:
+            raise ProviderError(f"Request failed: {e}")
+
+    def failure_result(self, error: ProviderError):
+        return {"error": str(error)}
+
+
+class Target():
+    """
+    One model on one provider. Keeps averages of latency and error rate used to order fallback chains.
+    """
+    def __init__(self, provider: Provider, model: str):
+        self.provider = provider
+        self.model = model
+        self.key = f"{provider.name}/{model}"
+        self.__lock = threading.Lock()
+        self.latency = None # seconds, exponentially weighted average
+        self.error_rate = 0.0 # exponentially weighted average
+        self.requests = 0
+        self.failures = 0
+        self.last_failure = None
+
+    def record(self, latency: float, ok: bool):
+        with self.__lock:
+            self.requests += 1
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA * (0.0 if ok else 1.0)
+            if ok:
+                self.latency = latency if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * latency
+            else:
+                self.failures += 1
+                self.last_failure = time.monotonic()
+
+    def available(self, max_error_rate: float, cooldown: float) -> bool:
+        """
+        Returns:
+            bool:
+                - True when the target should be tried in its configured order.
+                - False when it is failing, slow or has no free concurrency slots.
+        """
+        with self.__lock:
+            failing = self.error_rate > max_error_rate and time.monotonic() - self.last_failure < cooldown
+            slow = self.provider.slow_after is not None and self.latency is not None and self.latency > self.provider.slow_after
+        return not failing and not slow and not self.provider.saturated()
+
+    def score(self) -> float:
+        """
+        Lower is better. Expected seconds per successful answer, unknown latency counts as 1 s.
+        """
+        with self.__lock:
+            latency = self.latency if self.latency is not None else 1.0
+            return latency / max(0.05, 1.0 - self.error_rate)
+
+    def generate(self, instructions: str, text: str, schema: dict = None, validate = None) -> str:
+        """
+        Generate with the target's model.
+
+        Args:
+            schema (dict, optional): JSON schema the response must follow, see `Provider.generate()`.
+            validate (callable, optional): Called with the response, raises ValueError if it's not valid.
+                An invalid response counts as a failure of the target.
+
+        Raises:
+            ProviderError: If the provider fails or the response is not valid.
+        """
+        with self.provider.slot():
+            start = time.monotonic()
+            try:
+                result = self.provider.generate(self.model, instructions, text, schema=schema)
+                if validate is not None:
+                    validate(result)
+            except ProviderError:
+                self.record(time.monotonic() - start, False)
+                raise
+            except ValueError as e:
+                self.record(time.monotonic() - start, False)
+                raise ProviderError(f"Invalid response: {e}") from e
+            self.record(time.monotonic() - start, True)
+            return result
+
+    def generate_stream(self, instructions: str, text: str):
+        """
+        Stream with the target's model.
+
+        Raises:
+            ProviderError: If the provider fails.
+        """
+        with self.provider.slot():
+            start = time.monotonic()
+            try:
+                yield from self.provider.generate_stream(self.model, instructions, text)
+            except ProviderError:
+                self.record(time.monotonic() - start, False)
+                raise
+            self.record(time.monotonic() - start, True)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'error_rate': round(self.error_rate, 3),
+                'latency': round(self.latency, 3) if self.latency is not None else None,
+                'in_flight': self.provider.in_flight,
+            }
+
+
+class ModelRouter():
+    """
+    Maps routes to fallback chains of targets ("provider/model"). Targets are tried in configured order,
+    except that failing, slow or saturated ones are moved after the others.
+    Should be initialized once and used through one instance.
+    """
+    def __init__(self, providers: dict, routes: dict, default_route: str = DEFAULT_ROUTE, max_error_rate: float = None, cooldown: float = None, targets: list = None):
+        """
+        Args:
+            providers (dict[string, Provider]): Providers by name. Provider names are case insensitive.
+            routes (dict[string, list[string]]): Fallback chains of "provider/model" targets by route name. Route names are case insensitive.
+            default_route (string, optional): Route used for unknown route names. Defaults to DEFAULT_ROUTE.
+            max_error_rate (float, optional): Error rate over which a target is tried last. Defaults to DEFAULT_MAX_ERROR_RATE.
+            cooldown (float, optional): Seconds after the last failure before a failing target is tried first again. Defaults to DEFAULT_COOLDOWN.
+            targets (list[string], optional): "provider/model" targets that can be requested directly without a route,
+                in addition to the targets of the routes.
+
+        Raises:
+            ValueError: If a route has no targets, a route or target refers to an unknown provider
+                or the default route doesn't exist.
+        """
+        self.__providers = {name.strip().lower(): provider for name, provider in providers.items()}
+        # Only configured targets exist, requested names never create new ones
+        self.__targets = {}
+        self.__lock = threading.Lock()
+        for name, chain in routes.items():
+            if not chain:
+                raise ValueError(f"Route '{name}' has no targets")
+        self.__routes = {name.strip().lower(): [self.__target(spec) for spec in chain] for name, chain in routes.items()}
+        for spec in targets or []:
+            self.__target(spec)
+        self.__default_route = default_route.strip().lower()
+        self.__max_error_rate = max_error_rate if max_error_rate != None else DEFAULT_MAX_ERROR_RATE
+        self.__cooldown = cooldown if cooldown != None else DEFAULT_COOLDOWN
+
+        if self.__default_route not in self.__routes:
+            raise ValueError(f"Default route '{default_route}' is not configured")
+
+    @classmethod
+    def from_config(cls, config: dict, routes: dict = None, openai_client: OpenAI = None, scheduler = None, ollama_client: OllamaClient = None):
+        """
+        Create a router from a config dict:
+
+            {
+                "default_route": "openai",
+                "providers": {
+                    "openai": {"type": "openai", "timeout": 120, "max_concurrency": 8},
+                    "ollama": {"type": "ollama", "url": "http://ollama:11434", "max_concurrency": 2},
+                    "vllm": {"type": "openai-compatible", "base_url": "http://vllm:8000/v1", "api_key_env": "VLLM_KEY", "slow_after": 30}
+                },
+                "routes": {
+                    "mistral": ["ollama/mistral", "vllm/mistralai/Mistral-7B-Instruct-v0.3"]
+                },
+                "targets": ["openai/gpt-4.1-mini"]
+            }
+
+        Providers "openai" and "ollama" exist by default. Configured routes are added to / replace the given default routes.
+        Targets of the routes and "targets" can be requested directly as "provider/model", other names use the default route.
+
+        Args:
+            config (dict): Config, see above.
+            routes (dict, optional): Default routes.
+            openai_client (OpenAI, optional): Shared client for "openai" providers without base_url.
+            scheduler (RateLimitScheduler, optional): Rate limit scheduler for "openai" providers.
+            ollama_client (OllamaClient, optional): Shared client for "ollama" providers without url and timeout.
+
+        Raises:
+            ValueError: If the config is invalid.
+
+        Returns:
+            ModelRouter: Router.
+        """
+        specs = {"openai": {"type": "openai"}, "ollama": {"type": "ollama"}}
+        specs.update(config.get("providers", {}))
+
+        providers = {}
+        for name, spec in specs.items():
+            kind = spec.get("type", name)
+            limits = {
+                "timeout": spec.get("timeout"),
+                "max_concurrency": spec.get("max_concurrency"),
+                "slow_after": spec.get("slow_after"),
+            }
+            if kind in ("openai", "openai-compatible"):
+                openai_api = kind == "openai"
+                # the scheduler retries its requests itself, others keep the client's own retries
+                max_retries = 0 if openai_api and scheduler is not None else openai.DEFAULT_MAX_RETRIES
+                client = openai_client
+                if "base_url" in spec or "api_key_env" in spec or client is None:
+                    api_key = os.getenv(spec.get("api_key_env", "OPENAI_KEY")) or "none"
+                    client = OpenAI(api_key=api_key, base_url=spec.get("base_url"), max_retries=max_retries)
+                elif max_retries and client.max_retries == 0:
+                    client = client.with_options(max_retries=max_retries)
+                providers[name] = OpenAIProvider(name, client, scheduler if openai_api else None, prompt_cache=openai_api, **limits)
+            elif kind == "ollama":
+                client = ollama_client
+                if "url" in spec or limits["timeout"] is not None or client is None:
+                    client = OllamaClient(base_url=spec.get("url"), read_timeout=limits["timeout"])
+                providers[name] = OllamaProvider(name, client, **limits)
+            else:
+                raise ValueError(f"Unknown provider type '{kind}' for provider '{name}'")
+
+        all_routes = dict(routes or {})
+        all_routes.update(config.get("routes", {}))
+        return cls(
+            providers,
+            all_routes,
+            config.get("default_route", DEFAULT_ROUTE),
+            config.get("max_error_rate"),
+            config.get("cooldown"),
+            config.get("targets"),
+        )
+
+    @classmethod
+    def from_file(cls, path: str = None, **defaults):
+        """
+        Create a router from a JSON config file, see `from_config()`.
+
+        Args:
+            path (string, optional): Config file. Defaults to MODEL_ROUTES_FILE env, default routes only if empty or not set.
+            **defaults: routes, openai_client, scheduler and ollama_client, see `from_config()`.
+
+        Raises:
+            OSError: If the file can't be read.
+            ValueError: If the file is not valid JSON or the config is invalid.
+
+        Returns:
+            ModelRouter: Router.
+        """
+        path = path if path != None else os.getenv('MODEL_ROUTES_FILE')
+        config = {}
+        if path:
+            with open(path, 'r', encoding='utf-8') as file:
+                config = json.load(file)
+        return cls.from_config(config, **defaults)
+
+    @staticmethod
+    def __target_key(spec: str) -> str:
+        """
+        Key of "provider/model" with the provider name in lower case. Model names are kept as they are.
+        """
+        provider_name, separator, model = spec.strip().partition("/")
+        return f"{provider_name.strip().lower()}{separator}{model.strip()}"
+
+    def __target(self, spec: str) -> Target:
+        """
+        Configured target for "provider/model", shared by all routes using it.
+        """
+        key = self.__target_key(spec)
+        provider_name, separator, model = key.partition("/")
+        if not separator or not model or provider_name not in self.__providers:
+            raise ValueError(f"Unknown provider in target '{spec}'")
+        with self.__lock:
+            if key not in self.__targets:
+                self.__targets[key] = Target(self.__providers[provider_name], model)
+            return self.__targets[key]
+
+    def has_route(self, route: str) -> bool:
+        """
+        Returns:
+            bool:
+                - True when the route is configured.
+                - False otherwise.
+        """
+        return route is not None and route.strip().lower() in self.__routes
+
+    def plan(self, route: str) -> list[Target]:
+        """
+        Targets to try for a route, in order. Available targets keep their configured order,
+        failing, slow and saturated ones follow ordered by their latency and error rate.
+
+        Args:
+            route (string): Route name, or "provider/model" of a configured target to use it directly.
+                Unknown names use the default route.
+
+        Returns:
+            list[Target]: Targets to try.
+        """
+        name = (route or "").strip().lower()
+        with self.__lock:
+            target = self.__targets.get(self.__target_key(route or ""))
+        if name in self.__routes:
+            chain = self.__routes[name]
+        elif target is not None:
+            chain = [target]
+        else:
+            chain = self.__routes[self.__default_route]
+
+        available = [target for target in chain if target.available(self.__max_error_rate, self.__cooldown)]
+        others = sorted((target for target in chain if target not in available), key=lambda target: target.score())
+        return available + others
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: {"provider/model": requests, failures, error_rate, latency (s) and in_flight}
+        """
+        with self.__lock:
+            targets = dict(self.__targets)
+        return {key: target.stats() for key, target in targets.items()}
@@ -30,10 +30,13 @@ class Blueprint:
         Returns:
             string: UUID-type ID of the newly created blueprint node in the database.
         """
-        # This check allows editing blueprint, no need to create a new node
-        if self.__blueprintId is None:
-            self.__blueprintId = self.__database.add_node(NodeLabels.BLUEPRINT)
-        self.__database.set_node_property(self.__blueprintId, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, self.__name)
-        self.__database.set_node_property(self.__blueprintId, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.DESCRIPTION, self.__description)
-        self.__database.set_node_property(self.__blueprintId, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.QUESTIONS, self.__questions)
-        return self.__blueprintId
\ No newline at end of file
+        with self.__database.transaction() as tx:
+            # This check allows editing blueprint, no need to create a new node
+            if self.__blueprintId is None:
+                self.__blueprintId = tx.add_node(NodeLabels.BLUEPRINT)
+            tx.set_node_properties(self.__blueprintId, NodeLabels.BLUEPRINT, {
+                NodeProperties.Blueprint.NAME: self.__name,
+                NodeProperties.Blueprint.DESCRIPTION: self.__description,
+                NodeProperties.Blueprint.QUESTIONS: self.__questions,
+                })
+            return self.__blueprintId
\ No newline at end of file
@@ -23,6 +23,7 @@ class Project:
         Returns:
             string: UUID-type ID of the newly created project node in the database.
         """
-        projectId = self.__database.add_node(NodeLabels.PROJECT)
-        self.__database.set_node_property(projectId, NodeLabels.PROJECT, NodeProperties.Project.NAME, self.__name)
-        return projectId
\ No newline at end of file
+        with self.__database.transaction() as tx:
+            projectId = tx.add_node(NodeLabels.PROJECT)
+            tx.set_node_properties(projectId, NodeLabels.PROJECT, {NodeProperties.Project.NAME: self.__name})
+            return projectId
\ No newline at end of file
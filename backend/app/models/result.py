@@ -1,11 +1,10 @@
 from app.database import Database
-from app.database import NodeProperties, NodeLabels
 
 class Result:
     """
     Result template class for creating and saving analysis result instances to the database.
     """
-    def __init__(self, name: str, filename: str, blueprintId: str, result: str, projectId: str):
+    def __init__(self, name: str, filename: str, blueprintId: str, result: str, projectId: str, answers: list[dict] = None):
         """
         Constructor for Result instances. Create an instance through this before saving.
         Also creates a reference to the database singleton.
@@ -17,43 +16,25 @@ class Result:
             blueprintId (string): UUID-type ID of the blueprint used to create the result.
             result (string): The analysis result text generated by the LLM.
             projectId (string): UUID-type ID of the project under which the result was created.
+            answers (list[dict], optional): Answers of a structured result [{"question": ..., "answer": ...}].
+                Each one is saved as its own node, so they can be looked up without parsing the result text.
         """
         self.__name = name
         self.__filename = filename
         self.__blueprintId = blueprintId
         self.__result = result
         self.__projectId = projectId
+        self.__answers = answers
         self.__database = Database()
 
-    def save_result(self) -> str:
+    def save_result(self) -> str | None:
         """
-        Saves the result to the database. Also connects the result to the proper project node.
+        Saves the result to the database with a single query. Also connects the result to the proper project node,
+        saves a copy of the used blueprint and the answers, and refreshes the project DATETIME.
 
         Returns:
-            string: UUID-type ID of the newly created result node in the database.
+            string or None:
+                - UUID-type ID of the newly created result node in the database.
+                - None if the project was not found, nothing is saved then.
         """
-        resultId = self.__database.add_node(NodeLabels.RESULT_BLUEPRINT)
-        self.__database.set_node_property(resultId, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME, self.__name)
-        self.__database.set_node_property(resultId, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.FILENAME, self.__filename)
-        self.__database.set_node_property(resultId, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.RESULT, self.__result)
-
-        # Set result under a project
-        self.__database.connect_node_to_node(resultId, NodeLabels.RESULT_BLUEPRINT, self.__projectId, NodeLabels.PROJECT)
-
-        # Make used blueprint and connect it to result
-        usedBlueprintId = self.__database.copy_node_to_node(self.__blueprintId, NodeLabels.BLUEPRINT, NodeLabels.USED_BLUEPRINT)
-        self.__database.connect_node_to_node(usedBlueprintId, NodeLabels.USED_BLUEPRINT, resultId, NodeLabels.RESULT_BLUEPRINT)
-        return resultId
-
-        '''
-        # If an automatic blueprint was used, blueprint id is null and we can return
-        if self.__blueprint_id is None:
-            return result_id, None
-
-        # Copying blueprint to used variant
-        used_blueprint_id = self.__database.copy_to_used_blueprint_node(self.__blueprint_id)
-        self.__database.set_result_blueprint_property(result_id, NodeProperties.ResultBlueprint.USED_BLUEPRINT, used_blueprint_id)
-        self.__database.connect_used_blueprint_to_result_blueprint(used_blueprint_id, result_id)
-
-        return result_id, used_blueprint_id
-        '''
\ No newline at end of file
+        return self.__database.create_result(self.__name, self.__filename, self.__result, self.__projectId, self.__blueprintId, self.__answers)
@@ -0,0 +1,144 @@
+"""
+Client for the local Ollama LLM server.
+"""
+import json
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_URL = "http://ollama:11434"
+DEFAULT_CONNECT_TIMEOUT = 5 # seconds
+DEFAULT_READ_TIMEOUT = 300 # seconds to wait for the next bytes, long prompts on CPU can take minutes
+DEFAULT_KEEP_ALIVE = "30m" # how long Ollama keeps the model loaded after a request, -1 keeps it loaded
+DEFAULT_POOL_SIZE = 10
+
+
+class OllamaError(RuntimeError):
+    """
+    Raised when Ollama answers with an error.
+    """
+    pass
+
+
+class OllamaClient():
+    """
+    Client for Ollama's /api/generate. Connections are kept alive in a pool and reused between requests,
+    and every request asks Ollama to keep the model loaded (keep_alive), so requests after idle periods
+    don't wait for the model to load again.
+    Should be initialized once and used through one instance.
+    """
+    def __init__(self, base_url: str = None, connect_timeout: float = None, read_timeout: float = None, keep_alive: str = None, pool_size: int = None):
+        """
+        Args:
+            base_url (string, optional): Ollama server URL. Defaults to OLLAMA_URL env or DEFAULT_URL.
+            connect_timeout (float, optional): Seconds to wait for a connection. Defaults to OLLAMA_CONNECT_TIMEOUT env or DEFAULT_CONNECT_TIMEOUT.
+            read_timeout (float, optional): Seconds to wait for response data. Defaults to OLLAMA_READ_TIMEOUT env or DEFAULT_READ_TIMEOUT.
+            keep_alive (string, optional): Ollama keep_alive value, e.g. "30m" or "-1". Defaults to OLLAMA_KEEP_ALIVE env or DEFAULT_KEEP_ALIVE.
+            pool_size (int, optional): Max pooled connections. Defaults to OLLAMA_POOL_SIZE env or DEFAULT_POOL_SIZE.
+        """
+        self.__base_url = (base_url or os.getenv('OLLAMA_URL', DEFAULT_URL)).rstrip('/')
+        self.__timeout = (
+            connect_timeout if connect_timeout != None else float(os.getenv('OLLAMA_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+            read_timeout if read_timeout != None else float(os.getenv('OLLAMA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+        )
+        keep_alive = keep_alive if keep_alive != None else os.getenv('OLLAMA_KEEP_ALIVE', DEFAULT_KEEP_ALIVE)
+        # Ollama takes durations as strings and plain seconds as numbers
+        try:
+            self.__keep_alive = int(keep_alive)
+        except ValueError:
+            self.__keep_alive = keep_alive
+
+        pool_size = pool_size or int(os.getenv('OLLAMA_POOL_SIZE', DEFAULT_POOL_SIZE))
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+
+    def generate(self, model: str, prompt: str, system: str = None, format: dict = None) -> str:
+        """
+        Generate a completion.
+
+        Args:
+            model (string): Model name, e.g. "mistral".
+            prompt (string): Prompt text.
+            system (string, optional): System message, overrides the one in the model's Modelfile.
+            format (dict or string, optional): JSON schema the response must follow, or "json" for any JSON.
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails.
+            OllamaError: If Ollama answers with an error.
+            ValueError: If the response is not valid JSON.
+
+        Returns:
+            string: Generated text (the 'response' field).
+        """
+        response = self.__session.post(
+            self.__base_url + "/api/generate",
+            json=self.__payload(model, prompt, system, stream=False, format=format),
+            timeout=self.__timeout,
+        )
+        message = self.__parse(response, response.json() if response.content else {})
+        return message.get("response", "")
+
+    def generate_stream(self, model: str, prompt: str, system: str = None):
+        """
+        Generate a completion as a stream.
+
+        Args:
+            model (string): Model name, e.g. "mistral".
+            prompt (string): Prompt text.
+            system (string, optional): System message, overrides the one in the model's Modelfile.
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails.
+            OllamaError: If Ollama answers with an error.
+            ValueError: If a line of the response is not valid JSON.
+
+        Yields:
+            string: Generated text pieces as they arrive.
+        """
+        with self.__session.post(
+            self.__base_url + "/api/generate",
+            json=self.__payload(model, prompt, system, stream=True),
+            timeout=self.__timeout,
+            stream=True,
+        ) as response:
+            if response.status_code >= 400:
+                self.__parse(response, response.json() if response.content else {})
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = self.__parse(response, json.loads(line))
+                if message.get("response"):
+                    yield message["response"]
+                if message.get("done"):
+                    break
+
+    def __payload(self, model, prompt, system, stream, format=None):
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.__keep_alive,
+        }
+        if system is not None:
+            payload["system"] = system
+        if format is not None:
+            payload["format"] = format
+        return payload
+
+    def __parse(self, response, message):
+        """
+        Raise on error responses, Ollama sends the reason as {"error": ...}.
+
+        Returns:
+            dict: The message.
+        """
+        if isinstance(message, dict) and "error" in message:
+            raise OllamaError(message["error"])
+        response.raise_for_status()
+        return message
@@ -0,0 +1,383 @@
+"""
+Prompt templates for LLM analysis. Instructions are sent as the system prompt and the document always last,
+so the instructions form a prefix that stays the same between requests using the same blueprint.
+That lets OpenAI prompt caching and Ollama's context reuse skip reprocessing it.
+"""
+import functools
+import hashlib
+import json
+import re
+
+DEFAULT_CACHE_SIZE = 128 # built prompts kept, one per blueprint questions
+
+# TODO: Instructions in both Finnish and English
+ANALYSIS_INSTRUCTIONS = (
+    "You are an expert in text analysis. Please read the provided text carefully "
+    "and then produce a structured analysis with the following components:\n\n"
+
+    "1. **Main Themes**: Identify and summarize the core themes or central ideas present in the text.\n"
+    "2. **Key Points**: Highlight the most important details, arguments, or statements that stand out.\n"
+    "3. **Notable Quotes or Passages**: Include any direct quotes or paraphrased sections that are especially significant or illustrative.\n"
+    "4. **Overall Sentiment**: Describe the general tone or emotional quality of the text (e.g., optimistic, critical, neutral, etc.).\n\n"
+
+    "If there are specific questions provided, answer each of them thoroughly after completing your summary. "
+    "Make sure your answers are clear, concise, and directly address the questions.\n"
+)
+
+ANALYSIS_QUESTIONS = "\nAdditionally, please answer the following questions:\n"
+
+REDUCE_INSTRUCTIONS = (
+    "You are an expert in text analysis. You are given separate analyses of consecutive parts of one long document, "
+    "in document order. Merge them into a single structured analysis of the whole document with the following components:\n\n"
+
+    "1. **Main Themes**: Combine the themes of all parts, removing duplicates.\n"
+    "2. **Key Points**: The most important details, arguments, or statements of the whole document.\n"
+    "3. **Notable Quotes or Passages**: The most significant quotes from the parts.\n"
+    "4. **Overall Sentiment**: The general tone of the whole document.\n\n"
+
+    "Do not mention the parts, write as if the whole document was analyzed at once.\n"
+)
+
+REDUCE_QUESTIONS = "\nAdditionally, answer the following questions for the whole document, combining the answers given for each part:\n"
+
+
+def blueprint_questions(blueprint: dict) -> tuple:
+    """
+    Questions of a blueprint in a hashable form. Blueprints with the same questions share their prompts,
+    so editing a blueprint's questions gives a new prompt and other changes don't.
+
+    Args:
+        blueprint (dict): Blueprint dict, can be None.
+
+    Returns:
+        tuple[string] or None: Questions, None if the blueprint has none.
+    """
+    if blueprint is None or "questions" not in blueprint:
+        return None
+    return tuple(str(question) for question in blueprint["questions"])
+
+
+@functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _build(instructions: str, heading: str, questions: tuple) -> str:
+    if questions is None:
+        return instructions
+    return instructions + heading + "\n".join(f"- {question}" for question in questions)
+
+
+def analysis_prompt(blueprint: dict) -> str:
+    """
+    System prompt for analyzing a document: the fixed instructions followed by the blueprint questions.
+    Built once per set of questions.
+
+    Args:
+        blueprint (dict): Blueprint dict containing questions for the LLM, can be None.
+
+    Returns:
+        string: System prompt.
+    """
+    return _build(ANALYSIS_INSTRUCTIONS, ANALYSIS_QUESTIONS, blueprint_questions(blueprint))
+
+
+def reduce_prompt(blueprint: dict) -> str:
+    """
+    System prompt for merging partial analyses of one document, see `reduce_text()`.
+
+    Args:
+        blueprint (dict): Blueprint dict containing questions for the LLM, can be None.
+
+    Returns:
+        string: System prompt.
+    """
+    return _build(REDUCE_INSTRUCTIONS, REDUCE_QUESTIONS, blueprint_questions(blueprint))
+
+
+@functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def prefix_key(prompt: str) -> str:
+    """
+    Short id of a system prompt, sent to OpenAI as prompt_cache_key so requests sharing the prompt
+    are routed to the same prompt cache.
+
+    Args:
+        prompt (string): System prompt.
+
+    Returns:
+        string: 32 character hex id.
+    """
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+
+def reduce_text(partials: list[str]) -> str:
+    """
+    Partial analyses as one text, sent after `reduce_prompt()`.
+
+    Args:
+        partials (list[string]): Analyses of consecutive parts in document order.
+
+    Returns:
+        string: Text with a heading for each part.
+    """
+    return "\n\n".join(
+        f"### Analysis of part {index + 1} of {len(partials)}\n{partial}"
+        for index, partial in enumerate(partials)
+    )
+
+
+BATCH_INSTRUCTIONS = (
+    "\n\nYou are given several separate documents. Each document starts with a line <document id=\"N\"> "
+    "and ends with a line </document>. Analyze each document on its own, as if it was the only one. "
+    "Write the analysis of each document between a line <analysis id=\"N\"> and a line </analysis>, "
+    "using the id of the document, in the same order as the documents. Write nothing outside of these blocks.\n"
+)
+
+# Documents containing these can't be packed, they would break the structure
+BATCH_DELIMITERS = ("<document", "</document>", "<analysis", "</analysis>")
+
+_BATCH_ANALYSIS = re.compile(r'<analysis id="(\d+)">(.*?)</analysis>', re.DOTALL)
+
+
+@functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _batch(questions: tuple) -> str:
+    return _build(ANALYSIS_INSTRUCTIONS, ANALYSIS_QUESTIONS, questions) + BATCH_INSTRUCTIONS
+
+
+def batch_prompt(blueprint: dict) -> str:
+    """
+    System prompt for analyzing several documents in one request, see `batch_text()`.
+    Starts with the same prefix as `analysis_prompt()`.
+
+    Args:
+        blueprint (dict): Blueprint dict containing questions for the LLM, can be None.
+
+    Returns:
+        string: System prompt.
+    """
+    return _batch(blueprint_questions(blueprint))
+
+
+def can_batch(text: str) -> bool:
+    """
+    Returns:
+        bool:
+            - True when the text can be packed with `batch_text()`.
+            - False when it contains the delimiters.
+    """
+    return not any(delimiter in text for delimiter in BATCH_DELIMITERS)
+
+
+def batch_text(texts: list[str]) -> str:
+    """
+    Documents delimited for `batch_prompt()`, ids start from 1.
+
+    Args:
+        texts (list[string]): Documents, see `can_batch()`.
+
+    Returns:
+        string: Documents as one text.
+    """
+    return "\n\n".join(
+        f"<document id=\"{index + 1}\">\n{text}\n</document>"
+        for index, text in enumerate(texts)
+    )
+
+
+def split_batch(response: str, count: int) -> dict:
+    """
+    Split a response to `batch_prompt()` into the analyses of each document.
+    Empty analyses, ids out of range and ids given more than once are left out.
+
+    Args:
+        response (string): Model response.
+        count (int): Number of documents sent.
+
+    Returns:
+        dict[int, string]: Analysis by document index (from 0).
+    """
+    analyses = {}
+    repeated = set()
+    for match in _BATCH_ANALYSIS.finditer(response):
+        index = int(match.group(1)) - 1
+        analysis = match.group(2).strip()
+        if index < 0 or index >= count or not analysis:
+            continue
+        if index in analyses:
+            repeated.add(index)
+        analyses[index] = analysis
+    return {index: analysis for index, analysis in analyses.items() if index not in repeated}
+
+
+STRUCTURED_INSTRUCTIONS = (
+    "\n\nReply only with a JSON object. Put the main themes, key points and notable quotes in the lists "
+    "main_themes, key_points and notable_quotes, and the overall sentiment in overall_sentiment. "
+    "If questions are given, put the answer to each of them in answers as question_1, question_2 and so on, "
+    "in the order the questions are given.\n"
+)
+
+# Fields of a structured analysis, in the order they are rendered
+STRUCTURED_FIELDS = {
+    "main_themes": "Main Themes",
+    "key_points": "Key Points",
+    "notable_quotes": "Notable Quotes or Passages",
+    "overall_sentiment": "Overall Sentiment",
+}
+
+
+@functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _structured(instructions: str, heading: str, questions: tuple) -> str:
+    return _build(instructions, heading, questions) + STRUCTURED_INSTRUCTIONS
+
+
+def structured_prompt(blueprint: dict) -> str:
+    """
+    System prompt for analyzing a document into JSON, see `analysis_schema()`.
+    Starts with the same prefix as `analysis_prompt()`.
+
+    Args:
+        blueprint (dict): Blueprint dict containing questions for the LLM, can be None.
+
+    Returns:
+        string: System prompt.
+    """
+    return _structured(ANALYSIS_INSTRUCTIONS, ANALYSIS_QUESTIONS, blueprint_questions(blueprint))
+
+
+def structured_reduce_prompt(blueprint: dict) -> str:
+    """
+    System prompt for merging partial analyses of one document into JSON, see `reduce_prompt()`.
+
+    Args:
+        blueprint (dict): Blueprint dict containing questions for the LLM, can be None.
+
+    Returns:
+        string: System prompt.
+    """
+    return _structured(REDUCE_INSTRUCTIONS, REDUCE_QUESTIONS, blueprint_questions(blueprint))
+
+
+@functools.lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _schema(questions: tuple) -> str:
+    string_list = {"type": "array", "items": {"type": "string"}}
+    properties = {
+        "main_themes": string_list,
+        "key_points": string_list,
+        "notable_quotes": string_list,
+        "overall_sentiment": {"type": "string"},
+    }
+    if questions:
+        properties["answers"] = {
+            "type": "object",
+            "properties": {
+                f"question_{index + 1}": {"type": "string", "description": question}
+                for index, question in enumerate(questions)
+            },
+            "required": [f"question_{index + 1}" for index in range(len(questions))],
+            "additionalProperties": False,
+        }
+    # strict mode needs every property required and no others allowed
+    schema = {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+    return json.dumps(schema)
+
+
+def analysis_schema(blueprint: dict) -> dict:
+    """
+    JSON schema of a structured analysis. Answers to the blueprint questions are under "answers"
+    as question_1, question_2..., left out if the blueprint has no questions.
+
+    Args:
+        blueprint (dict): Blueprint dict containing questions for the LLM, can be None.
+
+    Returns:
+        dict: JSON schema, a new copy on every call.
+    """
+    return json.loads(_schema(blueprint_questions(blueprint)))
+
+
+def parse_structured(response: str, blueprint: dict) -> dict:
+    """
+    Parse and validate a response to `structured_prompt()` against `analysis_schema()`.
+
+    Args:
+        response (string): Model response.
+        blueprint (dict): Blueprint dict the analysis was made with, can be None.
+
+    Raises:
+        ValueError: If the response is not valid JSON or doesn't match the schema.
+
+    Returns:
+        dict: The analysis.
+    """
+    data = json.loads(response)
+    if not isinstance(data, dict):
+        raise ValueError("Structured analysis is not a JSON object")
+
+    for field in STRUCTURED_FIELDS:
+        if field not in data:
+            raise ValueError(f"Structured analysis is missing '{field}'")
+    if not isinstance(data["overall_sentiment"], str):
+        raise ValueError("'overall_sentiment' is not a string")
+    for field in ("main_themes", "key_points", "notable_quotes"):
+        if not isinstance(data[field], list) or not all(isinstance(item, str) for item in data[field]):
+            raise ValueError(f"'{field}' is not a list of strings")
+
+    questions = blueprint_questions(blueprint) or ()
+    if questions:
+        answers = data.get("answers")
+        if not isinstance(answers, dict):
+            raise ValueError("Structured analysis is missing 'answers'")
+        for index in range(len(questions)):
+            if not isinstance(answers.get(f"question_{index + 1}"), str):
+                raise ValueError(f"Answer to question {index + 1} is missing")
+    return data
+
+
+def render_markdown(data: dict, answers: list[dict]) -> str:
+    """
+    Structured analysis as the same markdown the free-form analysis gives.
+
+    Args:
+        data (dict): Analysis from `parse_structured()`.
+        answers (list[dict]): [{"question": ..., "answer": ...}] in question order.
+
+    Returns:
+        string: Markdown text.
+    """
+    sections = []
+    for index, (field, heading) in enumerate(STRUCTURED_FIELDS.items()):
+        value = data[field]
+        body = value if isinstance(value, str) else "\n".join(f"- {item}" for item in value)
+        sections.append(f"{index + 1}. **{heading}**:\n{body}")
+    if answers:
+        sections.append("\n\n".join(f"**{answer['question']}**\n{answer['answer']}" for answer in answers))
+    return "\n\n".join(sections)
+
+
+def structured_result(response: str, blueprint: dict) -> dict:
+    """
+    Structured analysis result returned to the client. Answers are paired with their questions,
+    so they can be saved one by one.
+
+    Args:
+        response (string): Model response, see `parse_structured()`.
+        blueprint (dict): Blueprint dict the analysis was made with, can be None.
+
+    Raises:
+        ValueError: If the response is not a valid structured analysis.
+
+    Returns:
+        dict: main_themes, key_points, notable_quotes, overall_sentiment,
+            answers ([{"question": ..., "answer": ...}]) and result (the analysis as markdown).
+    """
+    data = parse_structured(response, blueprint)
+    questions = blueprint_questions(blueprint) or ()
+    answers = [
+        {"question": question, "answer": data["answers"][f"question_{index + 1}"].strip()}
+        for index, question in enumerate(questions)
+    ]
+    result = {field: data[field] for field in STRUCTURED_FIELDS}
+    result["answers"] = answers
+    result["result"] = render_markdown(data, answers)
+    return result
@@ -0,0 +1,340 @@
+"""
+Client side pacing of OpenAI requests. Keeps requests and tokens per minute under the account limits,
+retries rate limited and transiently failed requests with backoff, and lets interactive requests go ahead of batch work.
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Priorities, lower goes first
+INTERACTIVE = 0
+BATCH = 1
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 30000
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0 # seconds, doubled on every retry
+DEFAULT_MAX_DELAY = 60.0 # seconds
+
+_priority = contextvars.ContextVar('rate_limit_priority', default=INTERACTIVE)
+
+
+@contextmanager
+def priority(value: int):
+    """
+    Run requests made inside the block with the given priority.
+
+    Usage:
+        with rate_limiter.priority(rate_limiter.BATCH):
+            apiHandler.analyze(...)
+
+    Args:
+        value (int): INTERACTIVE or BATCH.
+    """
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """
+    Returns:
+        int: Priority of requests made from the current context, INTERACTIVE by default.
+    """
+    return _priority.get()
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse OpenAI reset durations such as "1s", "6m0s", "59.639s" or "20ms".
+
+    Returns:
+        float or None: Seconds, None if value can't be parsed.
+    """
+    if not value:
+        return None
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+class TokenBucket():
+    """
+    Token bucket refilled continuously up to a per minute limit.
+    Not thread safe by itself, ModelRateLimiter holds the lock.
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.available = self.capacity
+        self.__updated = time.monotonic()
+
+    def __refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Returns:
+            float: Seconds until amount is available, 0 if available now. Amounts over capacity wait for a full bucket.
+        """
+        self.__refill(now)
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def take(self, amount: float, now: float):
+        self.__refill(now)
+        self.available -= min(amount, self.capacity)
+
+    def update(self, limit: float, remaining: float, reset: float, now: float):
+        """
+        Sync with the server's view from rate limit headers.
+
+        Args:
+            limit (float): Per minute limit, None to keep the current one.
+            remaining (float): Amount left now.
+            reset (float): Seconds until the limit is fully replenished, None if unknown.
+        """
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / 60
+        self.__refill(now)
+        self.available = min(self.capacity, float(remaining))
+        # server refills to full in reset seconds, follow its pace if faster than the nominal rate
+        if reset and reset > 0 and self.capacity > self.available:
+            self.rate = max(self.capacity / 60, (self.capacity - self.available) / reset)
+
+    def drain(self, now: float):
+        self.__refill(now)
+        self.available = min(self.available, 0.0)
+
+
+class ModelRateLimiter():
+    """
+    Requests/min and tokens/min buckets for one model. Waiting requests are served in priority order
+    (then first come, first served), so batch work never delays an interactive request that is waiting.
+    """
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.__requests = TokenBucket(requests_per_minute)
+        self.__tokens = TokenBucket(tokens_per_minute)
+        self.__condition = threading.Condition()
+        self.__waiting = [] # heap of (priority, sequence)
+        self.__sequence = itertools.count()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE):
+        """
+        Block until this request may be sent, then take one request and the tokens from the buckets.
+
+        Args:
+            tokens (int): Estimated tokens of the request (prompt + expected completion).
+            priority (int, optional): INTERACTIVE or BATCH.
+        """
+        start = time.monotonic()
+        with self.__condition:
+            entry = (priority, next(self.__sequence))
+            heapq.heappush(self.__waiting, entry)
+            try:
+                while True:
+                    if self.__waiting[0] == entry:
+                        now = time.monotonic()
+                        wait = max(self.__requests.wait_time(1, now), self.__tokens.wait_time(tokens, now))
+                        if wait <= 0:
+                            self.__requests.take(1, now)
+                            self.__tokens.take(tokens, now)
+                            break
+                        self.__condition.wait(wait)
+                    else:
+                        self.__condition.wait()
+            finally:
+                self.__waiting.remove(entry)
+                heapq.heapify(self.__waiting)
+                self.__condition.notify_all()
+
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            self.waits += 1
+            self.waited_seconds += waited
+
+    def update_from_headers(self, headers):
+        """
+        Sync buckets with x-ratelimit-* response headers. Missing or invalid headers are ignored.
+
+        Args:
+            headers (Mapping): Response headers.
+        """
+        if headers is None:
+            return
+        with self.__condition:
+            now = time.monotonic()
+            for bucket, kind in [(self.__requests, 'requests'), (self.__tokens, 'tokens')]:
+                try:
+                    remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+                    if not isinstance(remaining, str):
+                        continue
+                    limit = headers.get(f'x-ratelimit-limit-{kind}')
+                    limit = float(limit) if isinstance(limit, str) else None
+                    reset = headers.get(f'x-ratelimit-reset-{kind}')
+                    reset = parse_duration(reset) if isinstance(reset, str) else None
+                    bucket.update(limit, float(remaining), reset, now)
+                except ValueError:
+                    continue
+            self.__condition.notify_all()
+
+    def penalize(self):
+        """
+        Empty the request bucket after a rate limit error, so queued requests wait for it to refill.
+        """
+        with self.__condition:
+            self.__requests.drain(time.monotonic())
+
+    def stats(self) -> dict:
+        with self.__condition:
+            return {
+                'waiting': len(self.__waiting),
+                'requests_available': round(self.__requests.available, 2),
+                'requests_per_minute': self.__requests.capacity,
+                'tokens_available': round(self.__tokens.available, 2),
+                'tokens_per_minute': self.__tokens.capacity,
+                'waits': self.waits,
+                'waited_seconds': round(self.waited_seconds, 3),
+            }
+
+
+class RateLimitScheduler():
+    """
+    Paces OpenAI requests per model and retries rate limited ones with jittered exponential backoff.
+    Dropped connections, timeouts and server errors (5xx) are retried with the same backoff, since the
+    OpenAI client's own retries are turned off for scheduled requests.
+    Limits start from OPENAI_RPM/OPENAI_TPM env and follow the x-ratelimit-* headers of every response.
+    Should be initialized once and used through one instance.
+    """
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None, max_retries: int = None, base_delay: float = None, max_delay: float = None):
+        """
+        Args:
+            requests_per_minute (float, optional): Initial requests/min per model. Defaults to OPENAI_RPM env or DEFAULT_REQUESTS_PER_MINUTE.
+            tokens_per_minute (float, optional): Initial tokens/min per model. Defaults to OPENAI_TPM env or DEFAULT_TOKENS_PER_MINUTE.
+            max_retries (int, optional): Retries after rate limit, connection and server errors.
+                Defaults to OPENAI_MAX_RETRIES env or DEFAULT_MAX_RETRIES.
+            base_delay (float, optional): First backoff in seconds. Defaults to DEFAULT_BASE_DELAY.
+            max_delay (float, optional): Max backoff in seconds. Defaults to DEFAULT_MAX_DELAY.
+        """
+        self.__requests_per_minute = requests_per_minute or float(os.getenv('OPENAI_RPM', DEFAULT_REQUESTS_PER_MINUTE))
+        self.__tokens_per_minute = tokens_per_minute or float(os.getenv('OPENAI_TPM', DEFAULT_TOKENS_PER_MINUTE))
+        self.__max_retries = max_retries if max_retries != None else int(os.getenv('OPENAI_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+        self.__base_delay = base_delay if base_delay != None else DEFAULT_BASE_DELAY
+        self.__max_delay = max_delay if max_delay != None else DEFAULT_MAX_DELAY
+        self.__limiters = {}
+        self.__lock = threading.Lock()
+        self.retries = 0
+
+    def limiter(self, model: str) -> ModelRateLimiter:
+        """
+        Returns:
+            ModelRateLimiter: Limiter of the model, created on first use.
+        """
+        with self.__lock:
+            if model not in self.__limiters:
+                self.__limiters[model] = ModelRateLimiter(self.__requests_per_minute, self.__tokens_per_minute)
+            return self.__limiters[model]
+
+    def call(self, model: str, tokens: int, request):
+        """
+        Send a request when the model's limits allow it, retrying rate limit, connection and server errors.
+
+        Args:
+            model (string): Model the request is for.
+            tokens (int): Estimated tokens of the request (prompt + expected completion).
+            request (callable): Sends the request using `with_raw_response`, returns the raw response.
+
+        Raises:
+            openai.RateLimitError: If still rate limited after max_retries, or the quota is used up.
+            openai.APIConnectionError: If the connection still fails or times out after max_retries.
+            openai.InternalServerError: If the server still answers with an error after max_retries.
+
+        Returns:
+            Any: Parsed response (raw_response.parse()).
+        """
+        limiter = self.limiter(model)
+        attempt = 0
+        while True:
+            limiter.acquire(tokens, current_priority())
+            try:
+                raw_response = request()
+            except openai.RateLimitError as e:
+                # quota won't come back by waiting
+                if getattr(e, 'code', None) == 'insufficient_quota' or attempt >= self.__max_retries:
+                    raise
+                headers = getattr(e.response, 'headers', None)
+                limiter.update_from_headers(headers)
+                limiter.penalize()
+                time.sleep(self.backoff(attempt, headers))
+                attempt += 1
+                with self.__lock:
+                    self.retries += 1
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                # transient, not a sign of hitting the limits
+                if attempt >= self.__max_retries:
+                    raise
+                time.sleep(self.backoff(attempt, getattr(getattr(e, 'response', None), 'headers', None)))
+                attempt += 1
+                with self.__lock:
+                    self.retries += 1
+                continue
+
+            limiter.update_from_headers(raw_response.headers)
+            return raw_response.parse()
+
+    def backoff(self, attempt: int, headers = None) -> float:
+        """
+        Delay before the next retry. Uses the server's retry-after when given,
+        otherwise exponential backoff with jitter so retries of parallel requests spread out.
+
+        Args:
+            attempt (int): Retry number starting from 0.
+            headers (Mapping, optional): Headers of the failed response.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        if headers is not None:
+            retry_after_ms = headers.get('retry-after-ms')
+            retry_after = headers.get('retry-after')
+            try:
+                if isinstance(retry_after_ms, str):
+                    return min(self.__max_delay, float(retry_after_ms) / 1000)
+                if isinstance(retry_after, str):
+                    return min(self.__max_delay, float(retry_after))
+            except ValueError:
+                pass
+        delay = min(self.__max_delay, self.__base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: {"retries": int, "models": {model: limiter stats}}
+        """
+        with self.__lock:
+            limiters = dict(self.__limiters)
+            retries = self.retries
+        return {'retries': retries, 'models': {model: limiter.stats() for model, limiter in limiters.items()}}
@@ -0,0 +1,414 @@
+"""
+Storage for uploaded files and their extracted text. Uploads are streamed to a spool directory in fixed size chunks,
+so memory use doesn't grow with the file size, and stored by content hash, so the same document uploaded again
+(e.g. into another project) is stored and extracted only once.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from werkzeug.utils import secure_filename
+import app.utils as utils
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "ced-uploads")
+DEFAULT_TEXT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "ced-text-cache")
+DEFAULT_CHUNK_SIZE = 64 * 1024 # bytes read and written at a time
+DEFAULT_MAX_CONTENT_LENGTH = 100 * 1024 * 1024 # bytes, MAX_CONTENT_LENGTH env overrides
+DEFAULT_MAX_AGE = 86400 # seconds an upload is kept after it was last used
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024 # uploads kept on disk, least recently used are removed over this
+DEFAULT_TEXT_CACHE_MAX_BYTES = 256 * 1024 * 1024 # compressed extracted text kept on disk
+CLEANUP_INTERVAL = 600 # seconds between removals of old uploads
+TEXT_CACHE_VERSION = 3 # bump when extraction changes, so old cached text is not used
+
+# sha256 of the content and the original file extension, nothing else is accepted as an id
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$')
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+_PARTIAL_SUFFIX = ".part"
+
+
+def _extension(filename: str) -> str:
+    """
+    Returns:
+        string: Lower case extension of the filename with the dot, "" if it has none or it's not usable in an id.
+    """
+    extension = os.path.splitext(secure_filename(filename or ""))[1].lower()
+    return extension if _UPLOAD_ID.match("0" * 64 + extension) else ""
+
+
+def max_content_length() -> int:
+    """
+    Returns:
+        int: Max upload size in bytes, MAX_CONTENT_LENGTH env or DEFAULT_MAX_CONTENT_LENGTH.
+    """
+    return int(os.getenv('MAX_CONTENT_LENGTH', DEFAULT_MAX_CONTENT_LENGTH))
+
+
+class UploadError(ValueError):
+    """
+    Raised when an upload is rejected.
+    """
+    pass
+
+
+class UploadTooLargeError(UploadError):
+    """
+    Raised when an upload is over the max size. Nothing is kept of it.
+    """
+    pass
+
+
+class UploadStore():
+    """
+    Uploaded files in a spool directory, named by the SHA-256 of their content and the original extension
+    (the extension decides how text is extracted). Files are written under a temporary name and renamed when complete,
+    so a partial upload is never analyzed. A file that is already stored is not written again.
+
+    Uploads are kept after analysis, so the same document can be analyzed again without uploading it.
+    Files in use (see `using()`) are never removed, others are removed least recently used first
+    when the store is over max_bytes, and when they haven't been used for max_age.
+    Should be initialized once and used through one instance.
+    """
+    def __init__(self, directory: str = None, chunk_size: int = None, max_size: int = None, max_age: float = None, max_bytes: int = None):
+        """
+        Args:
+            directory (string, optional): Spool directory. Defaults to UPLOAD_DIR env or DEFAULT_UPLOAD_DIR.
+            chunk_size (int, optional): Bytes read at a time. Defaults to DEFAULT_CHUNK_SIZE.
+            max_size (int, optional): Max bytes per file. Defaults to `max_content_length()`.
+            max_age (float, optional): Seconds an upload is kept after its last use. Defaults to UPLOAD_MAX_AGE env or DEFAULT_MAX_AGE.
+            max_bytes (int, optional): Max total size of the uploads. Defaults to UPLOAD_MAX_BYTES env or DEFAULT_MAX_BYTES.
+        """
+        self.__directory = directory or os.getenv('UPLOAD_DIR') or DEFAULT_UPLOAD_DIR
+        self.__chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        self.__max_size = max_size if max_size != None else max_content_length()
+        self.__max_age = max_age if max_age != None else float(os.getenv('UPLOAD_MAX_AGE', DEFAULT_MAX_AGE))
+        self.__max_bytes = max_bytes if max_bytes != None else int(os.getenv('UPLOAD_MAX_BYTES', DEFAULT_MAX_BYTES))
+        self.__lock = threading.Lock()
+        self.__last_cleanup = 0.0
+        self.__in_use = {} # upload id -> number of users
+
+        os.makedirs(self.__directory, exist_ok=True)
+
+    def save(self, stream, filename: str) -> dict:
+        """
+        Stream a file into the store, hashing it while it is written. If the same content with the same extension
+        is already stored, the new copy is dropped and the stored one is used.
+
+        Args:
+            stream (BinaryIO): Readable binary stream, e.g. request.stream or an uploaded file's stream.
+            filename (string): Original filename, only its extension is used.
+
+        Raises:
+            UploadTooLargeError: If the file is over the max size.
+            OSError: If the file can't be written.
+
+        Returns:
+            dict: {"id": upload id, "filename": original filename, "size": bytes, "sha256": hex digest,
+                "reused": True if the content was already stored}
+        """
+        self.__cleanup_if_due()
+
+        # unique partial name, concurrent uploads of the same content don't write into the same file
+        partial = os.path.join(self.__directory, uuid.uuid4().hex + _PARTIAL_SUFFIX)
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(partial, 'wb') as file:
+                while True:
+                    chunk = stream.read(self.__chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.__max_size:
+                        raise UploadTooLargeError(f"File is larger than {self.__max_size} bytes")
+                    digest.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            try:
+                os.remove(partial)
+            except FileNotFoundError:
+                pass
+            raise
+
+        sha256 = digest.hexdigest()
+        upload_id = sha256 + _extension(filename)
+        path = os.path.join(self.__directory, upload_id)
+        reused = self.__touch(path)
+        if reused:
+            os.remove(partial)
+        else:
+            os.replace(partial, path)
+            self.__evict(keep=upload_id)
+
+        return {"id": upload_id, "filename": filename, "size": size, "sha256": sha256, "reused": reused}
+
+    def find(self, sha256: str, filename: str) -> dict:
+        """
+        Look up stored content by hash, so a client can skip uploading a file the store already has.
+
+        Args:
+            sha256 (string): Hex digest of the file content.
+            filename (string): Original filename, only its extension is used.
+
+        Returns:
+            dict or None:
+                - dict like from `save()`, with "reused" True.
+                - None if the content is not stored.
+        """
+        sha256 = (sha256 or "").lower()
+        if not _SHA256.match(sha256):
+            return None
+        upload_id = sha256 + _extension(filename)
+        path = os.path.join(self.__directory, upload_id)
+        if not self.__touch(path):
+            return None
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        return {"id": upload_id, "filename": filename, "size": size, "sha256": sha256, "reused": True}
+
+    def path(self, upload_id: str) -> str:
+        """
+        Args:
+            upload_id (string): Id from `save()`.
+
+        Returns:
+            string or None:
+                - string containing the path of the uploaded file.
+                - None if the id is invalid or the upload doesn't exist (anymore).
+        """
+        if not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+            return None
+        path = os.path.join(self.__directory, upload_id)
+        return path if os.path.isfile(path) else None
+
+    @contextmanager
+    def using(self, upload_id: str):
+        """
+        Use an upload, e.g. for analysis. The upload is not removed while it is in use,
+        and it counts as recently used for eviction.
+
+        Usage:
+            with uploads.using(upload_id) as filepath:
+                if filepath is None:
+                    ... # not found
+                apiHandler.analyze_file(filepath, ...)
+
+        Yields:
+            string or None: Path of the uploaded file, None if the id is invalid or the upload doesn't exist.
+        """
+        path = self.acquire(upload_id)
+        try:
+            yield path
+        finally:
+            if path is not None:
+                self.release(upload_id)
+
+    def acquire(self, upload_id: str) -> str:
+        """
+        Mark an upload as in use, see `using()`. Every successful acquire() must be followed by `release()`.
+
+        Returns:
+            string or None: Path of the uploaded file, None if the id is invalid or the upload doesn't exist.
+        """
+        if not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+            return None
+        with self.__lock:
+            path = os.path.join(self.__directory, upload_id)
+            if not self.__touch(path):
+                return None
+            self.__in_use[upload_id] = self.__in_use.get(upload_id, 0) + 1
+            return path
+
+    def release(self, upload_id: str):
+        """
+        End one use of an upload started with `acquire()`.
+        """
+        with self.__lock:
+            count = self.__in_use.get(upload_id, 0) - 1
+            if count > 0:
+                self.__in_use[upload_id] = count
+            else:
+                self.__in_use.pop(upload_id, None)
+
+    def delete(self, upload_id: str) -> bool:
+        """
+        Remove an upload now instead of waiting for eviction.
+
+        Returns:
+            bool:
+                - True when the upload was removed.
+                - False when it didn't exist, the id is invalid or it is in use.
+        """
+        path = self.path(upload_id)
+        if path is None:
+            return False
+        with self.__lock:
+            if upload_id in self.__in_use:
+                return False
+        try:
+            os.remove(path)
+        except (FileNotFoundError, PermissionError):
+            return False
+        return True
+
+    def cleanup(self) -> int:
+        """
+        Remove uploads not used for max_age (and abandoned partial uploads). Uploads in use are kept.
+
+        Returns:
+            int: Number of files removed.
+        """
+        cutoff = time.time() - self.__max_age
+        with self.__lock:
+            in_use = set(self.__in_use)
+        removed = 0
+        with os.scandir(self.__directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.name not in in_use and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except (FileNotFoundError, PermissionError):
+                    continue
+        return removed
+
+    def __cleanup_if_due(self):
+        with self.__lock:
+            now = time.monotonic()
+            if self.__last_cleanup and now - self.__last_cleanup < CLEANUP_INTERVAL:
+                return
+            self.__last_cleanup = now
+        self.cleanup()
+
+    def __touch(self, path) -> bool:
+        """
+        Mark a file as recently used.
+
+        Returns:
+            bool:
+                - True when the file exists.
+                - False otherwise.
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def __evict(self, keep: str):
+        """
+        Remove least recently used uploads over max_bytes, except the ones in use and keep.
+        """
+        with self.__lock:
+            skip = set(self.__in_use) | {keep}
+        utils.evict_lru(self.__directory, self.__max_bytes, skip, (_PARTIAL_SUFFIX, ".tmp"))
+
+
+class TextCache():
+    """
+    Extracted text of uploads, keyed by upload id (content hash and extension), so a document uploaded again
+    is not extracted again. Pages are stored gzip compressed, one JSON line per page, and read back
+    one page at a time. Least recently used entries are removed over max_bytes.
+    Should be initialized once and used through one instance.
+    """
+    def __init__(self, directory: str = None, max_bytes: int = None):
+        """
+        Args:
+            directory (string, optional): Cache directory. Defaults to TEXT_CACHE_DIR env or DEFAULT_TEXT_CACHE_DIR.
+            max_bytes (int, optional): Max total size of the compressed text. Defaults to TEXT_CACHE_MAX_BYTES env
+                or DEFAULT_TEXT_CACHE_MAX_BYTES. 0 disables the cache.
+        """
+        self.__directory = directory or os.getenv('TEXT_CACHE_DIR') or DEFAULT_TEXT_CACHE_DIR
+        self.__max_bytes = max_bytes if max_bytes != None else int(os.getenv('TEXT_CACHE_MAX_BYTES', DEFAULT_TEXT_CACHE_MAX_BYTES))
+        self.__lock = threading.Lock()
+        self.__stats = {'hits': 0, 'misses': 0}
+
+        if self.__max_bytes > 0:
+            os.makedirs(self.__directory, exist_ok=True)
+
+    def iter_pages(self, filepath: str, upload_id: str = None):
+        """
+        Pages of a file like `utils.iter_text_from_file()`, from the cache when the upload was extracted before.
+        Otherwise the pages are extracted, yielded as they come and cached once all of them are extracted.
+
+        Args:
+            filepath (string): Path to the file.
+            upload_id (string, optional): Upload id of the file. Not cached without it.
+
+        Yields:
+            tuple[int, string]: (page number starting from 1, text of the page).
+        """
+        if self.__max_bytes <= 0 or not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+            yield from utils.iter_text_from_file(filepath)
+            return
+
+        path = os.path.join(self.__directory, f"v{TEXT_CACHE_VERSION}-{upload_id}.jsonl.gz")
+        yielded = False
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                os.utime(path)
+                self.__count('hits')
+                for line in file:
+                    page_number, text = json.loads(line)
+                    yielded = True
+                    yield page_number, text
+            return
+        except FileNotFoundError:
+            self.__count('misses')
+        except (OSError, EOFError, ValueError):
+            # broken entry, extract again unless part of it was already used
+            self.__remove(path)
+            if yielded:
+                raise
+
+        yield from self.__extract(filepath, path)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: hits and misses.
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __count(self, name):
+        with self.__lock:
+            self.__stats[name] += 1
+
+    def __extract(self, filepath, path):
+        """
+        Extract pages, writing them to a temporary file that replaces the entry only when every page is written.
+        Nothing is cached if the consumer stops early or extraction fails.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.__directory, suffix='.tmp')
+        complete = False
+        try:
+            # gzip doesn't close a file object it was given, so the descriptor is closed by the outer with
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as file:
+                for page_number, text in utils.iter_text_from_file(filepath):
+                    file.write(json.dumps([page_number, text], ensure_ascii=False) + "\n")
+                    yield page_number, text
+            complete = True
+        finally:
+            if complete:
+                os.replace(temp_path, path)
+                utils.evict_lru(self.__directory, self.__max_bytes, {os.path.basename(path)})
+            else:
+                self.__remove(temp_path)
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except (FileNotFoundError, PermissionError):
+            pass
@@ -1,13 +1,548 @@
 import pymupdf
+import codecs
+import csv
+import hashlib
+import io
+import itertools
+import mmap
+import os
+import re
+import zipfile
+from xml.etree import ElementTree
 import os.path
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 """
 Various utility functions used in the backend.
 """
 
+TXT_BLOCK_SIZE = 1024 * 1024 # characters per block yielded from txt files
+TXT_READ_SIZE = 256 * 1024 # bytes decoded at a time from txt files
+TXT_SNIFF_SIZE = 64 * 1024 # bytes from the start of a txt file used for detecting its encoding
+TXT_FALLBACK_ENCODING = "cp1252" # Windows Latin-1, used when the encoding can't be detected
+TXT_CHAOS_MARGIN = 0.1 # charset_normalizer candidates this close to the best one count as plausible
+TXT_MIN_CONFIDENCE = 0.5 # chardet guesses below this are not used
+DEFAULT_PARALLEL_EXTRACT_MIN_PAGES = 64 # PDFs with at least this many pages are extracted with a process pool
+
+MAGIC_SIZE = 8 # bytes from the start of a file compared with extractor signatures
+
+# Text extractors by MIME type, see register_extractor()
+_EXTRACTORS = {}
+_EXTENSIONS = {} # lower case extension with the dot -> MIME type
+_SIGNATURES = [] # (magic bytes, MIME type), checked before extensions
+
+_MARKDOWN_HEADING = re.compile(r"^ {0,3}#{1,6}(\s|$)")
+_MARKDOWN_FENCE = re.compile(r"^ {0,3}(```|~~~)")
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+_WORD = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Shared process pool for PDF extraction, started by start_extract_pool()
+_extract_pool = None
+_extract_pool_lock = threading.Lock()
+
+
+def _available_cpus() -> int:
+    """
+    Returns:
+        int: CPUs this process may use, from CPU affinity and the cgroup v2 CPU quota of the container.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def _extract_workers() -> int:
+    """
+    Returns:
+        int: Number of PDF extraction processes, EXTRACT_WORKERS env or available CPUs.
+    """
+    return int(os.getenv('EXTRACT_WORKERS', 0)) or _available_cpus()
+
+
+def start_extract_pool() -> ProcessPoolExecutor | None:
+    """
+    Start the shared PDF extraction process pool. Call at app startup, before any threads exist: workers are forked
+    where possible (spawned workers would run app/__init__.py again), and forking a multithreaded process can deadlock.
+    Without the pool, PDFs are extracted in the calling process.
+
+    Returns:
+        ProcessPoolExecutor: The pool, None when there's only one extraction worker.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None and _extract_workers() > 1:
+            if "fork" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("fork")
+            else:
+                context = multiprocessing.get_context()
+            _extract_pool = ProcessPoolExecutor(max_workers=_extract_workers(), mp_context=context)
+            # forked workers are all started with the first task, so they are created now and not later from a thread
+            _extract_pool.submit(int).result()
+        return _extract_pool
+
+
+def stop_extract_pool():
+    """
+    Shut down the shared PDF extraction process pool, if started.
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is not None:
+            _extract_pool.shutdown(cancel_futures=True)
+            _extract_pool = None
+
+
+def _extract_page_range(filepath: str, start: int, stop: int) -> list[str]:
+    """
+    Extract text of pages [start, stop) of a PDF. Run in a worker process, each worker opens the document itself.
+
+    Returns:
+        list[string]: Text of each page in order.
+    """
+    with pymupdf.open(filepath) as file:
+        return [file[index].get_text() for index in range(start, stop)]
+
+
+def _iter_pdf_parallel(pool: ProcessPoolExecutor, filepath: str, page_count: int):
+    """
+    Extract PDF pages with the process pool. Page range is split into slices, slices are extracted in parallel
+    and yielded in page order as soon as each next slice is ready.
+
+    Yields:
+        tuple[int, string]: (page number starting from 1, text of the page).
+    """
+    # a few slices per worker, so the first pages are ready early and slow slices don't hold up the rest
+    slice_size = max(1, math.ceil(page_count / (_extract_workers() * 4)))
+
+    futures = [
+        (start, pool.submit(_extract_page_range, filepath, start, min(start + slice_size, page_count)))
+        for start in range(0, page_count, slice_size)
+    ]
+    try:
+        for start, future in futures:
+            for offset, text in enumerate(future.result()):
+                yield start + offset + 1, text
+    finally:
+        # consumer stopped early, don't extract the remaining slices
+        for start, future in futures:
+            future.cancel()
+
+
+def _detect_encoding(prefix: bytes) -> str:
+    """
+    Detect the encoding of a txt file from the start of it. Byte order marks are checked first, then UTF-8,
+    then charset_normalizer or chardet if either is installed, and TXT_FALLBACK_ENCODING as a last resort.
+
+    Args:
+        prefix (bytes): Start of the file, at most TXT_SNIFF_SIZE bytes.
+
+    Returns:
+        string: Python codec name. BOMs are skipped by the returned codec.
+    """
+    # utf-32 first, its little endian BOM starts with the utf-16 one
+    for bom, encoding in [
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF32_LE, "utf-32"),
+        (codecs.BOM_UTF32_BE, "utf-32"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    ]:
+        if prefix.startswith(bom):
+            return encoding
+
+    try:
+        # not final, the prefix may end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    # Statistical detectors confuse single byte Latin code pages (Finnish cp1252 text is often detected as
+    # mac_iceland or hp_roman8), so their guess is used only when it's not plausibly TXT_FALLBACK_ENCODING
+    encoding = None
+    try:
+        import charset_normalizer
+        matches = charset_normalizer.from_bytes(prefix)
+        best = matches.best()
+        fallback_plausible = any(
+            TXT_FALLBACK_ENCODING in match.could_be_from_charset and match.chaos <= best.chaos + TXT_CHAOS_MARGIN
+            for match in matches
+        )
+        if best and best.coherence > 0 and not fallback_plausible:
+            encoding = best.encoding
+    except ImportError:
+        try:
+            import chardet
+            detected = chardet.detect(prefix)
+            if detected["confidence"] >= TXT_MIN_CONFIDENCE:
+                encoding = detected["encoding"]
+        except ImportError:
+            pass
+
+    try:
+        return codecs.lookup(encoding).name if encoding else TXT_FALLBACK_ENCODING
+    except LookupError:
+        return TXT_FALLBACK_ENCODING
+
+
+def _txt_block_end(block: str) -> int:
+    """
+    Where to end a txt block. The first line break at or after TXT_BLOCK_SIZE ends it. Once the block is that long
+    and the line doesn't end yet, the block ends at the previous line break instead, and a line longer than
+    TXT_BLOCK_SIZE is cut at its last whitespace (or at TXT_BLOCK_SIZE without any), so blocks don't grow without bound.
+
+    Returns:
+        int: End of the block, 0 to keep reading.
+    """
+    end = block.find("\n", TXT_BLOCK_SIZE - 1) + 1
+    if end == 0 and len(block) >= TXT_BLOCK_SIZE:
+        end = block.rfind("\n", 0, TXT_BLOCK_SIZE) + 1
+        if end == 0:
+            end = max(block.rfind(" ", 0, TXT_BLOCK_SIZE), block.rfind("\t", 0, TXT_BLOCK_SIZE)) + 1 or TXT_BLOCK_SIZE
+    return end
+
+
+def _iter_txt(filepath: str):
+    """
+    Read a txt file in blocks of whole lines. The file is memory mapped and decoded TXT_READ_SIZE bytes at a time,
+    so only the current block is held as text however large the file is.
+    Line endings are translated to "\n" and undecodable bytes are replaced, like reading in text mode.
+
+    Yields:
+        string: Blocks of about TXT_BLOCK_SIZE characters, ending in a line break except for the last one
+            and the parts of lines longer than TXT_BLOCK_SIZE.
+    """
+    with open(filepath, "rb") as file:
+        # empty files can't be mapped
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            encoding = _detect_encoding(data[:TXT_SNIFF_SIZE])
+            decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors="replace"), translate=True)
+
+            block = ""
+            for start in range(0, len(data), TXT_READ_SIZE):
+                block += decoder.decode(data[start:start + TXT_READ_SIZE])
+                end = _txt_block_end(block)
+                while end > 0:
+                    yield block[:end]
+                    block = block[end:]
+                    end = _txt_block_end(block)
+            block += decoder.decode(b"", final=True)
+            if block:
+                yield block
+
+
+def register_extractor(mime_type: str, extensions: list = (), signatures: list = ()):
+    """
+    Decorator registering a text extractor used by `iter_text_from_file()` for a file type.
+    The extractor gets the file path and yields (page or section number starting from 1, text) pairs.
+    Optional libraries should be imported inside the extractor, so they are needed only when the file type is used.
+
+    Args:
+        mime_type (string): MIME type of the files. Replaces an earlier extractor of the type.
+        extensions (list[string], optional): Lower case extensions with the dot, e.g. [".md"].
+        signatures (list[bytes], optional): Magic bytes the files start with. Checked before the extension,
+            so the content decides when the extension is wrong.
+    """
+    def decorator(extractor):
+        _EXTRACTORS[mime_type] = extractor
+        for extension in extensions:
+            _EXTENSIONS[extension] = mime_type
+        for signature in signatures:
+            _SIGNATURES.append((signature, mime_type))
+        return extractor
+    return decorator
+
+
+def detect_mime_type(filepath: str) -> str:
+    """
+    Detect the type of a file from its magic bytes, or from the extension when no signature matches.
+
+    Args:
+        filepath (string): Path to the file.
+
+    Returns:
+        string: MIME type of a registered extractor, None if the type is not supported.
+    """
+    try:
+        with open(filepath, "rb") as file:
+            prefix = file.read(MAGIC_SIZE)
+    except OSError:
+        prefix = b""
+
+    for signature, mime_type in _SIGNATURES:
+        if prefix.startswith(signature):
+            return mime_type
+    return _EXTENSIONS.get(os.path.splitext(filepath)[1].lower())
+
+
+def _iter_lines(filepath: str):
+    """
+    Read a text file line by line, see `_iter_txt()` for decoding.
+
+    Yields:
+        string: Lines with their line breaks.
+    """
+    for block in _iter_txt(filepath):
+        # StringIO splits only at "\n", unlike str.splitlines()
+        yield from io.StringIO(block)
+
+
+def _iter_sections(lines):
+    """
+    Split Markdown into sections starting at headings. Headings in fenced code blocks don't start a section,
+    and headings with no text before them join the previous heading's section.
+    Sections longer than TXT_BLOCK_SIZE are yielded in blocks of whole lines with the same section number.
+
+    Args:
+        lines (Iterable[string]): Lines with their line breaks.
+
+    Yields:
+        tuple[int, string]: (section number starting from 1, text of the section).
+    """
+    section = 1
+    block = []
+    block_size = 0
+    has_text = False
+    fence = None
+    for line in lines:
+        fence_match = _MARKDOWN_FENCE.match(line)
+        if fence_match and fence is None:
+            fence = fence_match.group(1)
+        elif fence_match and fence_match.group(1) == fence:
+            fence = None
+        elif fence is None and has_text and _MARKDOWN_HEADING.match(line):
+            if block:
+                yield section, "".join(block)
+            section += 1
+            block = []
+            block_size = 0
+            has_text = False
+
+        block.append(line)
+        block_size += len(line)
+        has_text = has_text or line.strip() != ""
+        if block_size >= TXT_BLOCK_SIZE:
+            yield section, "".join(block)
+            block = []
+            block_size = 0
+    if block:
+        yield section, "".join(block)
+
+
+@register_extractor("application/pdf", [".pdf"], [b"%PDF-"])
+def _iter_pdf(filepath: str):
+    """
+    Extract PDF pages, in parallel with the process pool (if started) for PDFs with at least
+    PARALLEL_EXTRACT_MIN_PAGES (env) pages.
+    """
+    pool = _extract_pool
+    with pymupdf.open(filepath) as file:
+        page_count = file.page_count
+        min_pages = int(os.getenv('PARALLEL_EXTRACT_MIN_PAGES', DEFAULT_PARALLEL_EXTRACT_MIN_PAGES))
+        parallel = pool is not None and page_count >= min_pages
+        if not parallel:
+            for page_number, page in enumerate(file, start=1):
+                yield page_number, page.get_text()
+
+    if parallel:
+        yield from _iter_pdf_parallel(pool, filepath, page_count)
+
+
+@register_extractor("text/plain", [".txt"])
+def _iter_plain_text(filepath: str):
+    """
+    Txt files have no pages, they are yielded in blocks of whole lines, all as page 1.
+    """
+    for block in _iter_txt(filepath):
+        yield 1, block
+
+
+@register_extractor("text/markdown", [".md", ".markdown"])
+def _iter_markdown(filepath: str):
+    """
+    Markdown is yielded by sections starting at headings, see `_iter_sections()`.
+    """
+    yield from _iter_sections(_iter_lines(filepath))
+
+
+@register_extractor("text/html", [".html", ".htm", ".xhtml"])
+def _iter_html(filepath: str):
+    """
+    HTML is converted to Markdown with html2text after scripts and styles are removed with lxml,
+    and yielded by sections like Markdown. The whole document is parsed at once.
+    """
+    import html2text
+    import lxml.html
+    from lxml import etree
+
+    with open(filepath, "rb") as file:
+        data = file.read()
+    if data.strip() == b"":
+        return
+    html = data.decode(_detect_encoding(data[:TXT_SNIFF_SIZE]), errors="replace")
+    # lxml refuses decoded text with an XML declaration (XHTML)
+    document = lxml.html.document_fromstring(_XML_DECLARATION.sub("", html, count=1))
+    etree.strip_elements(document, "script", "style", "noscript", "template", with_tail=False)
+
+    converter = html2text.HTML2Text()
+    converter.body_width = 0 # don't wrap lines
+    converter.ignore_images = True
+    converter.ignore_links = True # link texts are kept
+    text = converter.handle(lxml.html.tostring(document, encoding="unicode"))
+    yield from _iter_sections(io.StringIO(text))
+
+
+@register_extractor("text/csv", [".csv"])
+def _iter_csv(filepath: str):
+    """
+    CSV rows are yielded as lines of cells separated by " | ", in sections of about TXT_BLOCK_SIZE characters.
+    Every section starts with the first row, so columns can be told apart in any chunk of the text.
+    The delimiter is detected from the start of the file.
+    """
+    lines = _iter_lines(filepath)
+    sample = []
+    sample_size = 0
+    for line in lines:
+        sample.append(line)
+        sample_size += len(line)
+        if sample_size >= TXT_SNIFF_SIZE:
+            break
+    try:
+        dialect = csv.Sniffer().sniff("".join(sample), delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+
+    header = None
+    section = 1
+    block = []
+    block_size = 0
+    for row in csv.reader(itertools.chain(sample, lines), dialect):
+        if not any(cell.strip() for cell in row):
+            continue
+        line = " | ".join(cell.strip() for cell in row) + "\n"
+        if header is None:
+            header = line
+            block = [header]
+            block_size = len(header)
+            continue
+
+        block.append(line)
+        block_size += len(line)
+        if block_size >= TXT_BLOCK_SIZE:
+            yield section, "".join(block)
+            section += 1
+            block = [header]
+            block_size = len(header)
+    if header is not None and (section == 1 or len(block) > 1):
+        yield section, "".join(block)
+
+
+@register_extractor(
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document", [".docx"], [b"PK\x03\x04"]
+)
+def _iter_docx(filepath: str):
+    """
+    Word documents are read by streaming word/document.xml from the archive, so no Word library is needed.
+    Pages end at page breaks, both explicit ones and the ones Word saved from its last layout.
+    Pages longer than TXT_BLOCK_SIZE are yielded in blocks of whole paragraphs with the same page number.
+    Nothing is yielded for other zip files (e.g. .xlsx) or files that are not zip files.
+    """
+    try:
+        archive = zipfile.ZipFile(filepath)
+    except zipfile.BadZipFile:
+        return
+
+    with archive:
+        if "word/document.xml" not in archive.namelist():
+            return
+        with archive.open("word/document.xml") as document:
+            page_number = 1
+            block = []
+            block_size = 0
+            paragraph = []
+            for event, element in ElementTree.iterparse(document):
+                tag = element.tag
+                page_break = tag == f"{_WORD}lastRenderedPageBreak" or (
+                    tag == f"{_WORD}br" and element.get(f"{_WORD}type") == "page"
+                )
+                if tag == f"{_WORD}t":
+                    paragraph.append(element.text or "")
+                elif tag == f"{_WORD}tab":
+                    paragraph.append("\t")
+                elif tag in (f"{_WORD}br", f"{_WORD}cr") and not page_break:
+                    paragraph.append("\n")
+                elif tag == f"{_WORD}p":
+                    block.append("".join(paragraph) + "\n")
+                    block_size += len(block[-1])
+                    paragraph = []
+                    # paragraphs are done, free them
+                    element.clear()
+                    if block_size >= TXT_BLOCK_SIZE:
+                        yield page_number, "".join(block)
+                        block = []
+                        block_size = 0
+
+                # Word saves a rendered break after an explicit one too, so breaks on an empty page are ignored
+                if page_break and (block or paragraph):
+                    block.append("".join(paragraph))
+                    paragraph = []
+                    text = "".join(block)
+                    if text.strip():
+                        yield page_number, text
+                    page_number += 1
+                    block = []
+                    block_size = 0
+
+            if block:
+                yield page_number, "".join(block)
+
+
+def iter_text_from_file(filepath: str):
+    """
+    Extracts text from a given file page by page. Supports PDF, txt, Markdown, HTML, CSV and DOCX files.
+    Pages are yielded as soon as they are parsed, so processing can start before the whole document is read
+    and the whole text never has to be in memory at once.
+    The file type is detected from magic bytes or the extension (`detect_mime_type()`), more types can be added
+    with `register_extractor()`.
+    PDFs with at least PARALLEL_EXTRACT_MIN_PAGES (env) pages are extracted in parallel by the process pool
+    started with `start_extract_pool()`.
+
+    Args:
+        filepath (string): Absolute path to the file to extract text from.
+
+    Yields:
+        tuple[int, string]: (page number starting from 1, text of the page).
+            Txt files have no pages, they are yielded in blocks of about TXT_BLOCK_SIZE characters, all as page 1.
+            Text encodings are detected from the start of the file, see `_detect_encoding()`.
+            Markdown and HTML are numbered by sections starting at headings, and CSV by blocks of rows.
+            Nothing is yielded if the file is not found or the file type is not supported.
+    """
+    if not os.path.isfile(filepath):
+        return
+
+    extractor = _EXTRACTORS.get(detect_mime_type(filepath))
+    if extractor is not None:
+        yield from extractor(filepath)
+
+
 def extract_text_from_file(filepath: str) -> str:
     """
-    Extracts text from a given file. Supports PDF and txt files.
+    Extracts text from a given file. Supports the file types of `iter_text_from_file()`.
+    Joins the pages from `iter_text_from_file()`, pages are separated with a form feed ("\\f").
 
     Args:
         filepath (string): Absolute path to the file to extract text from.
@@ -17,24 +552,92 @@ def extract_text_from_file(filepath: str) -> str:
             Can be None if the file is not found or no text was extracted (empty file).
             Strips the end of the text to remove unnecessary whitespace.
     """
-    if not os.path.isfile(filepath):
-        return None
-    
-    text = ""
+    return join_pages(iter_text_from_file(filepath))
+
 
-    # .pdf extraction
-    if filepath.endswith(".pdf"):
-        with pymupdf.open(filepath) as file:
-            for page in file:
-                text += page.get_text()
+def content_hash(text: str) -> str:
+    """
+    Content hash of a page or a part of one, the same for the same text in any document or revision.
+
+    Args:
+        text (string): Text to hash.
 
-    # .txt extraction
-    elif filepath.endswith(".txt"):
-        with open(filepath, "r") as file:
-            text = file.read()
+    Returns:
+        string: sha256 hex digest of the UTF-8 text.
+    """
+    return hashlib.sha256(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def evict_lru(directory: str, max_bytes: int, skip: set = frozenset(), partial_suffixes: tuple = (".tmp",),
+              recursive: bool = False) -> int:
+    """
+    Remove the least recently used (oldest modification time) files of a directory until the rest fit in max_bytes.
+    Partial files are not counted or removed.
+
+    Args:
+        directory (string): Directory to clean.
+        max_bytes (int): Max total size of the files kept.
+        skip (set[string], optional): Filenames that must not be removed, e.g. files in use.
+        partial_suffixes (tuple[string], optional): Suffixes of files still being written. Defaults to (".tmp",).
+        recursive (bool, optional): Include files in subdirectories. Defaults to False.
+
+    Returns:
+        int: Number of files removed.
+    """
+    files = []
+    directories = [directory]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if recursive and entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif entry.is_file() and not entry.name.endswith(partial_suffixes):
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, stat.st_size, entry.name, entry.path))
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+    total = sum(size for mtime, size, name, path in files)
+    removed = 0
+    for mtime, size, name, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if name in skip:
+            continue
+        try:
+            os.remove(path)
+        except (FileNotFoundError, PermissionError):
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def join_pages(pages) -> str:
+    """
+    Joins pages from `iter_text_from_file()` into one text, see `extract_text_from_file()`.
+
+    Args:
+        pages (Iterable[tuple[int, string]]): (page number, text) pairs.
+
+    Returns:
+        string: Text of the pages, None if there was no text.
+    """
+    parts = []
+    previous_page = None
+    for page_number, text in pages:
+        # form feed marks page boundaries for chunking
+        if previous_page is not None and page_number != previous_page:
+            parts.append("\f")
+        parts.append(text)
+        previous_page = page_number
 
     # Empty check to return None if no text was extracted
-    text = text.strip()
+    text = "".join(parts).strip()
     if text == "":
         return None
-    return text
\ No newline at end of file
+    return text
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the backend. Not run by pytest, run them manually from backend-folder:
+
+- "python -m benchmarks.<module>"
+
+Database benchmarks need a running database (same setup as tests/test_database.py) and will clear it.
+"""
@@ -0,0 +1,66 @@
+"""
+Benchmark for serial vs. process pool PDF text extraction (utils.iter_text_from_file()).
+
+PDFs of different lengths are generated with PyMuPDF into a temporary directory,
+each one is extracted serially and in parallel (EXTRACT_WORKERS processes).
+Process pool start up is excluded, the pool is shared and stays up in the backend.
+
+Usage:
+- "python -m benchmarks.bench_pdf_extraction" command in backend-folder
+- EXTRACT_WORKERS env sets the number of processes, defaults to CPU count
+"""
+
+import os
+import tempfile
+import pymupdf
+from app import utils
+from benchmarks.common import measure, print_table
+
+PAGE_COUNTS = [50, 200, 500]
+LINES_PER_PAGE = 45
+REPEATS = 3
+
+
+def generate_pdf(filepath: str, pages: int):
+    """
+    Write a PDF with pages full of text, similar to parliamentary minutes.
+    """
+    document = pymupdf.open()
+    line = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. "
+    for number in range(pages):
+        page = document.new_page()
+        text = "\n".join(f"{number}:{row} {line}" for row in range(LINES_PER_PAGE))
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=8)
+    document.save(filepath)
+    document.close()
+
+
+def extract(filepath: str, parallel: bool) -> int:
+    """
+    Extract all pages, returns extracted character count.
+    """
+    os.environ['PARALLEL_EXTRACT_MIN_PAGES'] = "1" if parallel else str(10**9)
+    return sum(len(text) for page_number, text in utils.iter_text_from_file(filepath))
+
+
+def main():
+    workers = utils._extract_workers()
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for pages in PAGE_COUNTS:
+            filepath = os.path.join(directory, f"generated_{pages}.pdf")
+            generate_pdf(filepath, pages)
+
+            # start pool before timing
+            extract(filepath, parallel=True)
+
+            serial_ms, _ = measure(lambda: extract(filepath, parallel=False), REPEATS)
+            parallel_ms, _ = measure(lambda: extract(filepath, parallel=True), REPEATS)
+            rows.append([pages, f"{serial_ms:.0f} ms", f"{parallel_ms:.0f} ms", f"{serial_ms / parallel_ms:.1f}x"])
+
+    print(f"PDF extraction, {workers} worker processes, median of {REPEATS}")
+    print_table(["pages", "serial", "parallel", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark '/get_projects' data loading: old N+1 fan-out vs. Database.lookup_project_tree().
+
+Seeds the database with projects x results (each result with a used blueprint) and compares
+round trips and latency of both approaches.
+
+Usage:
+- "python -m benchmarks.bench_project_tree" command in backend-folder
+
+Warning: clears the database.
+"""
+
+import os
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+from app.database import Database, NodeProperties, NodeLabels
+from benchmarks.common import measure, print_table
+
+# (projects, results per project)
+TREE_SIZES = [(1, 1), (5, 5), (10, 10), (25, 20), (50, 40)]
+
+
+def legacy_get_projects(database: Database) -> list[dict]:
+    """
+    Old '/get_projects' implementation, one query per property.
+    """
+    projects = []
+    for proj in database.lookup_nodes(NodeLabels.PROJECT):
+        results = []
+        for res in database.lookup_nodes(NodeLabels.RESULT_BLUEPRINT, NodeLabels.PROJECT, proj[0]):
+            id = res[0]
+            name = database.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME)
+            filename = database.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.FILENAME)
+            result = database.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.RESULT)
+
+            temp = database.lookup_nodes(NodeLabels.USED_BLUEPRINT, NodeLabels.RESULT_BLUEPRINT, id)
+            used_blueprint_id = temp[0][0] if temp != [] else None
+            blueprint = {
+                "id": used_blueprint_id,
+                "name": database.lookup_node_property(used_blueprint_id, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.NAME),
+                "description": database.lookup_node_property(used_blueprint_id, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.DESCRIPTION),
+                "questions": database.lookup_node_property(used_blueprint_id, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.QUESTIONS),
+            }
+            results.append({"id": id, "name": name, "filename": filename, "result": result, "blueprint": blueprint})
+        projects.append({"id": proj[0], "open": False, "name": proj[1], "results": results})
+    return projects
+
+
+def seed(driver, projects: int, results: int):
+    """
+    Seed the tree with a single query, so seeding time doesn't dominate the benchmark.
+    """
+    driver.execute_query(
+        """
+        UNWIND range(1, $projects) AS p_index
+        CREATE (p:Project {id: randomUUID(), name: 'project_' + p_index, datetime: datetime()})
+        WITH p
+        UNWIND range(1, $results) AS r_index
+        CREATE (r:ResultBlueprint {id: randomUUID(), name: 'result_' + r_index, filename: 'file.pdf',
+                                   result: 'Lorem ipsum dolor sit amet', datetime: datetime()})
+        CREATE (r)-[:BELONGS_TO]->(p)
+        CREATE (u:UsedBlueprint {id: randomUUID(), name: 'blueprint', description: 'description',
+                                 questions: ['question 1', 'question 2'], datetime: datetime()})
+        CREATE (u)-[:USED_IN_ANALYSIS]->(r)
+        """,
+        projects=projects,
+        results=results,
+        database_=os.getenv('DB_NAME'),
+    )
+
+
+def main():
+    load_dotenv()
+    database = Database()
+    driver = GraphDatabase.driver(os.getenv('DB_URL'), auth=(os.getenv('DB_USERNAME'), os.getenv('DB_PASSWORD')))
+
+    rows = []
+    for projects, results in TREE_SIZES:
+        database.debug_clear_all()
+        seed(driver, projects, results)
+
+        legacy_ms, legacy_round_trips = measure(lambda: legacy_get_projects(database), repeats=3)
+        tree_ms, tree_round_trips = measure(database.lookup_project_tree, repeats=3)
+
+        rows.append([
+            f"{projects}x{results}",
+            legacy_round_trips, f"{legacy_ms:.1f}",
+            tree_round_trips, f"{tree_ms:.1f}",
+            f"{legacy_ms / tree_ms:.1f}x",
+        ])
+
+    database.debug_clear_all()
+    driver.close()
+    print_table(["tree", "legacy queries", "legacy ms", "tree queries", "tree ms", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Microbenchmark for parameterized, memoized queries vs. values concatenated into the query text.
+
+1. Python side: building the query string on every call vs. _render_query() cache hit.
+2. Database side: unique query text for every value (Neo4j has to plan every query)
+   vs. the same query text with $parameters (plan is reused from Neo4j query cache).
+
+Usage:
+- "python -m benchmarks.bench_query_templates" command in backend-folder
+
+Warning: clears the database.
+"""
+
+import os
+import time
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+from app.database import Database, _render_query
+from benchmarks.common import print_table
+
+NODES = 500
+RENDER_ITERATIONS = 100_000
+
+
+def concatenated_query(type, id_type, id_value, property_name):
+    """
+    Old way of building lookup_node_property() query.
+    """
+    return (
+        "MATCH (n:" + type + " {" + id_type + ": '" + id_value + "'}) "
+        "RETURN n." + property_name + " AS " + property_name
+    )
+
+
+def bench_render() -> list[list]:
+    id_value = "00000000-0000-4000-8000-000000000000"
+
+    start = time.perf_counter()
+    for _ in range(RENDER_ITERATIONS):
+        concatenated_query("Project", "id", id_value, "name")
+    concatenated_us = (time.perf_counter() - start) / RENDER_ITERATIONS * 1_000_000
+
+    _render_query.cache_clear()
+    start = time.perf_counter()
+    for _ in range(RENDER_ITERATIONS):
+        _render_query('lookup_node_property', type="Project", id_type="id", property_name="name")
+    rendered_us = (time.perf_counter() - start) / RENDER_ITERATIONS * 1_000_000
+
+    return [
+        ["python: concatenated", RENDER_ITERATIONS, f"{concatenated_us:.3f} us"],
+        ["python: _render_query()", RENDER_ITERATIONS, f"{rendered_us:.3f} us"],
+    ]
+
+
+def bench_planning(driver, database_name) -> list[list]:
+    ids = [record["id"] for record in driver.execute_query(
+        "UNWIND range(1, $count) AS i CREATE (n:Project {id: randomUUID(), name: 'project_' + i}) RETURN n.id AS id",
+        count=NODES,
+        database_=database_name,
+    ).records]
+    rows = []
+
+    with driver.session(database=database_name) as session:
+        # every query text is different, so every query is planned
+        start = time.perf_counter()
+        for id_value in ids:
+            session.run(concatenated_query("Project", "id", id_value, "name")).consume()
+        literal_ms = (time.perf_counter() - start) * 1000
+        rows.append(["neo4j: literal values", NODES, f"{literal_ms / NODES:.3f} ms"])
+
+        # same query text, planned once
+        query_string = _render_query('lookup_node_property', type="Project", id_type="id", property_name="name")
+        start = time.perf_counter()
+        for id_value in ids:
+            session.run(query_string, id_value=id_value).consume()
+        parameter_ms = (time.perf_counter() - start) * 1000
+        rows.append(["neo4j: $parameters", NODES, f"{parameter_ms / NODES:.3f} ms"])
+
+    return rows
+
+
+def main():
+    load_dotenv()
+    database = Database()
+    database.debug_clear_all()
+    driver = GraphDatabase.driver(os.getenv('DB_URL'), auth=(os.getenv('DB_USERNAME'), os.getenv('DB_PASSWORD')))
+
+    rows = bench_render() + bench_planning(driver, os.getenv('DB_NAME'))
+
+    database.debug_clear_all()
+    driver.close()
+    print_table(["case", "queries", "per query"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Shared helpers for the benchmarks.
+"""
+import time
+import statistics
+import neo4j
+
+class RoundTripCounter:
+    """
+    Counts Neo4j queries sent by the driver while active. Each counted query is one Bolt round trip.
+
+    Usage:
+        with RoundTripCounter() as counter:
+            database.lookup_nodes(...)
+        print(counter.count)
+    """
+    # Every query goes through one of these, regardless of session/transaction usage
+    __patched_classes = [neo4j.Session, neo4j.Transaction, neo4j.ManagedTransaction]
+
+    def __init__(self):
+        self.count = 0
+        self.__originals = {}
+
+    def __enter__(self):
+        for cls in self.__patched_classes:
+            original = cls.run
+            self.__originals[cls] = original
+
+            def counted_run(instance, *args, original_run=original, **kwargs):
+                self.count += 1
+                return original_run(instance, *args, **kwargs)
+
+            cls.run = counted_run
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for cls, original in self.__originals.items():
+            cls.run = original
+        return False
+
+
+def measure(function, repeats: int = 5) -> tuple[float, int]:
+    """
+    Run function multiple times and measure latency and round trips.
+
+    Args:
+        function (callable): Function without arguments to benchmark.
+        repeats (int, optional): How many times to run it. Defaults to 5.
+
+    Returns:
+        tuple[float, int]: Median latency in milliseconds and round trips of a single run.
+    """
+    timings = []
+    for _ in range(repeats):
+        with RoundTripCounter() as counter:
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), counter.count
+
+
+def print_table(headers: list[str], rows: list[list]):
+    """
+    Print rows as a simple aligned table.
+
+    Args:
+        headers (list[string]): Column names.
+        rows (list[list]): Row values, converted with str().
+    """
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+    print("  ".join(header.rjust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,140 @@
+import pytest
+import os
+import time
+from app.analysis_cache import AnalysisCache
+
+pytestmark = pytest.mark.api_llm
+
+def test_key_depends_on_all_parts():
+    """
+    Test that changing any part of the analysis gives a different key, and same parts give the same key.
+    """
+    key = AnalysisCache.key("gpt-4o", "instructions", ["q1"], "text")
+    assert key == AnalysisCache.key("gpt-4o", "instructions", ["q1"], "text")
+    assert len({
+        key,
+        AnalysisCache.key("gpt-4o-mini", "instructions", ["q1"], "text"),
+        AnalysisCache.key("gpt-4o", "other", ["q1"], "text"),
+        AnalysisCache.key("gpt-4o", "instructions", ["q2"], "text"),
+        AnalysisCache.key("gpt-4o", "instructions", None, "text"),
+        AnalysisCache.key("gpt-4o", "instructions", ["q1"], "text2"),
+    }) == 6
+
+def test_hit_and_miss_counters():
+    """
+    Test get/put and hit/miss counters.
+    """
+    cache = AnalysisCache(max_entries=10, ttl=60, disk_dir="")
+    assert cache.get("a") is None
+    cache.put("a", "result")
+    assert cache.get("a") == "result"
+    stats = cache.stats()
+    assert (
+        stats['hits'] == 1
+        and stats['misses'] == 1
+        and stats['entries'] == 1
+        and stats['hit_rate'] == 0.5
+    )
+
+def test_lru_eviction():
+    """
+    Test that least recently used entry is evicted when over max_entries.
+    """
+    cache = AnalysisCache(max_entries=2, ttl=60, disk_dir="")
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a") # a is now most recently used
+    cache.put("c", "3")
+    assert (
+        cache.get("b") is None
+        and cache.get("a") == "1"
+        and cache.get("c") == "3"
+        and cache.stats()['evictions'] == 1
+    )
+
+def test_ttl_expiry():
+    """
+    Test that expired entries are not returned.
+    """
+    cache = AnalysisCache(max_entries=10, ttl=0.05, disk_dir="")
+    cache.put("a", "1")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+def test_partial_ttl(tmp_path):
+    """
+    Test that partial analyses are kept for partial_ttl, also on disk, while other results expire after ttl.
+    """
+    cache = AnalysisCache(max_entries=10, ttl=0.05, disk_dir=str(tmp_path), partial_ttl=60)
+    cache.put("full", "1")
+    cache.put("partial", "2", partial=True)
+    time.sleep(0.1)
+
+    assert cache.get("full") is None
+    assert cache.get("partial") == "2"
+    assert AnalysisCache(max_entries=10, ttl=0.05, disk_dir=str(tmp_path), partial_ttl=60).get("partial") == "2"
+
+def test_failed_results_not_cached():
+    """
+    Test that None and error dicts are not cached.
+    """
+    cache = AnalysisCache(max_entries=10, ttl=60, disk_dir="")
+    cache.put("a", None)
+    cache.put("b", {"error": "Request failed"})
+    assert cache.stats()['entries'] == 0
+
+def test_disk_tier(tmp_path):
+    """
+    Test that disk tier survives a new cache instance and is promoted to memory.
+    """
+    cache = AnalysisCache(max_entries=10, ttl=60, disk_dir=str(tmp_path))
+    cache.put("abcdef", "result")
+
+    new_cache = AnalysisCache(max_entries=10, ttl=60, disk_dir=str(tmp_path))
+    assert new_cache.get("abcdef") == "result"
+    assert new_cache.get("abcdef") == "result"
+    stats = new_cache.stats()
+    assert (
+        stats['disk_hits'] == 1
+        and stats['memory_hits'] == 1
+    )
+
+def test_disk_tier_lru_eviction(tmp_path, monkeypatch):
+    """
+    Test that least recently used disk entries are removed when the disk tier grows over max bytes.
+    """
+    monkeypatch.setattr("app.analysis_cache.DISK_SWEEP_INTERVAL", 0)
+    cache = AnalysisCache(max_entries=0, ttl=60, disk_dir=str(tmp_path), disk_max_bytes=300)
+    cache.put("aa01", "a" * 100)
+    cache.put("bb01", "b" * 100)
+    os.utime(tmp_path / "aa" / "aa01.json", (1000, 1000))
+    os.utime(tmp_path / "bb" / "bb01.json", (2000, 2000))
+    assert cache.get("aa01") == "a" * 100 # marks aa01 as recently used
+
+    cache.put("cc01", "c" * 100)
+    assert cache.get("bb01") is None
+    assert cache.get("aa01") == "a" * 100
+    assert cache.get("cc01") == "c" * 100
+    assert cache.stats()['disk_evictions'] == 1
+
+def test_disk_write_failure_removes_temp_file(tmp_path, monkeypatch):
+    """
+    Test that a failed disk write leaves no temporary file behind and the entry is still cached in memory.
+    """
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+    monkeypatch.setattr("app.analysis_cache.json.dump", fail)
+    cache = AnalysisCache(max_entries=10, ttl=60, disk_dir=str(tmp_path))
+    cache.put("abcdef", "result")
+
+    assert list(tmp_path.rglob("*.tmp")) == []
+    assert cache.get("abcdef") == "result"
+
+def test_clear(tmp_path):
+    """
+    Test that clear() empties both tiers.
+    """
+    cache = AnalysisCache(max_entries=10, ttl=60, disk_dir=str(tmp_path))
+    cache.put("abcdef", "result")
+    cache.clear()
+    assert cache.get("abcdef") is None
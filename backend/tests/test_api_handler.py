@@ -1,6 +1,8 @@
 import pytest
+import time
 import os
 import openai
+import re
 from unittest.mock import patch, MagicMock
 from app.api_handler import ApiHandler, PRIMARY_MODEL, BACKUP_MODEL
 
@@ -59,7 +61,7 @@ def test_analyze_text_primary_model(mock_openai):
     result = api_handler.analyze_text("Sample text")
     assert result == "Analyzed text result."
 
-@patch("app.api_handler.utils.extract_text_from_file")
+@patch("app.api_handler.utils.iter_text_from_file")
 def test_analyze_file_with_no_text(mock_extract_text, api_handler):
      """
     Tests the analyze_file method of the ApiHandler class when no text is extracted from the file.
@@ -69,23 +71,330 @@ def test_analyze_file_with_no_text(mock_extract_text, api_handler):
         utility returns None (e.g., an empty file).
 
     Test Strategy:
-        - Mock the extract_text_from_file utility function to simulate no text extraction.
+        - Mock the iter_text_from_file utility function to simulate no text extraction.
         - Use the `api_handler` fixture to create an ApiHandler instance.
 
     Mock Details:
-        - `mock_extract_text`: Simulates the behavior of the extract_text_from_file function,
-          always returning None for this test.
+        - `mock_extract_text`: Simulates the behavior of the iter_text_from_file function,
+          yielding no pages for this test.
 
     Assertions:
         - Ensures that the analyze_file method returns None when no text is extracted.
-        - Verifies that extract_text_from_file is called exactly once with the correct file path.
+        - Verifies that iter_text_from_file is called exactly once with the correct file path.
 
     Notes:
         This test focuses on error handling and ensures that no further processing occurs
         when no text is available for analysis.
     """
-     mock_extract_text.return_value = None # Simulate no text extracted from the file
+     mock_extract_text.return_value = iter([]) # Simulate no text extracted from the file
 
-     result = api_handler.analyze_file("empty.txt")
+     result = api_handler.analyze_file("empty.txt", None)
      assert result is None
      mock_extract_text.assert_called_once_with("empty.txt")
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_analyze_file_batch_concurrent():
+    """
+    Tests that analyze_file_batch analyzes files concurrently and yields results in completion order.
+
+    Test Strategy:
+        - Mock analyze_file with a sleep that is shorter for later files.
+        - Run a batch of 4 files with concurrency 4.
+
+    Assertions:
+        - Every file gets its result.
+        - Results arrive in completion order (shortest sleep first).
+        - Total time is close to the slowest file, not the sum of all files.
+    """
+    delays = {"a.txt": 0.4, "b.txt": 0.3, "c.txt": 0.2, "d.txt": 0.1}
+
+    def fake_analyze_file(filepath, blueprint, model, upload_id=None):
+        time.sleep(delays[filepath])
+        return "result " + filepath
+
+    api_handler = ApiHandler()
+    with patch.object(api_handler, "analyze_file", side_effect=fake_analyze_file):
+        start = time.monotonic()
+        results = list(api_handler.analyze_file_batch(list(delays), None, PRIMARY_MODEL, max_concurrency=4))
+        elapsed = time.monotonic() - start
+
+    assert [filepath for filepath, result, error in results] == ["d.txt", "c.txt", "b.txt", "a.txt"]
+    assert all(result == "result " + filepath and error is None for filepath, result, error in results)
+    assert elapsed < 0.9
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_analyze_file_batch_error():
+    """
+    Tests that an exception while analyzing one file is reported for that file only.
+
+    Assertions:
+        - Failing file has result None and the error message.
+        - Other file still gets its result.
+    """
+    def fake_analyze_file(filepath, blueprint, model, upload_id=None):
+        if filepath == "bad.pdf":
+            raise ValueError("broken file")
+        return "ok"
+
+    api_handler = ApiHandler()
+    with patch.object(api_handler, "analyze_file", side_effect=fake_analyze_file):
+        results = {filepath: (result, error) for filepath, result, error in api_handler.analyze_file_batch(["bad.pdf", "good.pdf"], None, max_concurrency=2)}
+
+    assert results == {"bad.pdf": (None, "broken file"), "good.pdf": ("ok", None)}
+
+def raw_response(parsed, headers=None):
+    """
+    Mock of a `with_raw_response` result, parse() returns the given response.
+    """
+    return MagicMock(headers=headers or {}, parse=MagicMock(return_value=parsed))
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_openai_analyze_cached():
+    """
+    Tests that analyzing the same text with the same blueprint and model calls the model only once.
+
+    Assertions:
+        - Both calls return the model result.
+        - Chat completions API is called once, second call is a cache hit.
+        - Different blueprint questions call the model again.
+    """
+    from app.analysis_cache import AnalysisCache
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.return_value = raw_response(
+        MagicMock(choices=[MagicMock(message=MagicMock(content="Analyzed text result."))])
+    )
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+    api_handler._ApiHandler__cache = AnalysisCache(max_entries=10, ttl=60, disk_dir="")
+
+    blueprint = {"questions": ["What?"]}
+    result_1 = api_handler.openai_analyze("Sample text", blueprint)
+    result_2 = api_handler.openai_analyze("Sample text", blueprint)
+    assert result_1 == result_2 == "Analyzed text result."
+    assert mock_client.chat.completions.with_raw_response.create.call_count == 1
+    assert api_handler.cache_stats()['hits'] == 1
+
+    api_handler.openai_analyze("Sample text", {"questions": ["Why?"]})
+    assert mock_client.chat.completions.with_raw_response.create.call_count == 2
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_analyze_long_text_map_reduce(monkeypatch):
+    """
+    Tests that text over the chunk token budget is analyzed in chunks and merged with a reduce request.
+
+    Test Strategy:
+        - Set a small CHUNK_TOKEN_BUDGET and mock the chat completions API to echo which request it got.
+
+    Assertions:
+        - One request per chunk plus one reduce request.
+        - Reduce request gets every partial analysis and its response is the result.
+    """
+    monkeypatch.setenv("CHUNK_TOKEN_BUDGET", "100")
+    text = "\n\n".join(f"Paragraph {i} " + "word " * 60 for i in range(4))
+
+    def create(model, messages, **options):
+        content = "merged" if "consecutive parts" in messages[0]["content"] else "partial " + messages[1]["content"].split()[1]
+        return raw_response(MagicMock(choices=[MagicMock(message=MagicMock(content=content))]))
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.side_effect = create
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+
+    result = api_handler.analyze(text, {"questions": ["What?"]}, "OpenAI")
+    assert result == "merged"
+    assert mock_client.chat.completions.with_raw_response.create.call_count == 5
+
+    reduce_messages = mock_client.chat.completions.with_raw_response.create.call_args_list[-1].kwargs["messages"]
+    assert all(f"partial {i}" in reduce_messages[1]["content"] for i in range(4))
+    assert "What?" in reduce_messages[0]["content"]
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_reanalyze_edited_document(monkeypatch, tmp_path):
+    """
+    Tests that analyzing a revised document a week later, after a restart, calls the model only for the changed chunk
+    and the merge. Partial analyses of the unchanged chunks come from the disk tier of the cache.
+    """
+    from app.analysis_cache import AnalysisCache
+
+    monkeypatch.setenv("CHUNK_TOKEN_BUDGET", "200")
+    # many requests at once, don't pace them
+    monkeypatch.setenv("OPENAI_TPM", "10000000")
+    pages = [f"Page {number} " + "text " * 40 for number in range(1, 61)]
+    revised = list(pages)
+    revised[29] = "Page 30 was rewritten. " + "new " * 60
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.return_value = raw_response(
+        MagicMock(choices=[MagicMock(message=MagicMock(content="Analysis."))])
+    )
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+    api_handler._ApiHandler__cache = AnalysisCache(max_entries=100, ttl=86400, disk_dir=str(tmp_path))
+
+    api_handler.analyze("\f".join(pages), None, "OpenAI")
+    first_calls = mock_client.chat.completions.with_raw_response.create.call_count
+
+    # restarted with an empty memory tier, a week later
+    api_handler._ApiHandler__cache = AnalysisCache(max_entries=100, ttl=86400, disk_dir=str(tmp_path))
+    week_later = time.time() + 7 * 86400
+    with patch("app.analysis_cache.time.time", return_value=week_later):
+        api_handler.analyze("\f".join(revised), None, "OpenAI")
+    second_calls = mock_client.chat.completions.with_raw_response.create.call_count - first_calls
+
+    assert first_calls > 10
+    # changed chunk and the merge
+    assert second_calls <= 3
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_stream_analyze_openai():
+    """
+    Tests that stream_analyze yields the OpenAI stream deltas as they arrive and caches the whole result.
+
+    Assertions:
+        - Pieces are yielded in order, empty deltas are skipped.
+        - Chat completions API is called with stream=True.
+        - Streaming the same text again yields the cached result without calling the API.
+    """
+    from app.analysis_cache import AnalysisCache
+
+    def delta(content):
+        return MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.return_value = raw_response(
+        iter([delta("Analyzed "), delta(None), delta("text "), delta("result.")])
+    )
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+    api_handler._ApiHandler__cache = AnalysisCache(max_entries=10, ttl=60, disk_dir="")
+
+    pieces = list(api_handler.stream_analyze("Sample text", None, "OpenAI"))
+    assert pieces == ["Analyzed ", "text ", "result."]
+    assert mock_client.chat.completions.with_raw_response.create.call_args.kwargs["stream"] is True
+
+    assert list(api_handler.stream_analyze("Sample text", None, "OpenAI")) == ["Analyzed text result."]
+    assert mock_client.chat.completions.with_raw_response.create.call_count == 1
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_stream_analyze_mistral():
+    """
+    Tests that stream_analyze yields the pieces from the local model client as they arrive.
+
+    Assertions:
+        - Pieces are yielded in order.
+        - Client is called with the local model, the text as the prompt and the instructions as the system prompt.
+    """
+    mock_ollama = MagicMock()
+    mock_ollama.generate_stream.return_value = iter(["Analyzed ", "result."])
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__ollama = mock_ollama
+    pieces = list(api_handler.stream_analyze("Sample text", None, "Mistral"))
+
+    assert pieces == ["Analyzed ", "result."]
+    model, prompt = mock_ollama.generate_stream.call_args.args
+    assert model == "mistral" and prompt == "Sample text"
+    assert mock_ollama.generate_stream.call_args.kwargs["system"].startswith("You are an expert in text analysis.")
+
+def packed_response(messages, answer=lambda index, document: f"analysis of {document}"):
+    """
+    Answers a packed request the way the model is asked to, answer() gives the analysis of each document.
+    """
+    documents = re.findall(r'<document id="(\d+)">\n(.*?)\n</document>', messages[1]["content"], re.DOTALL)
+    return "\n".join(f'<analysis id="{index}">\n{answer(index, document)}\n</analysis>' for index, document in documents)
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_analyze_many_packs_short_texts(monkeypatch):
+    """
+    Tests that short texts are analyzed with one request and the response is split back per text.
+
+    Assertions:
+        - Results are in the same order as the texts.
+        - Short texts share one request, PACK_MAX_DOCUMENTS limits the pack size.
+        - Text over half of the token budget is analyzed alone.
+    """
+    monkeypatch.setenv("CHUNK_TOKEN_BUDGET", "200")
+    monkeypatch.setenv("PACK_MAX_DOCUMENTS", "3")
+
+    def create(model, messages, **options):
+        if "<document" in messages[1]["content"]:
+            content = packed_response(messages)
+        else:
+            content = "single analysis"
+        return raw_response(MagicMock(choices=[MagicMock(message=MagicMock(content=content))]))
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.side_effect = create
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+
+    texts = [f"text {i}" for i in range(4)] + ["long " * 120]
+    results = api_handler.analyze_many(texts, {"questions": ["What?"]}, "OpenAI")
+
+    # pack of texts 0-2, text 3 left alone in its pack, and the long text
+    assert results == ["analysis of text 0", "analysis of text 1", "analysis of text 2", "single analysis", "single analysis"]
+    assert mock_client.chat.completions.with_raw_response.create.call_count == 3
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_analyze_many_falls_back_to_single_requests():
+    """
+    Tests that texts missing from a packed response are analyzed with single requests.
+    """
+    def create(model, messages, **options):
+        if "<document" in messages[1]["content"]:
+            # second document answered twice, so it can't be trusted
+            content = packed_response(messages, lambda index, document: f"analysis of {document}") + '\n<analysis id="2">\nagain\n</analysis>'
+        else:
+            content = "single " + messages[1]["content"]
+        return raw_response(MagicMock(choices=[MagicMock(message=MagicMock(content=content))]))
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.side_effect = create
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+
+    results = api_handler.analyze_many(["a", "b", "c"], None, "OpenAI")
+    assert results == ["analysis of a", "single b", "analysis of c"]
+    assert mock_client.chat.completions.with_raw_response.create.call_count == 2
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_analyze_structured():
+    """
+    Tests structured analysis with JSON schema output.
+
+    Assertions:
+        - The schema from the blueprint questions is sent as response_format.
+        - An invalid answer falls back to the backup model.
+        - The result has the answers paired with the questions and the markdown text.
+    """
+    valid = (
+        '{"main_themes": ["theme"], "key_points": ["point"], "notable_quotes": ["quote"], '
+        '"overall_sentiment": "positive", "answers": {"question_1": "Yes."}}'
+    )
+
+    def create(model, messages, **options):
+        content = '{"main_themes": "not a list"}' if model == PRIMARY_MODEL else valid
+        return raw_response(MagicMock(choices=[MagicMock(message=MagicMock(content=content))]))
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.with_raw_response.create.side_effect = create
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = mock_client
+
+    result = api_handler.analyze("Sample text", {"questions": ["Is it?"]}, "OpenAI", structured=True)
+
+    calls = mock_client.chat.completions.with_raw_response.create.call_args_list
+    assert [call.kwargs["model"] for call in calls] == [PRIMARY_MODEL, BACKUP_MODEL]
+    schema = calls[0].kwargs["response_format"]["json_schema"]["schema"]
+    assert schema["properties"]["answers"]["properties"]["question_1"]["description"] == "Is it?"
+    assert result["answers"] == [{"question": "Is it?", "answer": "Yes."}]
+    assert result["overall_sentiment"] == "positive"
+    assert "**Is it?**\nYes." in result["result"]
@@ -156,3 +156,61 @@ def test_analyze_file(client, temp_file):
     response = client.post('/analyze_file', data=temp_file.name)
     assert response.status_code == 200
     assert response.json == {"mocked_analysis": f"Analyzed {temp_file.name}"}
+
+def test_analyze_batch_same_content(client, monkeypatch, tmp_path):
+    """
+    Tests that files with the same content in one batch are analyzed once, reported under each filename,
+    and the upload is not left in use.
+    """
+    import io
+    import json
+    from app.uploads import UploadStore
+
+    store = UploadStore(str(tmp_path))
+    monkeypatch.setattr('app.backend_api.uploads', store)
+    analyzed = []
+
+    def analyze_file_batch(filepaths, blueprint, model, upload_ids=None):
+        analyzed.extend(filepaths)
+        for filepath in filepaths:
+            yield filepath, "Analysis.", None
+
+    monkeypatch.setattr(MockApiHandler, 'analyze_file_batch', staticmethod(analyze_file_batch), raising=False)
+
+    response = client.post('/analyze_batch', data={
+        'files': [(io.BytesIO(b"Same content."), "first.txt"), (io.BytesIO(b"Same content."), "second.txt")],
+        'blueprint': 'null',
+        'model': 'openai',
+    }, content_type='multipart/form-data')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    response.close()
+
+    assert response.status_code == 200
+    assert len(analyzed) == 1
+    assert sorted(line["filename"] for line in lines) == ["first.txt", "second.txt"]
+    assert store._UploadStore__in_use == {}
+    assert store.delete(os.path.basename(analyzed[0]))
+
+def test_analyze_file_stream_releases_unread_upload(client, monkeypatch, tmp_path):
+    """
+    Tests that the upload of a streamed analysis is released when the response is closed without being read.
+    """
+    import io
+    from app.uploads import UploadStore
+
+    store = UploadStore(str(tmp_path))
+    monkeypatch.setattr('app.backend_api.uploads', store)
+    monkeypatch.setattr(MockApiHandler, 'extract_text', lambda self, filepath, upload_id: "Sample text.", raising=False)
+    monkeypatch.setattr(MockApiHandler, 'stream_analyze', lambda self, text, blueprint, model: iter(["Analysis."]), raising=False)
+    upload = store.save(io.BytesIO(b"Sample text."), "sample.txt")
+
+    response = client.post('/analyze_file_stream', json={
+        'filename': upload["id"],
+        'blueprint': None,
+        'model': 'openai',
+    }, buffered=False)
+    assert response.status_code == 200
+    assert store._UploadStore__in_use == {upload["id"]: 1}
+
+    response.close()
+    assert store._UploadStore__in_use == {}
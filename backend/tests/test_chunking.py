@@ -0,0 +1,91 @@
+import pytest
+from app.chunking import split_text, iter_chunks, estimate_tokens
+
+pytestmark = pytest.mark.utils
+
+def test_short_text_single_chunk():
+    """
+    Test that text within budget is returned as one chunk.
+    """
+    assert split_text("Short text.", budget=100) == ["Short text."]
+
+def test_chunks_within_budget():
+    """
+    Test that every chunk is within the token budget and no text is lost.
+    """
+    text = "\n\n".join(f"Paragraph {i}. " + "word " * 50 for i in range(40))
+    chunks = split_text(text, budget=200)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+def test_split_on_page_boundaries():
+    """
+    Test that pages (form feed separated) are kept whole when each page fits the budget.
+    """
+    pages = [f"Page {i} " + "text " * 60 for i in range(6)]
+    chunks = split_text("\f".join(pages), budget=estimate_tokens(pages[0]) + 5)
+    assert chunks == [page.strip() for page in pages]
+
+def test_small_units_packed():
+    """
+    Test that consecutive small paragraphs are packed into the same chunk.
+    """
+    text = "\n\n".join(["short paragraph"] * 10)
+    chunks = split_text(text, budget=30)
+    assert 1 < len(chunks) < 10
+
+def test_long_word_hard_split():
+    """
+    Test that text without any separators is still split within budget.
+    """
+    chunks = split_text("x" * 4000, budget=100)
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == "x" * 4000
+
+def test_whitespace_only():
+    """
+    Test that whitespace-only text gives no chunks.
+    """
+    assert split_text(" \n\n \f ", budget=10) == []
+
+def test_iter_chunks_is_lazy():
+    """
+    Test that the first chunk is yielded before later pages are read.
+    """
+    read_pages = []
+
+    def pages():
+        for number in range(1, 101):
+            read_pages.append(number)
+            yield number, f"Page {number} " + "text " * 60
+
+    chunks = iter_chunks(pages(), budget=100)
+    first = next(chunks)
+    assert first.startswith("Page 1 ")
+    assert len(read_pages) < 5
+
+def test_iter_chunks_pages_match_split_text():
+    """
+    Test that chunking pages gives the same chunks as chunking the form feed joined text.
+    """
+    pages = [(number, f"Page {number}\n\n" + "word " * 30) for number in range(1, 8)]
+    text = "\f".join(page_text for number, page_text in pages)
+    assert list(iter_chunks(pages, budget=50)) == split_text(text, budget=50)
+
+def test_edit_changes_only_nearby_chunks():
+    """
+    Test that editing one page of a long document keeps the chunks before and after the edit the same.
+    """
+    pages = [(number, f"Page {number} " + "text " * 40) for number in range(1, 61)]
+    chunks = list(iter_chunks(pages, budget=200))
+
+    edited = list(pages)
+    edited[29] = (30, "Page 30 was rewritten and is now longer. " + "new " * 90)
+    edited_chunks = list(iter_chunks(edited, budget=200))
+
+    assert len(chunks) > 10
+    assert chunks[:5] == edited_chunks[:5]
+    # at most the chunk with the edit and the one after it are new
+    assert len(set(edited_chunks) - set(chunks)) <= 2
+    assert chunks[-5:] == edited_chunks[-5:]
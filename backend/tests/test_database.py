@@ -803,3 +803,393 @@ class TestNodeLookups:
 
 
 
+
+
+class TestProjectTree:
+    """Whole project tree lookup
+
+    1. add projects, results and used blueprints
+    check lookup_project_tree() result shape and order
+    """
+    def test_empty(self,db:Database):
+        result = db.lookup_project_tree()
+        assert result == []
+
+    def test_project_tree(self,db:Database):
+        """
+        1. create 2 projects
+        2. create blueprint
+        3. create 2 results under second project, first one with used blueprint
+        check tree shape, order and used blueprint values
+        """
+        id_project_1 = db.add_node(NodeLabels.PROJECT)
+        db.set_node_property(id_project_1, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo_1')
+        id_project_2 = db.add_node(NodeLabels.PROJECT)
+        db.set_node_property(id_project_2, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo_2')
+
+        id_blueprint = db.add_node(NodeLabels.BLUEPRINT)
+        db.set_node_property(id_blueprint, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, 'bar')
+        db.set_node_property(id_blueprint, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.QUESTIONS, ['q1', 'q2'])
+
+        id_result_1 = db.add_node(NodeLabels.RESULT_BLUEPRINT)
+        db.set_node_property(id_result_1, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME, 'baz_1')
+        db.connect_node_to_node(id_result_1, NodeLabels.RESULT_BLUEPRINT, id_project_2, NodeLabels.PROJECT)
+        id_used_blueprint = db.copy_node_to_node(id_blueprint, NodeLabels.BLUEPRINT, NodeLabels.USED_BLUEPRINT)
+        db.connect_node_to_node(id_used_blueprint, NodeLabels.USED_BLUEPRINT, id_result_1, NodeLabels.RESULT_BLUEPRINT)
+
+        id_result_2 = db.add_node(NodeLabels.RESULT_BLUEPRINT)
+        db.set_node_property(id_result_2, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME, 'baz_2')
+        db.connect_node_to_node(id_result_2, NodeLabels.RESULT_BLUEPRINT, id_project_2, NodeLabels.PROJECT)
+
+        result = db.lookup_project_tree()
+
+        assert (
+            [project['id'] for project in result] == [id_project_2, id_project_1] # order matters
+            and result[0]['name'] == 'foo_2'
+            and result[0]['open'] == False
+            and result[1]['results'] == []
+            and [res['id'] for res in result[0]['results']] == [id_result_2, id_result_1]
+            and result[0]['results'][0]['blueprint'] == {"id": None, "name": None, "description": None, "questions": None}
+            and result[0]['results'][1]['name'] == 'baz_1'
+            and result[0]['results'][1]['blueprint']['id'] == id_used_blueprint
+            and result[0]['results'][1]['blueprint']['name'] == 'bar'
+            and result[0]['results'][1]['blueprint']['questions'] == ['q1', 'q2']
+            and result[0]['results'][1]['answers'] == []
+        )
+
+
+class TestLookupNodesWithProperties:
+    """Node lookups with all requested properties
+
+    1. add nodes
+    2. add properties
+    check lookup_nodes_with_properties() result (order and values)
+    """
+    def test_blueprint(self,db:Database):
+        id_1 = db.add_node(NodeLabels.BLUEPRINT)
+        db.set_node_property(id_1, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, 'foo_1')
+        db.set_node_property(id_1, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.QUESTIONS, ['q1'])
+        id_2 = db.add_node(NodeLabels.BLUEPRINT)
+        db.set_node_property(id_2, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, 'foo_2')
+
+        result = db.lookup_nodes_with_properties(NodeLabels.BLUEPRINT, [
+            NodeProperties.Blueprint.NAME,
+            NodeProperties.Blueprint.DESCRIPTION,
+            NodeProperties.Blueprint.QUESTIONS,
+            ])
+
+        assert (
+            result[0] == {"id": id_2, "name": 'foo_2', "description": None, "questions": None} # order matters
+            and result[1] == {"id": id_1, "name": 'foo_1', "description": None, "questions": ['q1']}
+        )
+
+    def test_result_blueprint_under_project(self,db:Database):
+        id = db.add_node(NodeLabels.PROJECT)
+        id_1 = db.add_node(NodeLabels.RESULT_BLUEPRINT)
+        db.set_node_property(id_1, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME, 'foo_1')
+        db.connect_node_to_node(id_1, NodeLabels.RESULT_BLUEPRINT, id, NodeLabels.PROJECT)
+        db.add_node(NodeLabels.RESULT_BLUEPRINT) # not under project
+
+        result = db.lookup_nodes_with_properties(NodeLabels.RESULT_BLUEPRINT, [NodeProperties.ResultBlueprint.NAME], NodeLabels.PROJECT, id)
+
+        assert result == [{"id": id_1, "name": 'foo_1'}]
+
+    def test_empty(self,db:Database):
+        result = db.lookup_nodes_with_properties(NodeLabels.BLUEPRINT, [NodeProperties.Blueprint.NAME])
+        assert result == []
+
+    def test_invalid_property(self,db:Database):
+        with pytest.raises(ValueError):
+            db.lookup_nodes_with_properties(NodeLabels.BLUEPRINT, [NodeProperties.Project.NAME])
+
+
+class TestTransaction:
+    """Unit of work
+
+    1. do multiple operations inside transaction()
+    check that they are committed together or rolled back together
+    """
+    def test_commit(self,db:Database):
+        with db.transaction() as tx:
+            id = tx.add_node(NodeLabels.PROJECT)
+            tx.set_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo')
+
+        result = db.lookup_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME)
+        assert result == 'foo'
+
+    def test_rollback(self,db:Database):
+        with pytest.raises(RuntimeError):
+            with db.transaction() as tx:
+                id = tx.add_node(NodeLabels.PROJECT)
+                tx.set_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo')
+                raise RuntimeError("rollback")
+
+        result = db.lookup_nodes(NodeLabels.PROJECT)
+        assert result == []
+
+    def test_nested(self,db:Database):
+        """Nested transaction joins the outer one, so both are rolled back"""
+        with pytest.raises(RuntimeError):
+            with db.transaction() as tx:
+                tx.add_node(NodeLabels.PROJECT)
+                with db.transaction() as tx_2:
+                    tx_2.add_node(NodeLabels.BLUEPRINT)
+                raise RuntimeError("rollback")
+
+        assert (
+            db.lookup_nodes(NodeLabels.PROJECT) == []
+            and db.lookup_nodes(NodeLabels.BLUEPRINT) == []
+        )
+
+
+class TestCreateResult:
+    """Result creation in one query
+
+    1. create project (and blueprint)
+    2. create result
+    check result properties, project connection and used blueprint
+    """
+    def test_with_blueprint(self,db:Database):
+        id_project = db.add_node(NodeLabels.PROJECT)
+        datetime_before = db.lookup_node_property(id_project, NodeLabels.PROJECT, NodeProperties.Project.DATETIME)
+        id_blueprint = db.add_node(NodeLabels.BLUEPRINT)
+        db.set_node_property(id_blueprint, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, 'bar')
+
+        id = db.create_result('foo', 'foo.pdf', 'lorem ipsum', id_project, id_blueprint)
+
+        used_blueprints = db.lookup_nodes(NodeLabels.USED_BLUEPRINT, NodeLabels.RESULT_BLUEPRINT, id)
+        assert (
+            UUID(id,version=4)
+            and db.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.NAME) == 'foo'
+            and db.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.FILENAME) == 'foo.pdf'
+            and db.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.RESULT) == 'lorem ipsum'
+            and isinstance(db.lookup_node_property(id, NodeLabels.RESULT_BLUEPRINT, NodeProperties.ResultBlueprint.DATETIME), DateTime)
+            and db.lookup_nodes(NodeLabels.RESULT_BLUEPRINT, NodeLabels.PROJECT, id_project)[0][0] == id
+            and len(used_blueprints) == 1
+            and used_blueprints[0][0] != id_blueprint
+            and used_blueprints[0][1] == 'bar'
+            and db.lookup_node_property(id_project, NodeLabels.PROJECT, NodeProperties.Project.DATETIME) > datetime_before
+        )
+
+    def test_without_blueprint(self,db:Database):
+        """Automatic blueprint, no used blueprint is created"""
+        id_project = db.add_node(NodeLabels.PROJECT)
+
+        id = db.create_result('foo', None, 'lorem ipsum', id_project)
+
+        assert (
+            UUID(id,version=4)
+            and db.lookup_nodes(NodeLabels.USED_BLUEPRINT, NodeLabels.RESULT_BLUEPRINT, id) == []
+        )
+
+    def test_with_answers(self,db:Database):
+        """Answers of a structured result are saved as nodes, returned in question order and filtered by question"""
+        id_project_1 = db.add_node(NodeLabels.PROJECT)
+        id_project_2 = db.add_node(NodeLabels.PROJECT)
+        answers = [{'question': 'q1', 'answer': 'a1'}, {'question': 'q2', 'answer': 'a2'}]
+
+        id_1 = db.create_result('foo_1', None, 'lorem ipsum', id_project_1, answers=answers)
+        id_2 = db.create_result('foo_2', None, 'lorem ipsum', id_project_2, answers=[{'question': 'q1', 'answer': 'b1'}])
+
+        tree = db.lookup_project_tree()
+        by_question = db.lookup_answers(question='q1')
+        assert (
+            tree[1]['results'][0]['answers'] == answers
+            and tree[0]['results'][0]['answers'] == [{'question': 'q1', 'answer': 'b1'}]
+            and [answer['answer'] for answer in by_question] == ['b1', 'a1'] # newest result first
+            and by_question[1]['resultId'] == id_1
+            and by_question[1]['projectId'] == id_project_1
+            and [answer['answer'] for answer in db.lookup_answers(project_id=id_project_1)] == ['a1', 'a2']
+            and db.lookup_answers(question='q2', project_id=id_project_2) == []
+        )
+
+        # answers are deleted with the result
+        db.delete_node(id_1, NodeLabels.RESULT_BLUEPRINT)
+        assert [answer['resultId'] for answer in db.lookup_answers()] == [id_2]
+
+    def test_project_not_found(self,db:Database):
+        """Nothing should be created"""
+        id = db.create_result('foo', None, 'lorem ipsum', random_UUID)
+
+        assert (
+            id == None
+            and db.lookup_nodes_with_properties(NodeLabels.RESULT_BLUEPRINT, []) == []
+        )
+
+
+class TestSetProperties:
+    """Set multiple properties at once
+
+    1. create node
+    2. set properties
+    check returned bool and lookup values
+    """
+    def test_blueprint(self,db:Database):
+        id = db.add_node(NodeLabels.BLUEPRINT)
+        datetime_before = db.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.DATETIME)
+        result = db.set_node_properties(id, NodeLabels.BLUEPRINT, {
+            NodeProperties.Blueprint.NAME: 'foo',
+            NodeProperties.Blueprint.DESCRIPTION: 'bar',
+            NodeProperties.Blueprint.QUESTIONS: ['q1', 'q2'],
+            })
+        assert (
+            result == True
+            and db.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME) == 'foo'
+            and db.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.DESCRIPTION) == 'bar'
+            and db.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.QUESTIONS) == ['q1', 'q2']
+            and db.lookup_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.DATETIME) > datetime_before
+        )
+
+    def test_string_names(self,db:Database):
+        id = db.add_node(NodeLabels.PROJECT)
+        result = db.set_node_properties(id, NodeLabels.PROJECT, {'NAME': 'foo'})
+        assert (
+            result == True
+            and db.lookup_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME) == 'foo'
+        )
+        with pytest.raises(ValueError):
+            db.set_node_properties(id, NodeLabels.PROJECT, {'QUESTIONS': ['q1']})
+
+    def test_node_not_found(self,db:Database):
+        result = db.set_node_properties(random_UUID, NodeLabels.PROJECT, {NodeProperties.Project.NAME: 'foo'})
+        assert result == False
+
+    def test_used_blueprint(self,db:Database):
+        id = db.add_node(NodeLabels.BLUEPRINT)
+        id_2 = db.copy_node_to_node(id, NodeLabels.BLUEPRINT, NodeLabels.USED_BLUEPRINT)
+        result = db.set_node_properties(id_2, NodeLabels.USED_BLUEPRINT, {NodeProperties.Blueprint.NAME: 'foo'})
+        assert (
+            result == False
+            and db.lookup_node_property(id_2, NodeLabels.USED_BLUEPRINT, NodeProperties.Blueprint.NAME) == None
+        )
+
+    def test_invalid_property(self,db:Database):
+        id = db.add_node(NodeLabels.PROJECT)
+        with pytest.raises(ValueError):
+            db.set_node_properties(id, NodeLabels.PROJECT, {NodeProperties.Blueprint.QUESTIONS: ['q1']})
+
+
+class TestParameterizedQueries:
+    """Values are passed as parameters, never as part of the query text
+
+    check that values with quotes don't break queries and same query text is reused
+    """
+    def test_quote_in_id(self,db:Database):
+        result_1 = db.lookup_node_property("foo' OR 1=1 //", NodeLabels.PROJECT, NodeProperties.Project.NAME)
+        result_2 = db.set_node_property("foo'}) DETACH DELETE n //", NodeLabels.PROJECT, NodeProperties.Project.NAME, 'bar')
+        assert (
+            result_1 == None
+            and result_2 == False
+        )
+
+    def test_quote_in_value(self,db:Database):
+        id = db.add_node(NodeLabels.PROJECT)
+        db.set_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME, "it's")
+        result = db.lookup_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME)
+        assert result == "it's"
+
+    def test_template_reused(self,db:Database):
+        from app.database import _render_query
+        query_1 = _render_query('lookup_node_property', type='Project', id_type='id', property_name='name')
+        query_2 = _render_query('lookup_node_property', type='Project', id_type='id', property_name='name')
+        assert (
+            query_1 is query_2
+            and '$id_value' in query_1
+        )
+
+
+class TestSingleRoundTrip:
+    """Write operations report a match from the write query itself, without a separate existence check
+
+    count queries sent to the server and check the True/False results stay the same
+    """
+    @pytest.fixture
+    def round_trips(self, monkeypatch):
+        import neo4j
+        calls = []
+        original_run = neo4j.Session.run
+
+        def counting_run(session, *args, **kwargs):
+            calls.append(args[0] if args else kwargs.get('query'))
+            return original_run(session, *args, **kwargs)
+
+        monkeypatch.setattr(neo4j.Session, 'run', counting_run)
+        return calls
+
+    def test_add_node(self,db:Database,round_trips):
+        id = db.add_node(NodeLabels.PROJECT)
+        result = db.lookup_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.DATETIME)
+        assert (
+            len(round_trips) == 2
+            and isinstance(result, DateTime)
+        )
+
+    def test_add_global_settings_twice(self,db:Database,round_trips):
+        id = db.add_node(NodeLabels.GLOBAL_SETTINGS)
+        id_2 = db.add_node(NodeLabels.GLOBAL_SETTINGS)
+        assert (
+            len(round_trips) == 2
+            and UUID(id,version=4)
+            and id_2 == None
+        )
+
+    def test_set_property(self,db:Database,round_trips):
+        id = db.add_node(NodeLabels.PROJECT)
+        round_trips.clear()
+        result = db.set_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo')
+        result_2 = db.set_node_property(random_UUID, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo')
+        assert (
+            len(round_trips) == 2
+            and result == True
+            and result_2 == False
+        )
+
+    def test_remove_property(self,db:Database,round_trips):
+        id = db.add_node(NodeLabels.PROJECT)
+        db.set_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME, 'foo')
+        round_trips.clear()
+        result = db.remove_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME)
+        result_2 = db.remove_node_property(id, NodeLabels.PROJECT, NodeProperties.Project.NAME)
+        assert (
+            len(round_trips) == 2
+            and result == True
+            and result_2 == False
+        )
+
+    def test_delete_node(self,db:Database,round_trips):
+        id = db.add_node(NodeLabels.PROJECT)
+        round_trips.clear()
+        result = db.delete_node(id, NodeLabels.PROJECT)
+        result_2 = db.delete_node(id, NodeLabels.PROJECT)
+        result_3 = db.delete_node(random_UUID, NodeLabels.GLOBAL_SETTINGS)
+        assert (
+            len(round_trips) == 3
+            and result == True
+            and result_2 == False
+            and result_3 == False
+        )
+
+    def test_connect(self,db:Database,round_trips):
+        project_id = db.add_node(NodeLabels.PROJECT)
+        result_id = db.add_node(NodeLabels.RESULT_BLUEPRINT)
+        round_trips.clear()
+        result = db.connect_node_to_node(result_id, NodeLabels.RESULT_BLUEPRINT, project_id, NodeLabels.PROJECT)
+        result_2 = db.connect_node_to_node(result_id, NodeLabels.RESULT_BLUEPRINT, random_UUID, NodeLabels.PROJECT)
+        assert (
+            len(round_trips) == 2
+            and result == True
+            and result_2 == False
+        )
+
+    def test_copy_used_blueprint_back(self,db:Database,round_trips):
+        id = db.add_node(NodeLabels.BLUEPRINT)
+        db.set_node_property(id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME, 'foo')
+        used_id = db.copy_node_to_node(id, NodeLabels.BLUEPRINT, NodeLabels.USED_BLUEPRINT)
+        round_trips.clear()
+        new_id = db.copy_node_to_node(used_id, NodeLabels.USED_BLUEPRINT, NodeLabels.BLUEPRINT)
+        count = len(round_trips)
+        name = db.lookup_node_property(new_id, NodeLabels.BLUEPRINT, NodeProperties.Blueprint.NAME)
+        assert (
+            count == 1
+            and name == 'foo_used'
+        )
@@ -0,0 +1,122 @@
+import pytest
+import threading
+import time
+from app.jobs import JobQueue, JobStatus, QueueFullError, report_progress
+
+pytestmark = pytest.mark.jobs
+
+def wait_for(queue: JobQueue, job_id, timeout=5):
+    """
+    Wait until job is finished.
+
+    Returns:
+        dict: Job status after finishing.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.status(job_id)
+        if status['status'] in (JobStatus.DONE.value, JobStatus.FAILED.value):
+            return status
+        time.sleep(0.01)
+    raise TimeoutError(job_id)
+
+def test_job_result():
+    """
+    Test that submitted job is run and its return value is available as result.
+    """
+    queue = JobQueue(workers=1, queue_size=5)
+    job_id = queue.submit(lambda a, b: a + b, 1, b=2)
+    status = wait_for(queue, job_id)
+    assert (
+        status['status'] == "done"
+        and status['progress'] == 1.0
+        and queue.result(job_id) == (JobStatus.DONE, 3)
+    )
+
+def test_job_failure():
+    """
+    Test that exception in job is reported as failed status with error.
+    """
+    def fail():
+        raise ValueError("broken")
+
+    queue = JobQueue(workers=1, queue_size=5)
+    job_id = queue.submit(fail)
+    status = wait_for(queue, job_id)
+    assert (
+        status['status'] == "failed"
+        and status['error'] == "broken"
+        and queue.result(job_id) == (JobStatus.FAILED, None)
+    )
+
+def test_job_progress():
+    """
+    Test that progress reported from the job is visible in status while it runs.
+    """
+    reported = threading.Event()
+    release = threading.Event()
+
+    def work():
+        report_progress(0.5, "halfway")
+        reported.set()
+        release.wait(5)
+        return "ok"
+
+    queue = JobQueue(workers=1, queue_size=5)
+    job_id = queue.submit(work)
+    reported.wait(5)
+    status = queue.status(job_id)
+    release.set()
+    wait_for(queue, job_id)
+    assert (
+        status['status'] == "running"
+        and status['progress'] == 0.5
+        and status['stage'] == "halfway"
+    )
+
+def test_queue_full():
+    """
+    Test that submitting to a full queue raises QueueFullError, and that the refused job is not kept.
+    """
+    release = threading.Event()
+    queue = JobQueue(workers=1, queue_size=1)
+    running_id = queue.submit(release.wait, 5)
+    # wait until worker picked the first job, so the queue slot is free again
+    while queue.pending() > 0:
+        time.sleep(0.01)
+    queued_id = queue.submit(release.wait, 5)
+
+    with pytest.raises(QueueFullError):
+        queue.submit(release.wait, 5)
+
+    release.set()
+    wait_for(queue, running_id)
+    wait_for(queue, queued_id)
+    assert queue.status(queued_id)['status'] == "done"
+
+def test_unknown_job():
+    """
+    Test that unknown job ids return None.
+    """
+    queue = JobQueue(workers=1, queue_size=1)
+    assert (
+        queue.status("missing") == None
+        and queue.result("missing") == None
+    )
+
+def test_finished_jobs_expire():
+    """
+    Test that finished jobs are forgotten after result_ttl.
+    """
+    queue = JobQueue(workers=1, queue_size=5, result_ttl=0)
+    job_id = queue.submit(lambda: 1)
+    wait_for(queue, job_id)
+    time.sleep(0.01)
+    queue.submit(lambda: 2)
+    assert queue.status(job_id) == None
+
+def test_report_progress_outside_job():
+    """
+    Test that report_progress() can be called outside of a job.
+    """
+    report_progress(0.5)
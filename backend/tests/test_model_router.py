@@ -0,0 +1,182 @@
+import pytest
+import json
+import threading
+import time
+from unittest.mock import patch, MagicMock
+from app.model_router import ModelRouter, Provider, ProviderError, OpenAIProvider, OllamaProvider
+from app.api_handler import ApiHandler
+
+pytestmark = pytest.mark.api_llm
+
+class FakeProvider(Provider):
+    """
+    Provider answering "<name>/<model>" after 'delay' seconds, or failing while 'failing' is set.
+    """
+    def __init__(self, name, delay=0.0, failing=False, **limits):
+        super().__init__(name, **limits)
+        self.delay = delay
+        self.failing = failing
+        self.calls = []
+
+    def generate(self, model, instructions, text, schema=None):
+        self.calls.append((model, instructions, text))
+        time.sleep(self.delay)
+        if self.failing:
+            raise ProviderError(f"{self.name} is down")
+        return f"{self.name}/{model}"
+
+    def generate_stream(self, model, instructions, text):
+        yield self.generate(model, instructions, text)
+
+@pytest.fixture
+def providers():
+    return {"primary": FakeProvider("primary"), "backup": FakeProvider("backup")}
+
+@pytest.fixture
+def router(providers):
+    return ModelRouter(providers, {"OpenAI": ["primary/big", "backup/small"], "backup": ["backup/small"]}, default_route="openai")
+
+def keys(targets):
+    return [target.key for target in targets]
+
+def test_plan_routes(router):
+    """
+    Test that routes are case insensitive, unknown names use the default route and configured "provider/model" targets
+    are used directly.
+    """
+    assert keys(router.plan("openai")) == ["primary/big", "backup/small"]
+    assert keys(router.plan(" OPENAI ")) == ["primary/big", "backup/small"]
+    assert keys(router.plan("something else")) == ["primary/big", "backup/small"]
+    assert keys(router.plan(None)) == ["primary/big", "backup/small"]
+    assert keys(router.plan("Primary/big")) == ["primary/big"]
+    assert router.has_route("Backup") and not router.has_route("gpt-5")
+
+def test_unconfigured_targets_not_used(providers):
+    """
+    Test that "provider/model" names that are not configured use the default route and don't create targets.
+    """
+    router = ModelRouter(providers, {"openai": ["primary/big"]}, targets=["Backup/allowed"])
+
+    assert keys(router.plan("backup/allowed")) == ["backup/allowed"]
+    assert keys(router.plan("backup/Other-Model")) == ["primary/big"]
+    assert keys(router.plan("primary/expensive-model")) == ["primary/big"]
+    assert set(router.stats()) == {"primary/big", "backup/allowed"}
+
+def test_invalid_config(providers):
+    """
+    Test that unknown providers, empty routes and a missing default route are rejected.
+    """
+    with pytest.raises(ValueError):
+        ModelRouter(providers, {"openai": ["missing/model"]})
+    with pytest.raises(ValueError):
+        ModelRouter(providers, {"other": ["primary/big"]})
+    with pytest.raises(ValueError):
+        ModelRouter.from_config({"routes": {"empty": []}}, routes={"openai": ["openai/gpt-4o"]})
+    with pytest.raises(ValueError):
+        ModelRouter.from_config({"providers": {"x": {"type": "carrier-pigeon"}}})
+
+def test_failing_target_moves_last(router, providers):
+    """
+    Test that a target failing more often than max_error_rate is tried after the others until the cooldown has passed.
+    """
+    providers["primary"].failing = True
+    primary = router.plan("openai")[0]
+    for _ in range(3):
+        with pytest.raises(ProviderError):
+            primary.generate("instructions", "text")
+
+    assert keys(router.plan("openai")) == ["backup/small", "primary/big"]
+
+    with patch("app.model_router.time.monotonic", return_value=time.monotonic() + 60):
+        assert keys(router.plan("openai")) == ["primary/big", "backup/small"]
+
+def test_invalid_response_counts_as_failure(router):
+    """
+    Test that a response failing validation raises ProviderError and is recorded as a failure of the target.
+    """
+    def validate(result):
+        raise ValueError("not JSON")
+
+    with pytest.raises(ProviderError, match="not JSON"):
+        router.plan("openai")[0].generate("instructions", "text", schema={}, validate=validate)
+
+    stats = router.stats()["primary/big"]
+    assert stats["requests"] == 1 and stats["failures"] == 1
+
+def test_slow_target_moves_last(providers):
+    """
+    Test that a target over its provider's slow_after latency is tried after the others.
+    """
+    providers["primary"] = FakeProvider("primary", delay=0.05, slow_after=0.01)
+    router = ModelRouter(providers, {"openai": ["primary/big", "backup/small"]})
+    router.plan("openai")[0].generate("instructions", "text")
+
+    assert keys(router.plan("openai")) == ["backup/small", "primary/big"]
+    assert router.stats()["primary/big"]["latency"] >= 0.05
+
+def test_saturated_target_moves_last(providers):
+    """
+    Test that a provider with all concurrency slots in use is tried after the others, and that the limit holds.
+    """
+    providers["primary"] = FakeProvider("primary", delay=0.2, max_concurrency=1)
+    router = ModelRouter(providers, {"openai": ["primary/big", "backup/small"]})
+
+    thread = threading.Thread(target=router.plan("openai")[0].generate, args=("instructions", "text"))
+    thread.start()
+    time.sleep(0.05)
+    assert keys(router.plan("openai")) == ["backup/small", "primary/big"]
+    thread.join()
+    assert keys(router.plan("openai")) == ["primary/big", "backup/small"]
+
+def test_from_file(tmp_path):
+    """
+    Test loading providers and routes from a JSON file on top of the default routes.
+    """
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps({
+        "providers": {
+            "vllm": {"type": "openai-compatible", "base_url": "http://localhost:8000/v1", "timeout": 30, "max_concurrency": 2},
+            "ollama": {"type": "ollama", "url": "http://localhost:11434", "timeout": 60},
+        },
+        "routes": {"mistral": ["ollama/mistral", "vllm/mistralai/Mistral-7B-Instruct-v0.3"]},
+    }))
+    router = ModelRouter.from_file(str(path), routes={"openai": ["openai/gpt-4o"], "mistral": ["ollama/mistral"]})
+
+    plan = router.plan("Mistral")
+    assert keys(plan) == ["ollama/mistral", "vllm/mistralai/Mistral-7B-Instruct-v0.3"]
+    assert isinstance(plan[0].provider, OllamaProvider) and isinstance(plan[1].provider, OpenAIProvider)
+    assert plan[1].model == "mistralai/Mistral-7B-Instruct-v0.3"
+    assert plan[1].provider.max_concurrency == 2
+    assert keys(router.plan("anything")) == ["openai/gpt-4o"]
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_api_handler_falls_back(router, providers):
+    """
+    Test that analysis continues on the next target when one fails, and the selected model is not dropped.
+    """
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__router = router
+
+    assert api_handler.analyze("Sample text", None, "OpenAI") == "primary/big"
+    assert api_handler.analyze("Sample text", None, "backup") == "backup/small"
+
+    providers["primary"].failing = True
+    assert api_handler.analyze("Sample text", None, "OpenAI") == "backup/small"
+    assert list(api_handler.stream_analyze("Other text", None, "OpenAI")) == ["backup/small"]
+    assert api_handler.router_stats()["primary/big"]["failures"] == 2
+
+    providers["backup"].failing = True
+    assert api_handler.analyze("New text", None, "OpenAI") is None
+    with pytest.raises(RuntimeError):
+        list(api_handler.stream_analyze("Newer text", None, "OpenAI"))
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_stream_without_targets():
+    """
+    Test that streaming with a route that has no targets raises ProviderError.
+    """
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__router = MagicMock(plan=MagicMock(return_value=[]))
+
+    with pytest.raises(ProviderError):
+        list(api_handler.stream_analyze("Text", None, "empty"))
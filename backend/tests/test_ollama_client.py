@@ -0,0 +1,122 @@
+import pytest
+import json
+import threading
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.ollama_client import OllamaClient, OllamaError
+
+pytestmark = pytest.mark.api_llm
+
+class StubOllama(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for Ollama's /api/generate. Records requests and client connections on the server.
+    """
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        self.server.connections.add(self.client_address)
+
+        if body["prompt"] == "fail":
+            self.__send(404, json.dumps({"error": "model 'missing' not found"}).encode())
+        elif body["stream"]:
+            lines = [
+                {"model": body["model"], "created_at": "2024-01-01T00:00:00.0Z", "response": "Hello", "done": False},
+                {"model": body["model"], "created_at": "2024-01-01T00:00:00.1Z", "response": " world", "done": False},
+                {"model": body["model"], "created_at": "2024-01-01T00:00:00.2Z", "response": "", "done": True, "done_reason": "stop"},
+            ]
+            self.__send(200, b"".join(json.dumps(line).encode() + b"\n" for line in lines), "application/x-ndjson")
+        else:
+            message = {"model": body["model"], "created_at": "2024-01-01T00:00:00.0Z", "response": "Hello world", "done": True, "done_reason": "stop"}
+            self.__send(200, json.dumps(message).encode())
+
+    def __send(self, status, payload, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    """
+    Fixture to run StubOllama on a free local port.
+
+    Returns:
+        ThreadingHTTPServer: Running server, with 'requests' and 'connections' recorded.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    server.requests = []
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub_server):
+    """
+    Fixture to create an OllamaClient pointing at the stub server.
+    """
+    return OllamaClient(base_url=f"http://127.0.0.1:{stub_server.server_port}", keep_alive="10m")
+
+def test_generate_reads_only_response(client, stub_server):
+    """
+    Test that generate() returns only the 'response' field and sends keep_alive.
+    """
+    result = client.generate("mistral", "Analyze this")
+    assert result == "Hello world"
+    assert stub_server.requests[0] == {"model": "mistral", "prompt": "Analyze this", "stream": False, "keep_alive": "10m"}
+
+def test_generate_system_prompt(client, stub_server):
+    """
+    Test that system prompt is sent in its own field.
+    """
+    client.generate("mistral", "Document", system="Instructions")
+    assert stub_server.requests[0]["system"] == "Instructions"
+
+def test_generate_stream(client, stub_server):
+    """
+    Test that generate_stream() yields the response pieces of the NDJSON stream.
+    """
+    assert list(client.generate_stream("mistral", "Analyze this")) == ["Hello", " world"]
+    assert stub_server.requests[0]["stream"] is True
+
+def test_connection_reused(client, stub_server):
+    """
+    Test that consecutive requests reuse the same pooled connection.
+    """
+    for _ in range(5):
+        client.generate("mistral", "Analyze this")
+    list(client.generate_stream("mistral", "Analyze this"))
+    assert len(stub_server.requests) == 6
+    assert len(stub_server.connections) == 1
+
+def test_error_response(client):
+    """
+    Test that Ollama's error message is raised as OllamaError.
+    """
+    with pytest.raises(OllamaError, match="not found"):
+        client.generate("missing", "fail")
+    with pytest.raises(OllamaError, match="not found"):
+        list(client.generate_stream("missing", "fail"))
+
+def test_connection_refused():
+    """
+    Test that unreachable server raises a requests exception within the connect timeout.
+    """
+    client = OllamaClient(base_url="http://127.0.0.1:9", connect_timeout=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.generate("mistral", "Analyze this")
+
+def test_keep_alive_seconds():
+    """
+    Test that numeric keep_alive is sent as a number, as Ollama expects for seconds.
+    """
+    client = OllamaClient(base_url="http://127.0.0.1:9", keep_alive="-1")
+    assert client._OllamaClient__payload("mistral", "x", None, False)["keep_alive"] == -1
@@ -0,0 +1,87 @@
+import pytest
+from app import prompts
+
+pytestmark = pytest.mark.api_llm
+
+def test_analysis_prompt_questions():
+    """
+    Test that blueprint questions follow the fixed instructions, and no blueprint gives the instructions only.
+    """
+    prompt = prompts.analysis_prompt({"questions": ["What?", "Why?"]})
+    assert prompt.startswith(prompts.ANALYSIS_INSTRUCTIONS)
+    assert prompt.endswith("- What?\n- Why?")
+    assert prompts.analysis_prompt(None) == prompts.ANALYSIS_INSTRUCTIONS
+    assert prompts.analysis_prompt({"name": "No questions"}) == prompts.ANALYSIS_INSTRUCTIONS
+
+def test_prompt_built_once_per_questions():
+    """
+    Test that prompts are reused for blueprints with the same questions and rebuilt when the questions change.
+    """
+    prompts._build.cache_clear()
+    first = prompts.analysis_prompt({"id": "1", "questions": ["What?"]})
+    second = prompts.analysis_prompt({"id": "2", "name": "Copy", "questions": ["What?"]})
+    assert first is second
+    assert prompts._build.cache_info().hits == 1
+
+    changed = prompts.analysis_prompt({"id": "1", "questions": ["What?", "When?"]})
+    assert changed != first and prompts._build.cache_info().misses == 2
+
+def test_reduce_prompt():
+    """
+    Test merge instructions and that partial analyses are numbered in order.
+    """
+    assert prompts.reduce_prompt({"questions": ["What?"]}).endswith("- What?")
+    text = prompts.reduce_text(["first", "second"])
+    assert text == "### Analysis of part 1 of 2\nfirst\n\n### Analysis of part 2 of 2\nsecond"
+
+def test_split_batch():
+    """
+    Test splitting a packed response, leaving out empty, repeated and out of range analyses.
+    """
+    assert prompts.batch_text(["a", "b"]) == '<document id="1">\na\n</document>\n\n<document id="2">\nb\n</document>'
+    assert prompts.batch_prompt(None).startswith(prompts.ANALYSIS_INSTRUCTIONS)
+    assert not prompts.can_batch("text with </document> in it")
+
+    response = (
+        '<analysis id="1">\nfirst\n</analysis>\n'
+        '<analysis id="2">\n\n</analysis>\n'
+        '<analysis id="3">\nthird\n</analysis>\n<analysis id="3">\nthird again\n</analysis>\n'
+        '<analysis id="4">\nfourth\n</analysis>\n<analysis id="9">\nextra\n</analysis>'
+    )
+    assert prompts.split_batch(response, 4) == {0: "first", 3: "fourth"}
+
+def test_analysis_schema():
+    """
+    Test that every blueprint question gets its own required answer field, and no questions leaves answers out.
+    """
+    schema = prompts.analysis_schema({"questions": ["What?", "Why?"]})
+    answers = schema["properties"]["answers"]
+    assert answers["required"] == ["question_1", "question_2"]
+    assert answers["properties"]["question_2"]["description"] == "Why?"
+    assert set(schema["required"]) == set(schema["properties"]) and schema["additionalProperties"] is False
+    assert "answers" not in prompts.analysis_schema(None)["properties"]
+    assert prompts.structured_prompt(None).startswith(prompts.ANALYSIS_INSTRUCTIONS)
+
+def test_structured_result():
+    """
+    Test that a valid response is paired with the questions and rendered, and invalid ones raise ValueError.
+    """
+    blueprint = {"questions": ["What?", "Why?"]}
+    response = (
+        '{"main_themes": ["theme"], "key_points": ["point"], "notable_quotes": [], "overall_sentiment": "neutral", '
+        '"answers": {"question_1": "This.", "question_2": " Because. "}}'
+    )
+    result = prompts.structured_result(response, blueprint)
+    assert result["answers"] == [{"question": "What?", "answer": "This."}, {"question": "Why?", "answer": "Because."}]
+    assert result["overall_sentiment"] == "neutral"
+    assert "1. **Main Themes**:\n- theme" in result["result"] and "**Why?**\nBecause." in result["result"]
+
+    for invalid in [
+        "not json",
+        "[]",
+        response.replace('"overall_sentiment": "neutral"', '"overall_sentiment": 1'),
+        response.replace('"key_points": ["point"]', '"key_points": "point"'),
+        response.replace('"question_2"', '"question_3"'),
+    ]:
+        with pytest.raises(ValueError):
+            prompts.structured_result(invalid, blueprint)
@@ -0,0 +1,226 @@
+import pytest
+import json
+import threading
+import time
+import openai
+from openai import OpenAI
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from app.rate_limiter import RateLimitScheduler, ModelRateLimiter, parse_duration, priority, INTERACTIVE, BATCH
+from app.api_handler import ApiHandler, PRIMARY_MODEL
+
+pytestmark = pytest.mark.api_llm
+
+class StubOpenAI(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for OpenAI's /v1/chat/completions. Answers 429 to the first 'rate_limited' requests,
+    502 to the next 'server_errors' requests, then completions. Every response has x-ratelimit-* headers.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests.append(body)
+            limited = self.server.rate_limited > 0
+            if limited:
+                self.server.rate_limited -= 1
+            failed = not limited and self.server.server_errors > 0
+            if failed:
+                self.server.server_errors -= 1
+
+        headers = {
+            "x-ratelimit-limit-requests": "600",
+            "x-ratelimit-remaining-requests": "0" if limited else "599",
+            "x-ratelimit-reset-requests": "100ms",
+            "x-ratelimit-limit-tokens": "90000",
+            "x-ratelimit-remaining-tokens": "89000",
+            "x-ratelimit-reset-tokens": "1s",
+        }
+        if limited:
+            headers["retry-after-ms"] = "10"
+            error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            self.__send(429, json.dumps(error).encode(), headers)
+            return
+        if failed:
+            error = {"error": {"message": "Bad gateway", "type": "server_error"}}
+            self.__send(502, json.dumps(error).encode(), headers)
+            return
+
+        completion = {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "Analyzed text result."}, "finish_reason": "stop"}],
+        }
+        self.__send(200, json.dumps(completion).encode(), headers)
+
+    def __send(self, status, payload, headers):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    """
+    Fixture to run StubOpenAI on a free local port.
+
+    Returns:
+        ThreadingHTTPServer: Running server, set 'rate_limited' to answer 429 and
+            'server_errors' to answer 502 to that many requests.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAI)
+    server.requests = []
+    server.rate_limited = 0
+    server.server_errors = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(stub_server):
+    """
+    Fixture to create an OpenAI client pointing at the stub server, with the SDK's own retries disabled.
+    """
+    return OpenAI(api_key="test", base_url=f"http://127.0.0.1:{stub_server.server_port}/v1", max_retries=0)
+
+def chat(client, model="gpt-4o"):
+    return lambda: client.chat.completions.with_raw_response.create(
+        model=model,
+        messages=[{"role": "user", "content": "Sample text"}],
+    )
+
+def test_retries_rate_limited_requests(client, stub_server):
+    """
+    Test that rate limited requests are retried until they succeed.
+    """
+    stub_server.rate_limited = 2
+    scheduler = RateLimitScheduler(max_retries=3, base_delay=0.01)
+
+    response = scheduler.call("gpt-4o", 100, chat(client))
+    assert response.choices[0].message.content == "Analyzed text result."
+    assert len(stub_server.requests) == 3
+    assert scheduler.stats()["retries"] == 2
+
+def test_raises_when_retries_run_out(client, stub_server):
+    """
+    Test that RateLimitError is raised after max_retries.
+    """
+    stub_server.rate_limited = 10
+    scheduler = RateLimitScheduler(max_retries=2, base_delay=0.01)
+
+    with pytest.raises(openai.RateLimitError):
+        scheduler.call("gpt-4o", 100, chat(client))
+    assert len(stub_server.requests) == 3
+
+def test_retries_server_errors(client, stub_server):
+    """
+    Test that server errors are retried too, as the SDK's own retries are disabled.
+    """
+    stub_server.rate_limited = 1
+    stub_server.server_errors = 2
+    scheduler = RateLimitScheduler(max_retries=3, base_delay=0.01)
+
+    response = scheduler.call("gpt-4o", 100, chat(client))
+    assert response.choices[0].message.content == "Analyzed text result."
+    assert len(stub_server.requests) == 4
+    assert scheduler.stats()["retries"] == 3
+
+def test_limits_follow_headers(client, stub_server):
+    """
+    Test that per minute limits and remaining amounts are taken from the x-ratelimit-* headers, per model.
+    """
+    scheduler = RateLimitScheduler(requests_per_minute=10, tokens_per_minute=1000)
+    scheduler.call("gpt-4o", 100, chat(client))
+
+    stats = scheduler.stats()["models"]["gpt-4o"]
+    assert stats["requests_per_minute"] == 600
+    assert stats["tokens_per_minute"] == 90000
+    assert stats["tokens_available"] >= 89000
+    assert "gpt-4o-mini" not in scheduler.stats()["models"]
+
+def test_interactive_before_batch():
+    """
+    Test that a waiting interactive request is let through before batch requests that were waiting longer.
+    """
+    limiter = ModelRateLimiter(requests_per_minute=600, tokens_per_minute=100000)
+    # no requests left, one more every 0.1 s
+    limiter.update_from_headers({"x-ratelimit-limit-requests": "600", "x-ratelimit-remaining-requests": "0"})
+
+    order = []
+    def acquire(name, value):
+        limiter.acquire(10, value)
+        order.append(name)
+
+    threads = [threading.Thread(target=acquire, args=("batch 1", BATCH))]
+    threads[0].start()
+    time.sleep(0.02)
+    threads.append(threading.Thread(target=acquire, args=("batch 2", BATCH)))
+    threads[1].start()
+    time.sleep(0.02)
+    threads.append(threading.Thread(target=acquire, args=("interactive", INTERACTIVE)))
+    threads[2].start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == ["interactive", "batch 1", "batch 2"]
+
+def test_paces_to_requests_per_minute():
+    """
+    Test that requests over the limit wait for the bucket to refill.
+    """
+    limiter = ModelRateLimiter(requests_per_minute=1200, tokens_per_minute=100000)
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0"})
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(10)
+    # 20 requests per second
+    assert time.monotonic() - start >= 0.14
+
+def test_backoff():
+    """
+    Test that backoff uses retry-after headers when given, otherwise grows exponentially with jitter.
+    """
+    scheduler = RateLimitScheduler(base_delay=1, max_delay=8)
+    assert scheduler.backoff(0, {"retry-after-ms": "250"}) == 0.25
+    assert scheduler.backoff(0, {"retry-after": "2"}) == 2
+    assert 0.5 <= scheduler.backoff(0) <= 1
+    assert 2 <= scheduler.backoff(2) <= 4
+    assert 4 <= scheduler.backoff(10) <= 8
+
+def test_parse_duration():
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_duration("") is None
+    assert parse_duration("soon") is None
+
+@patch.object(ApiHandler, "__init__", lambda x: None)  # Mock __init__ to skip it
+def test_api_handler_retries_without_backup_model(client, stub_server):
+    """
+    Test that a rate limited analysis is retried with the same model instead of falling back to the backup model,
+    and that batch priority is kept inside the priority block.
+    """
+    stub_server.rate_limited = 2
+
+    api_handler = ApiHandler()
+    api_handler._ApiHandler__client = client
+    api_handler._ApiHandler__scheduler = RateLimitScheduler(max_retries=3, base_delay=0.01)
+
+    with priority(BATCH):
+        result = api_handler.openai_analyze("Sample text", None)
+    assert result == "Analyzed text result."
+    assert [request["model"] for request in stub_server.requests] == [PRIMARY_MODEL] * 3
@@ -0,0 +1,139 @@
+import pytest
+import hashlib
+import io
+import os
+import time
+from unittest.mock import patch
+from app.uploads import UploadStore, UploadTooLargeError, TextCache
+
+class RecordingStream(io.BytesIO):
+    """
+    BytesIO remembering the size of every read.
+    """
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path), chunk_size=4, max_size=32)
+
+def test_save_streams_in_chunks(store, tmp_path):
+    """
+    Test that the file is read in chunk_size pieces, hashed, and stored under its hash with the original extension.
+    """
+    data = b"Sample file content."
+    stream = RecordingStream(data)
+    upload = store.save(stream, "sample.TXT")
+
+    assert set(stream.reads) == {4}
+    assert upload["id"] == hashlib.sha256(data).hexdigest() + ".txt"
+    assert upload["reused"] is False
+    assert upload["filename"] == "sample.TXT"
+    assert upload["size"] == len(data)
+    assert upload["sha256"] == hashlib.sha256(data).hexdigest()
+    with open(store.path(upload["id"]), "rb") as file:
+        assert file.read() == data
+    assert os.path.dirname(store.path(upload["id"])) == str(tmp_path)
+
+def test_same_filename_does_not_overwrite(store):
+    """
+    Test that uploads with the same filename are kept separately.
+    """
+    first = store.save(io.BytesIO(b"first"), "same.txt")
+    second = store.save(io.BytesIO(b"second"), "same.txt")
+
+    assert first["id"] != second["id"]
+    with open(store.path(first["id"]), "rb") as file:
+        assert file.read() == b"first"
+
+def test_too_large(store, tmp_path):
+    """
+    Test that uploads over max_size are refused and nothing is left in the spool directory.
+    """
+    with pytest.raises(UploadTooLargeError):
+        store.save(io.BytesIO(b"x" * 33), "large.pdf")
+    assert os.listdir(tmp_path) == []
+
+def test_invalid_ids(store, tmp_path):
+    """
+    Test that only generated ids are resolved, so other files can't be reached through the store.
+    """
+    (tmp_path / "secret.txt").write_text("secret")
+    upload = store.save(io.BytesIO(b"data"), "../../name with spaces")
+
+    assert store.path(upload["id"]) is not None and "." not in upload["id"]
+    for upload_id in ["secret.txt", "../secret.txt", "/etc/passwd", None, upload["id"] + "/"]:
+        assert store.path(upload_id) is None
+    assert not store.delete("secret.txt")
+    assert store.delete(upload["id"]) and store.path(upload["id"]) is None
+
+def test_cleanup_removes_old_uploads(tmp_path):
+    """
+    Test that uploads older than max_age are removed.
+    """
+    store = UploadStore(str(tmp_path), max_age=60)
+    old = store.save(io.BytesIO(b"old"), "old.txt")
+    new = store.save(io.BytesIO(b"new"), "new.txt")
+    past = time.time() - 120
+    os.utime(store.path(old["id"]), (past, past))
+
+    assert store.cleanup() == 1
+    assert store.path(old["id"]) is None and store.path(new["id"]) is not None
+
+def test_same_content_stored_once(store, tmp_path):
+    """
+    Test that the same content is stored once, and can be found by hash without uploading it.
+    """
+    first = store.save(io.BytesIO(b"same"), "a.pdf")
+    second = store.save(io.BytesIO(b"same"), "b.pdf")
+
+    assert first["id"] == second["id"] and second["reused"] is True
+    assert os.listdir(tmp_path) == [first["id"]]
+    assert store.find(first["sha256"], "c.PDF")["id"] == first["id"]
+    # extension decides extraction, so it's part of the id
+    assert store.find(first["sha256"], "c.txt") is None
+    assert store.find("not a hash", "c.pdf") is None
+
+def test_lru_eviction_keeps_uploads_in_use(tmp_path):
+    """
+    Test that least recently used uploads are removed over max_bytes, except uploads in use.
+    """
+    store = UploadStore(str(tmp_path), max_bytes=10)
+    first = store.save(io.BytesIO(b"1111"), "1.txt")
+    second = store.save(io.BytesIO(b"2222"), "2.txt")
+    past = time.time() - 60
+    os.utime(store.path(first["id"]), (past, past))
+    os.utime(store.path(second["id"]), (past + 1, past + 1))
+
+    with store.using(first["id"]) as filepath:
+        assert filepath is not None
+        assert not store.delete(first["id"])
+        store.save(io.BytesIO(b"3333"), "3.txt")
+        # first is older but in use, second goes
+        assert store.path(first["id"]) is not None and store.path(second["id"]) is None
+
+    with store.using(second["id"]) as filepath:
+        assert filepath is None
+
+def test_text_cache(tmp_path):
+    """
+    Test that extracted text is cached by upload id, and only after every page was extracted.
+    """
+    cache = TextCache(str(tmp_path / "text"), max_bytes=1024 * 1024)
+    upload_id = "a" * 64 + ".pdf"
+    pages = [(1, "first page"), (2, "toinen sivu ä")]
+
+    with patch("app.uploads.utils.iter_text_from_file", side_effect=lambda filepath: iter(pages)) as extract:
+        # stopped after the first page, nothing cached
+        assert next(cache.iter_pages("doc.pdf", upload_id)) == (1, "first page")
+        assert list(cache.iter_pages("doc.pdf", upload_id)) == pages
+        assert list(cache.iter_pages("other/path.pdf", upload_id)) == pages
+        assert list(cache.iter_pages("doc.pdf", None)) == pages
+
+    assert extract.call_count == 3
+    assert cache.stats() == {"hits": 1, "misses": 2}
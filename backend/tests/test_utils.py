@@ -1,6 +1,6 @@
 import pytest
 import os
-from app.utils import extract_text_from_file
+from app.utils import extract_text_from_file, iter_text_from_file, start_extract_pool, stop_extract_pool
 from unittest.mock import patch, MagicMock
 from pypdf import PdfReader
 
@@ -36,6 +36,21 @@ def create_empty_text_file(tmp_path):
     file.write_text("")
     return file
 
+def mock_document(pages, page_count=None):
+    """
+    Mock PyMuPDF document iterating over the given pages.
+
+    Parameters:
+        pages (Iterable): Mock pages.
+        page_count (int, optional): Page count of the document. Defaults to len(pages).
+
+    Returns:
+        MagicMock: Document to return from the mocked `pymupdf.open()` context manager.
+    """
+    document = MagicMock(page_count=page_count if page_count is not None else len(pages))
+    document.__iter__.side_effect = lambda: iter(pages)
+    return document
+
 def test_extract_text_from_txt_file(create_text_file):
     """
     Tests extract_text_from_file for .txt files containing text.
@@ -113,7 +128,7 @@ def test_extract_text_from_pdf_file():
     mock_page.get_text.return_value = expected_text
     # mock file
     mock_file = MagicMock()
-    mock_file.__enter__.return_value = [mock_page] # Simulate that iterating over the document returns the mock page
+    mock_file.__enter__.return_value = mock_document([mock_page]) # Simulate that iterating over the document returns the mock page
     mock_file.__exit__.return_value = None # Simulate proper exit behavior
 
     # Mock pymupdf.open() to return a mock document object that behaves like a context manager
@@ -126,3 +141,214 @@ def test_extract_text_from_pdf_file():
             mock_extra_check.assert_called_once_with("mocked_file.pdf") # Ensure pymupdf.open was called correctly
             mock_file.__enter__.assert_called_once() # Ensure __enter__ was called on the mock document
             assert result == expected_text
+
+def test_iter_text_from_pdf_pages():
+    """
+    Tests that iter_text_from_file yields each PDF page with its page number,
+    and that extract_text_from_file joins the pages with form feeds.
+
+    Mocks:
+        - `os.path.isfile`: Always returns True to simulate that the file exists.
+        - `pymupdf.open`: Returns a mock document with three pages.
+    """
+    mock_pages = []
+    for text in ["Page one.", "Page two.", "Page three."]:
+        mock_page = MagicMock()
+        mock_page.get_text.return_value = text
+        mock_pages.append(mock_page)
+    mock_file = MagicMock()
+    mock_file.__enter__.return_value = mock_document(mock_pages)
+    mock_file.__exit__.return_value = None
+
+    with patch("pymupdf.open", return_value=mock_file):
+        with patch("os.path.isfile", return_value=True):
+            pages = list(iter_text_from_file("mocked_file.pdf"))
+            text = extract_text_from_file("mocked_file.pdf")
+
+    assert pages == [(1, "Page one."), (2, "Page two."), (3, "Page three.")]
+    assert text == "Page one.\fPage two.\fPage three."
+
+def test_iter_text_from_pdf_is_lazy(monkeypatch):
+    """
+    Tests that pages are yielded before the rest of the document is read.
+    """
+    monkeypatch.setenv("PARALLEL_EXTRACT_MIN_PAGES", "1000")
+    read_pages = []
+
+    def make_page(number):
+        mock_page = MagicMock()
+        mock_page.get_text.side_effect = lambda: read_pages.append(number) or f"Page {number}."
+        return mock_page
+
+    mock_file = MagicMock()
+    mock_file.__enter__.return_value = mock_document((make_page(number) for number in range(1, 301)), page_count=300)
+    mock_file.__exit__.return_value = None
+
+    with patch("pymupdf.open", return_value=mock_file):
+        with patch("os.path.isfile", return_value=True):
+            pages = iter_text_from_file("mocked_file.pdf")
+            first = next(pages)
+            pages.close()
+
+    assert first == (1, "Page 1.")
+    assert read_pages == [1]
+
+def test_iter_text_from_txt_blocks(tmp_path, monkeypatch):
+    """
+    Tests that txt files are yielded in blocks of whole lines, which join back to the original text.
+    """
+    monkeypatch.setattr("app.utils.TXT_BLOCK_SIZE", 20)
+    content = "".join(f"line {i}\n" for i in range(20))
+    file = tmp_path / "lines.txt"
+    file.write_text(content)
+
+    blocks = list(iter_text_from_file(str(file)))
+    assert len(blocks) > 1
+    assert all(page_number == 1 and text.endswith("\n") for page_number, text in blocks)
+    assert "".join(text for page_number, text in blocks) == content
+    assert extract_text_from_file(str(file)) == content.strip()
+
+def test_parallel_pdf_extraction_matches_serial(tmp_path, monkeypatch):
+    """
+    Tests that PDF extraction with the process pool gives the same pages in the same order as serial extraction.
+
+    Test Strategy:
+        - Generate a 12 page PDF with PyMuPDF.
+        - Extract it serially (threshold above page count) and in parallel (threshold 1, pool of 3 workers).
+    """
+    import pymupdf
+    filepath = str(tmp_path / "generated.pdf")
+    document = pymupdf.open()
+    for number in range(1, 13):
+        page = document.new_page()
+        page.insert_text((72, 72), f"This is page {number}.")
+    document.save(filepath)
+    document.close()
+
+    monkeypatch.setenv("PARALLEL_EXTRACT_MIN_PAGES", "1000")
+    serial = list(iter_text_from_file(filepath))
+
+    monkeypatch.setenv("PARALLEL_EXTRACT_MIN_PAGES", "1")
+    monkeypatch.setenv("EXTRACT_WORKERS", "3")
+    start_extract_pool()
+    try:
+        parallel = list(iter_text_from_file(filepath))
+    finally:
+        stop_extract_pool()
+
+    assert len(serial) == 12
+    assert parallel == serial
+    assert all(f"This is page {number}." in text for number, text in parallel)
+
+def test_iter_text_from_txt_without_line_breaks(tmp_path, monkeypatch):
+    """
+    Tests that a txt file without line breaks is yielded in blocks of at most TXT_BLOCK_SIZE characters,
+    cut at whitespace where there is any.
+    """
+    monkeypatch.setattr("app.utils.TXT_BLOCK_SIZE", 20)
+    monkeypatch.setattr("app.utils.TXT_READ_SIZE", 16)
+    content = "word " * 2000 + "x" * 100
+    file = tmp_path / "one_line.txt"
+    file.write_text(content)
+
+    blocks = [text for page_number, text in iter_text_from_file(str(file))]
+    assert "".join(blocks) == content
+    assert all(len(text) <= 20 for text in blocks)
+    assert all(text.endswith(" ") for text in blocks[:2000 // 4])
+    assert blocks[-5:] == ["x" * 20] * 5
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "utf-16", "cp1252"])
+def test_iter_text_from_txt_encodings(tmp_path, monkeypatch, encoding):
+    """
+    Tests that the encoding of txt files is detected, and characters and line breaks split between reads are decoded.
+    """
+    monkeypatch.setattr("app.utils.TXT_READ_SIZE", 3)
+    content = "Hyvää päivää, Åsa!\nÖljyä ja sähköä.\n" * 10
+    file = tmp_path / "finnish.txt"
+    file.write_bytes(content.replace("\n", "\r\n").encode(encoding))
+
+    assert "".join(text for page_number, text in iter_text_from_file(str(file))) == content
+
+def test_iter_text_from_txt_detects_other_encodings(tmp_path):
+    """
+    Tests that encodings other than UTF-8 and the Latin fallback are detected, and empty files yield nothing.
+    """
+    content = "Привет, это тестовый текст для проверки кодировки.\n" * 20
+    file = tmp_path / "russian.txt"
+    file.write_bytes(content.encode("cp1251"))
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+
+    assert extract_text_from_file(str(file)) == content.strip()
+    assert list(iter_text_from_file(str(empty))) == []
+
+def write_docx(path, body):
+    """
+    Write a minimal Word document with the given w:body content.
+    """
+    import zipfile
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr(
+            "word/document.xml",
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>"
+        )
+
+def test_iter_text_from_docx(tmp_path):
+    """
+    Tests that Word paragraphs are extracted by pages, and the content decides the type over the extension.
+    """
+    body = (
+        "<w:p><w:r><w:t>Otsikko</w:t></w:r></w:p>"
+        "<w:p><w:r><w:t>Ensimmäinen</w:t><w:tab/><w:t>sivu</w:t></w:r>"
+        '<w:r><w:br w:type="page"/></w:r><w:r><w:lastRenderedPageBreak/><w:t>Toinen sivu</w:t></w:r></w:p>'
+    )
+    for name in ["document.docx", "mislabeled.txt"]:
+        write_docx(tmp_path / name, body)
+        assert list(iter_text_from_file(str(tmp_path / name))) == [(1, "Otsikko\nEnsimmäinen\tsivu"), (2, "Toinen sivu\n")]
+
+def test_iter_text_from_markdown_sections(tmp_path):
+    """
+    Tests that Markdown is split into sections at headings, but not at "#" lines in code blocks.
+    """
+    file = tmp_path / "notes.md"
+    file.write_text("# Title\nIntro\n## Part\n```\n# not a heading\n```\n## Last\n", encoding="utf-8")
+
+    assert list(iter_text_from_file(str(file))) == [
+        (1, "# Title\nIntro\n"),
+        (2, "## Part\n```\n# not a heading\n```\n"),
+        (3, "## Last\n"),
+    ]
+
+def test_iter_text_from_csv(tmp_path, monkeypatch):
+    """
+    Tests that the CSV delimiter is detected and every section starts with the header row.
+    """
+    monkeypatch.setattr("app.utils.TXT_BLOCK_SIZE", 24)
+    file = tmp_path / "data.csv"
+    file.write_text("nimi;arvo\nA;1\nB;2\n\n\"C;D\";3\n", encoding="utf-8")
+
+    assert list(iter_text_from_file(str(file))) == [
+        (1, "nimi | arvo\nA | 1\nB | 2\n"),
+        (2, "nimi | arvo\nC;D | 3\n"),
+    ]
+
+def test_iter_text_from_html(tmp_path):
+    """
+    Tests that HTML is converted without scripts and styles, in sections by headings.
+    """
+    pytest.importorskip("html2text")
+    file = tmp_path / "page.html"
+    file.write_text(
+        "<html><head><style>p {color: red}</style><script>var x = 1;</script></head>"
+        "<body><h1>Otsikko</h1><p>Hyvää <a href='https://example.com'>päivää</a></p><h2>Osa</h2><p>Teksti</p></body></html>",
+        encoding="utf-8",
+    )
+
+    sections = list(iter_text_from_file(str(file)))
+    assert [number for number, text in sections] == [1, 2]
+    assert "Otsikko" in sections[0][1] and "Hyvää päivää" in sections[0][1]
+    assert "Teksti" in sections[1][1]
+    text = extract_text_from_file(str(file))
+    assert "color" not in text and "var x" not in text and "example.com" not in text
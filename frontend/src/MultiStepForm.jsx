@@ -293,8 +293,9 @@ const MultiStepForm = ({ projects, setProjects, setExpanded, setSelectedResult,
   
     
     if (selectedFiles.length > 0) {
-      filename = await uploadFile(selectedFiles[0]);
-      analysisResult = await analyzeUploadedFile(filename, selectedBlueprint, selectedAI);
+      const upload = await uploadFile(selectedFiles[0]);
+      filename = upload.filename;
+      analysisResult = await analyzeUploadedFile(upload.id, selectedBlueprint, selectedAI);
     } else {
       analysisResult = await analyzeText(copiedText, selectedBlueprint, selectedAI);
     }
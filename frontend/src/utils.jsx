@@ -1,30 +1,59 @@
 // Files & analysis
 /**
- * Uploads a file to the backend server for later analysis.
+ * Computes the SHA-256 of a file as hex, or null when Web Crypto isn't available (e.g. plain http).
+ * @param {File} file File to hash.
+ * @returns {Promise<string|null>} Hex digest.
+ */
+const hashFile = async (file) => {
+    if (!window.crypto?.subtle) {
+        return null;
+    }
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+};
+
+/**
+ * Uploads a file to the backend server for later analysis. The file is sent as the request body,
+ * so the server can write it to disk as it arrives. If the server already has a file with the same
+ * content, it isn't sent again.
  * @param {File} file PDF or text file to upload to server for analysis.
- * @returns {Promise<string>} Filename of the uploaded file.
+ * @returns {Promise<Object>} {id, filename, size, sha256, reused}. Pass the id to the analysis functions
+ *  and keep the filename for showing and saving.
  */
 export const uploadFile = async (file) => {
-    const formData = new FormData();
-    formData.append('file', file);
+    const sha256 = await hashFile(file);
+    if (sha256) {
+        const existing = await fetch(`/api/uploads/${sha256}?filename=${encodeURIComponent(file.name)}`);
+        if (existing.ok) {
+            return existing.json();
+        }
+    }
     const response = await fetch('/api/upload_file', {
         method: 'POST',
-        body: formData
+        body: file,
+        headers: {
+            'Content-Type': 'application/octet-stream',
+            'X-Filename': encodeURIComponent(file.name)
+        }
     });
-    const filename = await response.text();
-    return filename;
+    const upload = await response.json();
+    if (!response.ok) {
+        throw new Error(upload.error);
+    }
+    return upload;
 };
 
 /**
  * Analyzes an already uploaded file using the provided blueprint.
- * @param {string} filename Filename of the uploaded file to analyze.
+ * @param {string} filename Upload id of the file to analyze, from uploadFile.
  * @param {Object} blueprint Blueprint to use for analysis, containing questions for LLM.
+ * @param {boolean} structured True to get a structured result, see analyzeText.
  * @returns {Promise<string>} Analysis result text with line breaks replaced by <br />.
  */
-export const analyzeUploadedFile = async (filename, blueprint, model) => {
+export const analyzeUploadedFile = async (filename, blueprint, model, structured = false) => {
 const response = await fetch('/api/analyze_file', {
         method: 'POST',
-        body: JSON.stringify({ filename, blueprint, model }),
+        body: JSON.stringify({ filename, blueprint, model, structured }),
         headers: {
             'Content-Type': 'application/json'
         }
@@ -36,16 +65,58 @@ const response = await fetch('/api/analyze_file', {
     return data;
 };
 
+/**
+ * Uploads and analyzes multiple files with one blueprint. Files are analyzed concurrently on the server
+ * and each result is passed to onResult as soon as that file is finished.
+ * @param {File[]} files PDF or text files to analyze.
+ * @param {Object} blueprint Blueprint to use for analysis, containing questions for LLM.
+ * @param {string} model Model to use for analysis.
+ * @param {function(Object): void} onResult Called with {filename, result, error} for each finished file.
+ * @returns {Promise<Array>} All {filename, result, error} objects in completion order.
+ */
+export const analyzeFiles = async (files, blueprint, model, onResult = () => {}) => {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+    formData.append('blueprint', JSON.stringify(blueprint));
+    formData.append('model', model);
+
+    const response = await fetch('/api/analyze_batch', {
+        method: 'POST',
+        body: formData
+    });
+
+    // Newline delimited JSON, one line per finished file
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const results = [];
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines.filter((line) => line.trim() !== '')) {
+            const fileResult = JSON.parse(line);
+            results.push(fileResult);
+            onResult(fileResult);
+        }
+        if (done) break;
+    }
+    return results;
+};
+
 /**
  * Analyzes raw text using the provided blueprint.
  * @param {string} text Raw text to be analyzed using LLM.
  * @param {Object} blueprint Blueprint to use for analysis, containing questions for LLM.
+ * @param {boolean} structured True to get an object with the analysis fields, answers ([{question, answer}])
+ *  and result (markdown text). Pass answers on to saveResult to save them separately.
  * @returns {Promise<string>} Analysis result text with line breaks replaced by <br />.
  */
-export const analyzeText = async (text, blueprint, model) => {
+export const analyzeText = async (text, blueprint, model, structured = false) => {
     const response = await fetch('/api/analyze_text', {
         method: 'POST',
-        body: JSON.stringify({ text, blueprint, model }),
+        body: JSON.stringify({ text, blueprint, model, structured }),
         headers: {
             'Content-Type': 'application/json'
         }
@@ -56,6 +127,91 @@ export const analyzeText = async (text, blueprint, model) => {
     return data;
 }
 
+/**
+ * Analyzes multiple raw texts using the provided blueprint. Short texts are analyzed together in shared requests.
+ * @param {string[]} texts Raw texts to be analyzed using LLM.
+ * @param {Object} blueprint Blueprint to use for analysis, containing questions for LLM.
+ * @param {string} model Model to use for analysis.
+ * @returns {Promise<Array>} Analysis result of each text in the same order.
+ */
+export const analyzeTexts = async (texts, blueprint, model) => {
+    const response = await fetch('/api/analyze_texts', {
+        method: 'POST',
+        body: JSON.stringify({ texts, blueprint, model }),
+        headers: {
+            'Content-Type': 'application/json'
+        }
+    });
+    return response.json();
+};
+
+/**
+ * Reads server-sent events from a streaming analysis endpoint.
+ * @param {string} url Streaming endpoint.
+ * @param {Object} body JSON body for the request.
+ * @param {function(string): void} onToken Called with each piece of the analysis as it arrives.
+ * @returns {Promise<string>} Whole analysis result.
+ */
+const streamAnalysis = async (url, body, onToken) => {
+    const response = await fetch(url, {
+        method: 'POST',
+        body: JSON.stringify(body),
+        headers: {
+            'Content-Type': 'application/json'
+        }
+    });
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        // Events are separated by an empty line
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const event of events) {
+            const lines = event.split('\n');
+            const type = lines.find((line) => line.startsWith('event: '))?.slice(7) || 'message';
+            const data = JSON.parse(lines.find((line) => line.startsWith('data: '))?.slice(6) || '{}');
+            if (type === 'error') {
+                throw new Error(data.error);
+            }
+            if (type === 'message') {
+                result += data.token;
+                onToken(data.token);
+            }
+        }
+        if (done) break;
+    }
+    return result;
+};
+
+/**
+ * Analyzes raw text like analyzeText, but passes the result to onToken piece by piece while it is generated.
+ * @param {string} text Raw text to be analyzed using LLM.
+ * @param {Object} blueprint Blueprint to use for analysis, containing questions for LLM.
+ * @param {string} model Model to use for analysis.
+ * @param {function(string): void} onToken Called with each piece of the analysis as it arrives.
+ * @returns {Promise<string>} Whole analysis result.
+ */
+export const analyzeTextStream = async (text, blueprint, model, onToken = () => {}) => {
+    return streamAnalysis('/api/analyze_text_stream', { text, blueprint, model }, onToken);
+};
+
+/**
+ * Analyzes an already uploaded file like analyzeUploadedFile, but passes the result to onToken piece by piece.
+ * @param {string} filename Upload id of the file to analyze, from uploadFile.
+ * @param {Object} blueprint Blueprint to use for analysis, containing questions for LLM.
+ * @param {string} model Model to use for analysis.
+ * @param {function(string): void} onToken Called with each piece of the analysis as it arrives.
+ * @returns {Promise<string>} Whole analysis result.
+ */
+export const analyzeUploadedFileStream = async (filename, blueprint, model, onToken = () => {}) => {
+    return streamAnalysis('/api/analyze_file_stream', { filename, blueprint, model }, onToken);
+};
+
 // Blueprints
 /**
  * Fetches all user-saved blueprints from the backend server.
@@ -158,6 +314,7 @@ export const deleteProject = async (id) => {
 /**
  * Saves an analysis result to the backend database.
  * @param {Object} result Result object with all properties except ID attached.
+ *  May contain answers ([{question, answer}]) of a structured result.
  * @returns {Promise<string>} ID of the saved result.
  */
 export const saveResult = async (result) => {
@@ -173,6 +330,22 @@ export const saveResult = async (result) => {
     return id;
 }
 
+/**
+ * Fetches saved answers of structured results, newest results first.
+ * @param {string} question Only answers to this question, all if null.
+ * @param {string} projectId Only answers under this project, all if null.
+ * @returns {Promise<Array>} Answers with projectId, resultId, resultName, filename, question and answer.
+ */
+export const getAnswers = async (question = null, projectId = null) => {
+    const params = new URLSearchParams();
+    if (question) params.append('question', question);
+    if (projectId) params.append('projectId', projectId);
+    const response = await fetch(`/api/get_answers?${params}`, {
+        method: 'GET'
+    });
+    return response.json();
+}
+
 /**
  * Deletes an analysis result from the backend database. Will NOT delete attached blueprint.
  * @param {string} id ID of the result to be deleted.